@@ -0,0 +1,115 @@
+"""
+Identifiers and addresses of switch VM ports.
+
+A VM port is known by its switch number and port number, and everything
+else about it is derived from that pair: tap and vm interface names,
+neutron interface and device ids, MAC address and IP address. Later
+commands compute them again instead of looking them up, names never
+collide and stay within the 15 character interface name limit, and IP
+addresses come from a CIDR pool holding a fixed block of addresses per
+switch.
+"""
+
+import socket
+import struct
+import uuid
+
+
+# largest switch and port numbers the interface name fields hold
+MAX_SWITCHES = 999999
+MAX_PORTS = 9999
+TAP_NAME = 'tap%06d-%04d'
+VM_NAME = 'vm%06d-%04d'
+# uuid5 namespace of neutron interface and device ids
+ID_NAMESPACE = uuid.UUID('d6c144c2-2d9d-4ef0-ba74-ceaf8df1ac17')
+DEFAULT_PORT_CIDR = '20.0.0.0/16'
+DEFAULT_PORTS_PER_SWITCH = 64
+# offset of the first pool address, neutron makes the first host of a
+# subnet without gateway_ip its gateway
+FIRST_PORT_OFFSET = 2
+
+
+class AllocationError(ValueError):
+    pass
+
+
+def parse_cidr(cidr):
+    # (network address as an integer, prefix length)
+    address, sep, prefixlen = cidr.partition('/')
+    try:
+        network = struct.unpack('!I', socket.inet_aton(address))[0]
+        prefixlen = int(prefixlen)
+    except (socket.error, ValueError):
+        raise AllocationError('invalid CIDR %s' % cidr)
+    if not sep or not 0 <= prefixlen <= 30:
+        raise AllocationError('invalid CIDR %s' % cidr)
+    mask = (0xffffffff << (32 - prefixlen)) & 0xffffffff
+    return network & mask, prefixlen
+
+
+def format_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def tap_name(sw_num, port_num):
+    return TAP_NAME % (sw_num, port_num)
+
+
+def vm_name(sw_num, port_num):
+    return VM_NAME % (sw_num, port_num)
+
+
+def iface_id(sw_num, port_num):
+    return str(uuid.uuid5(ID_NAMESPACE, 'iface/%d/%d' % (sw_num, port_num)))
+
+
+def device_id(sw_num, port_num):
+    return str(uuid.uuid5(ID_NAMESPACE, 'device/%d/%d' % (sw_num, port_num)))
+
+
+def mac_addr(sw_num, port_num):
+    # locally administered, so it never has to be read back from the container
+    return '02:%02x:%02x:%02x:%02x:%02x' % ((sw_num >> 16) & 0xff, (sw_num >> 8) & 0xff, sw_num & 0xff,
+                                            (port_num >> 8) & 0xff, port_num & 0xff)
+
+
+class PortAllocator(object):
+    def __init__(self, cidr=DEFAULT_PORT_CIDR, ports_per_switch=DEFAULT_PORTS_PER_SWITCH):
+        self.cidr = cidr
+        self.network, self.prefixlen = parse_cidr(cidr)
+        self.ports_per_switch = ports_per_switch
+        # the network, gateway and broadcast addresses are never handed out
+        self.size = (1 << (32 - self.prefixlen)) - FIRST_PORT_OFFSET - 1
+        self.max_switches = min(MAX_SWITCHES, self.size // ports_per_switch)
+
+    def check(self, switches, ports):
+        # AllocationError unless ports ports on each of switches switches all get addresses
+        if ports > self.ports_per_switch:
+            raise AllocationError('%d ports exceed the %d addresses reserved per switch' %
+                                  (ports, self.ports_per_switch))
+        if switches > self.max_switches:
+            raise AllocationError('%s holds addresses for %d switches with %d addresses per switch, not %d' %
+                                  (self.cidr, self.max_switches, self.ports_per_switch, switches))
+
+    def ip(self, sw_num, port_num):
+        if not 1 <= sw_num <= self.max_switches or not 1 <= port_num <= self.ports_per_switch:
+            raise AllocationError('no address in %s for port %d of switch %d' % (self.cidr, port_num, sw_num))
+        return format_ip(self.network + FIRST_PORT_OFFSET + (sw_num - 1) * self.ports_per_switch + port_num - 1)
+
+    def locate(self, ip):
+        # (switch number, port number) the address was allocated to, None outside the pool
+        try:
+            index = struct.unpack('!I', socket.inet_aton(ip))[0] - self.network - FIRST_PORT_OFFSET
+        except socket.error:
+            return None
+        if not 0 <= index < self.max_switches * self.ports_per_switch:
+            return None
+        return index // self.ports_per_switch + 1, index % self.ports_per_switch + 1
+
+    def port(self, sw_num, port_num):
+        return {'tap': tap_name(sw_num, port_num),
+                'vm': vm_name(sw_num, port_num),
+                'ip': self.ip(sw_num, port_num),
+                'mac': mac_addr(sw_num, port_num),
+                'iface_id': iface_id(sw_num, port_num),
+                'device_id': device_id(sw_num, port_num)}
@@ -0,0 +1,434 @@
+"""
+Stand-in docker engine API served on a UNIX socket for benchmarks.
+
+Containers are plain dicts; execs of ovs-vsctl, ovs-ofctl, ovs-appctl,
+ip and the ping probe script are answered by output generators after a
+configurable latency, so dockernet's own overhead can be measured without
+a docker host. Every API request and exec is counted.
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import os
+import posixpath
+import re
+import struct
+import tarfile
+import threading
+import time
+
+try:
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+
+
+IMAGE_ID = 'sha256:0d0c4e7dockernetbench'
+API_PATH_RE = re.compile(r'^/v[\d.]+(/.*)$')
+
+
+def flow_lines(count):
+    return ''.join([' cookie=0x8000000, duration=12.5s, table=%d, n_packets=%d, n_bytes=%d, '
+                    'priority=%d,in_port=%d actions=goto_table:%d\n' % (i % 8, i, i * 64, 100 + i, i, i % 8 + 1)
+                    for i in range(count)])
+
+
+class FakeDocker(object):
+    def __init__(self, exec_latency=0.005, api_latency=0.0, flows=20, monitor_interval=0.5):
+        self.exec_latency = exec_latency
+        self.api_latency = api_latency
+        self.flows = flows
+        self.monitor_interval = monitor_interval
+        self.containers = {}
+        self.execs = {}
+        self.counters = {'requests': 0, 'execs': 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {'requests': 0, 'execs': 0}
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def new_id(self, prefix):
+        with self._lock:
+            return '%s%012d' % (prefix, next(self._ids))
+
+    def switch_nodes(self):
+        # (switch number, flow count) of every switch bridge, as the controller inventory sees them
+        nodes = []
+        with self._lock:
+            for name, cont in self.containers.items():
+                for bridge in cont['bridges']:
+                    switch = name if bridge == 'br-int' else bridge
+                    if switch.startswith('ovs') and switch[3:].isdigit():
+                        nodes.append((int(switch[3:]), self.flows))
+        return sorted(nodes)
+
+    # container lifecycle
+
+    def create(self, name):
+        with self._lock:
+            if name in self.containers:
+                return None
+            cont = {'Id': hashlib.sha256(name.encode('utf-8') + str(time.time()).encode('utf-8')).hexdigest(),
+                    'name': name,
+                    'links': {},
+                    'bridges': ['br-int'],
+                    'ports': set(),
+                    'files': {},
+                    'started_at': time.strftime('%Y-%m-%dT%H:%M:%S.000000000Z', time.gmtime()),
+                    'pid': 1000 + len(self.containers),
+                    'ip': '172.17.%d.%d' % (len(self.containers) // 250, len(self.containers) % 250 + 2)}
+            self.containers[name] = cont
+            return cont
+
+    def find(self, ref):
+        with self._lock:
+            if ref in self.containers:
+                return self.containers[ref]
+            for cont in self.containers.values():
+                if cont['Id'].startswith(ref):
+                    return cont
+            return None
+
+    def rename(self, ref, name):
+        # False when there is no such container or the name is taken
+        cont = self.find(ref)
+        with self._lock:
+            if cont is None or name in self.containers:
+                return False
+            self.containers[name] = self.containers.pop(cont['name'])
+            cont['name'] = name
+        return True
+
+    def remove(self, ref):
+        cont = self.find(ref)
+        if cont is None:
+            return False
+        with self._lock:
+            self.containers.pop(cont['name'], None)
+        return True
+
+    # exec output generators
+
+    def run(self, cont, cmd):
+        self.count('execs')
+        if self.exec_latency:
+            time.sleep(self.exec_latency)
+        if cmd[:2] == ['sh', '-c']:
+            return self.run_script(cont, cmd[2])
+        return self.run_cmd(cont, cmd)
+
+    def is_monitor(self, cmd):
+        return cmd[:2] == ['sh', '-c'] and 'ovs-ofctl' in cmd[2] and ' monitor ' in cmd[2]
+
+    def monitor_events(self):
+        # initial flow table, then a flow change every monitor_interval seconds, as
+        # "ovs-ofctl monitor <bridge> watch:" prints them
+        self.count('execs')
+        yield 'NXST_FLOW_MONITOR reply (OF1.3) (xid=0x2):\n' + ''.join(
+            [' event=ADDED table=%d cookie=0x8000000 priority=%d,in_port=%d actions=goto_table:%d\n' %
+             (i % 8, 100 + i, i, i % 8 + 1) for i in range(self.flows)])
+        for n in itertools.count():
+            time.sleep(self.monitor_interval)
+            if n % 3 == 0:
+                update = 'event=ADDED table=0 cookie=0x0 priority=1000,in_port=%d actions=drop' % n
+            elif n % 3 == 1 and self.flows:
+                i = n % self.flows
+                update = 'event=MODIFIED table=%d cookie=0x8000000 priority=%d,in_port=%d actions=drop' % (
+                    i % 8, 100 + i, i)
+            else:
+                update = 'event=DELETED reason=delete table=0 cookie=0x0 priority=1000,in_port=%d actions=drop' % (
+                    n - n % 3)
+            yield 'NXST_FLOW_MONITOR reply (OF1.3) (xid=0x0):\n %s\n' % update
+
+    def run_script(self, cont, script):
+        if 'md5sum' in script:
+            # flow fingerprint pipeline
+            return 0, hashlib.md5(flow_lines(self.flows).encode('utf-8')).hexdigest() + '\n'
+        if 'srcs=' in script:
+            return 0, self.run_probe(cont, script)
+        if 'command -v $t' in script:
+            # transfer tool detection
+            return 0, 'iperf3\n'
+        if '@@ PAIR ' in script:
+            return 0, self.run_transfers(script)
+        if 'iperf3 -s ' in script or '@@ PORT ' in script:
+            # receivers started or stopped
+            return 0, ''
+        if script.startswith('ip -force -batch'):
+            return 0, self.run_ip_batch(cont, script.split('\n')[1:-1])
+        rc = 0
+        output = ''
+        for line in script.split('\n'):
+            line = line.strip()
+            if line.startswith('echo "'):
+                output += line[len('echo "'):-1] + '\n'
+            elif line:
+                for part in line.replace(' 2>&1', '').split(' && '):
+                    cmd_rc, cmd_output = self.run_cmd(cont, part.split())
+                    rc = rc or cmd_rc
+                    output += cmd_output
+        return rc, output
+
+    def run_probe(self, cont, script):
+        srcs = re.search(r"srcs='([^']*)'", script).group(1).split()
+        dsts = cont['files'].pop(re.search(r"dsts='([^']*)'", script).group(1), '').split()
+        count = int(re.search(r'-C (\d+)', script).group(1))
+        samples = ' '.join(['0.05'] * count)
+        output = []
+        for src in srcs:
+            output.append('@@ FPING %s\n' % src)
+            output.extend(['%s : %s\n' % (dst, samples) for dst in dsts])
+        return ''.join(output)
+
+    def run_transfers(self, script):
+        # iperf3 -J reports of 10 Gbps transfers, UDP ones losing one packet in a thousand
+        output = []
+        for line in script.split('\n'):
+            match = re.search(r'@@ PAIR (\S+) (\S+) (\d+)"; iperf3 .* -t (\d+)', line)
+            if match is None:
+                continue
+            seconds = float(match.group(4))
+            total = int(1.25e9 * seconds)
+            if ' -u ' in line:
+                packets = total // 1470
+                end = {'sum': {'bytes': total, 'seconds': seconds, 'packets': packets,
+                               'lost_packets': packets // 1000}}
+            else:
+                end = {'sum_sent': {'bytes': total, 'seconds': seconds, 'retransmits': 0},
+                       'sum_received': {'bytes': total, 'seconds': seconds}}
+            output.append('@@ PAIR %s %s %s\n%s\n' % (match.group(1), match.group(2), match.group(3),
+                                                       json.dumps({'start': {}, 'end': end})))
+        return ''.join(output)
+
+    def run_ip_batch(self, cont, lines):
+        with self._lock:
+            for line in lines:
+                words = line.split()
+                if words[:2] == ['link', 'add']:
+                    # link add <vm> address <mac> type veth peer name <tap>
+                    cont['links'][words[2]] = {'mac': words[4], 'ip': None}
+                    cont['links'][words[9]] = {'mac': '02:ff' + words[4][5:], 'ip': None}
+                elif words[:2] == ['addr', 'add'] and words[4] in cont['links']:
+                    cont['links'][words[4]]['ip'] = words[2].split('/')[0]
+                elif words[:2] == ['link', 'delete']:
+                    cont['links'].pop(words[2], None)
+        return ''
+
+    def run_cmd(self, cont, cmd):
+        if not cmd:
+            return 0, ''
+        prog = cmd[0]
+        if prog == 'ovs-appctl':
+            return 0, 'ovs-vswitchd (Open vSwitch) 2.5.0\n'
+        if prog == 'ovs-vsctl':
+            return self.run_vsctl(cont, cmd[1:])
+        if prog == 'ovs-ofctl':
+            action = cmd[1]
+            if action == 'dump-flows':
+                return 0, 'OFPST_FLOW reply (OF1.3) (xid=0x2):\n' + flow_lines(self.flows)
+            if action == 'dump-groups':
+                return 0, ('OFPST_GROUP_DESC reply (OF1.3) (xid=0x2):\n'
+                           ' group_id=1,type=all,bucket=actions=output:1,bucket=actions=output:2\n')
+            if action == 'dump-ports':
+                return 0, 'OFPST_PORT reply (OF1.3) (xid=0x2): %d ports\n' % len(cont['ports'])
+            return 0, 'OFPST_TABLE reply (OF1.3) (xid=0x2):\n'
+        if prog == 'ip':
+            with self._lock:
+                links = sorted(cont['links'].items())
+            if cmd[1:3] == ['-o', 'link']:
+                return 0, ''.join(['%d: %s@if%d: <UP> mtu 1500\\    link/ether %s brd ff:ff:ff:ff:ff:ff\n' %
+                                   (i + 2, name, i + 2, link['mac']) for i, (name, link) in enumerate(links)])
+            return 0, '1: lo: <LOOPBACK,UP>\n    inet 127.0.0.1/8 scope host lo\n' + ''.join(
+                ['%d: %s@if%d: <UP>\n    inet %s/16 scope global %s\n' % (i + 2, name, i + 2, link['ip'], name)
+                 for i, (name, link) in enumerate(links) if link['ip']])
+        return 127, 'sh: %s: not found\n' % prog
+
+    def run_vsctl(self, cont, args):
+        if args[:1] == ['show']:
+            output = ['%s\n    Manager "tcp:127.0.0.1:6640"\n        is_connected: true\n' % cont['Id'][:36]]
+            for bridge in cont['bridges']:
+                output.append('    Bridge %s\n        Controller "tcp:127.0.0.1:6653"\n'
+                              '            is_connected: true\n' % bridge)
+            return 0, ''.join(output)
+        if args[:1] == ['list-br']:
+            return 0, ''.join([bridge + '\n' for bridge in cont['bridges']])
+        if args[:2] == ['get', 'Bridge'] and args[3:] == ['datapath-id']:
+            # derived from the switch number of the bridge, or of its container for br-int
+            name = cont['name'] if args[2] == 'br-int' else args[2]
+            return 0, '"%016x"\n' % int('0' + ''.join([char for char in name if char.isdigit()]))
+        # a "--" separated transaction of add/del port and bridge commands
+        with self._lock:
+            for i, arg in enumerate(args):
+                if arg == 'add-port':
+                    cont['ports'].add(args[i + 2])
+                elif arg == 'del-port':
+                    cont['ports'].discard(args[i + 2])
+                elif arg == 'add-br' and args[i + 1] not in cont['bridges']:
+                    cont['bridges'].append(args[i + 1])
+                elif arg == 'del-br' and args[i + 1] in cont['bridges']:
+                    cont['bridges'].remove(args[i + 1])
+        return 0, ''
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return 'fakedocker'
+
+    def send_json(self, status, obj=None):
+        body = b'' if obj is None else json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        return json.loads(data.decode('utf-8')) if data else None
+
+    def route(self):
+        fake = self.server.fake
+        fake.count('requests')
+        if fake.api_latency:
+            time.sleep(fake.api_latency)
+        url = urlparse(self.path)
+        match = API_PATH_RE.match(url.path)
+        return fake, (match.group(1) if match else url.path), parse_qs(url.query)
+
+    def do_GET(self):
+        fake, path, query = self.route()
+        if path == '/version':
+            return self.send_json(200, {'Version': '24.0.7', 'ApiVersion': '1.43', 'MinAPIVersion': '1.12'})
+        if path == '/images/json':
+            return self.send_json(200, [{'Id': IMAGE_ID, 'RepoTags': ['dockernet:latest']}])
+        if path == '/containers/json':
+            filters = json.loads(query.get('filters', ['{}'])[0])
+            name = filters.get('name', [''])[0]
+            with fake._lock:
+                containers = [{'Id': cont['Id'], 'Names': ['/' + cont['name']], 'Image': IMAGE_ID,
+                               'State': 'running', 'Status': 'Up',
+                               'NetworkSettings': {'Networks': {'bridge': {'IPAddress': cont['ip']}}}}
+                              for cont in fake.containers.values() if name in cont['name']]
+            return self.send_json(200, containers)
+        match = re.match(r'^/containers/([^/]+)/json$', path)
+        if match:
+            cont = fake.find(match.group(1))
+            if cont is None:
+                return self.send_json(404, {'message': 'No such container: %s' % match.group(1)})
+            return self.send_json(200, {'Id': cont['Id'], 'Name': '/' + cont['name'],
+                                        'State': {'Status': 'running', 'Running': True, 'Pid': cont['pid'],
+                                                  'StartedAt': cont['started_at']},
+                                        'RestartCount': 0,
+                                        'HostConfig': {'Memory': 0},
+                                        'Config': {'Image': IMAGE_ID},
+                                        'NetworkSettings': {'IPAddress': cont['ip']}})
+        match = re.match(r'^/exec/([^/]+)/json$', path)
+        if match and match.group(1) in fake.execs:
+            return self.send_json(200, {'ExitCode': fake.execs.pop(match.group(1))['ExitCode']})
+        self.send_json(404, {'message': 'page not found'})
+
+    def do_POST(self):
+        fake, path, query = self.route()
+        body = self.read_body()
+        if path == '/containers/create':
+            cont = fake.create(query['name'][0])
+            if cont is None:
+                return self.send_json(409, {'message': 'Conflict. The container name is already in use'})
+            return self.send_json(201, {'Id': cont['Id'], 'Warnings': None})
+        match = re.match(r'^/containers/([^/]+)/rename$', path)
+        if match:
+            if not fake.rename(match.group(1), query['name'][0]):
+                return self.send_json(409, {'message': 'Cannot rename container %s' % match.group(1)})
+            return self.send_json(204)
+        match = re.match(r'^/containers/([^/]+)/(start|stop|exec)$', path)
+        if match:
+            cont = fake.find(match.group(1))
+            if cont is None:
+                return self.send_json(404, {'message': 'No such container: %s' % match.group(1)})
+            if match.group(2) != 'exec':
+                return self.send_json(204)
+            exec_id = fake.new_id('exec')
+            fake.execs[exec_id] = {'container': cont, 'Cmd': body['Cmd'], 'ExitCode': None}
+            return self.send_json(201, {'Id': exec_id})
+        match = re.match(r'^/exec/([^/]+)/start$', path)
+        if match and match.group(1) in fake.execs and fake.is_monitor(fake.execs[match.group(1)]['Cmd']):
+            # streamed until the client closes the connection
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+            self.end_headers()
+            self.close_connection = True
+            for output in fake.monitor_events():
+                data = output.encode('utf-8')
+                try:
+                    self.wfile.write(struct.pack('>BxxxI', 1, len(data)) + data)
+                    self.wfile.flush()
+                except (IOError, OSError) as e:
+                    return
+            return
+        if match and match.group(1) in fake.execs:
+            exec_info = fake.execs[match.group(1)]
+            rc, output = fake.run(exec_info['container'], exec_info['Cmd'])
+            exec_info['ExitCode'] = rc
+            data = output.encode('utf-8')
+            # raw multiplexed stdout stream, the connection is not reused
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+            self.end_headers()
+            self.wfile.write(struct.pack('>BxxxI', 1, len(data)) + data)
+            self.close_connection = True
+            return
+        self.send_json(404, {'message': 'page not found'})
+
+    def do_PUT(self):
+        fake, path, query = self.route()
+        match = re.match(r'^/containers/([^/]+)/archive$', path)
+        cont = fake.find(match.group(1)) if match else None
+        if cont is None:
+            return self.send_json(404, {'message': 'No such container'})
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        tar = tarfile.open(fileobj=io.BytesIO(data))
+        for member in tar.getmembers():
+            content = tar.extractfile(member).read().decode('utf-8')
+            with fake._lock:
+                cont['files'][posixpath.join(query['path'][0], member.name)] = content
+        self.send_json(200)
+
+    def do_DELETE(self):
+        fake, path, query = self.route()
+        match = re.match(r'^/containers/([^/]+)$', path)
+        if match and fake.remove(match.group(1)):
+            return self.send_json(204)
+        self.send_json(404, {'message': 'No such container'})
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, fake):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, FakeDockerHandler)
+        self.fake = fake
+
+    def get_request(self):
+        # unix sockets have no peer address, BaseHTTPRequestHandler expects one
+        request, client_address = socketserver.UnixStreamServer.get_request(self)
+        return request, ('fakedocker', 0)
@@ -0,0 +1,96 @@
+"""
+Stand-in for the controller neutron northbound REST API used by benchmarks.
+
+Accepts the network, subnet and port create requests and the neutron data
+delete dockernet sends, and counts requests and created ports. The config
+and operational flow inventory list every switch of the fake docker
+engine with the flows it reports.
+"""
+
+import json
+import threading
+
+try:
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+INVENTORY_PATH_SUFFIX = '/opendaylight-inventory:nodes'
+
+
+def flow_tables(count):
+    # tables and flow ids matching fakedocker.flow_lines
+    tables = {}
+    for i in range(count):
+        tables.setdefault(i % 8, []).append({'id': 'flow-%d' % i, 'table_id': i % 8, 'priority': 100 + i,
+                                             'match': {'in-port': str(i)}})
+    return [{'id': table_id, 'flow': table_flows} for table_id, table_flows in sorted(tables.items())]
+
+
+class FakeOdl(object):
+    def __init__(self, docker=None):
+        self._lock = threading.Lock()
+        # fake docker engine whose switches make up the flow inventory
+        self.docker = docker
+        self.reset_counters()
+
+    def inventory(self):
+        nodes = [{'id': 'openflow:%d' % num, 'flow-node-inventory:table': flow_tables(flows)}
+                 for num, flows in self.docker.switch_nodes()]
+        return {'nodes': {'node': nodes}}
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = {'requests': 0, 'ports': 0}
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.counters[key] += value
+
+
+class FakeOdlHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        fake.count('requests')
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+        if self.path.endswith('/neutron/ports'):
+            fake.count('ports', len(body.get('ports', [body.get('port')])))
+        self.reply(201, body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        fake.count('requests')
+        if not self.path.endswith(INVENTORY_PATH_SUFFIX) or fake.docker is None:
+            self.reply(404, {'errors': {'error': [{'error-tag': 'data-missing'}]}})
+            return
+        self.reply(200, fake.inventory())
+
+    def do_DELETE(self):
+        self.server.fake.count('requests')
+        self.reply(200, {})
+
+
+class FakeOdlServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, fake):
+        HTTPServer.__init__(self, address, FakeOdlHandler)
+        self.fake = fake
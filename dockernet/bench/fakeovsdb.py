@@ -0,0 +1,378 @@
+"""
+Stand-in ovsdb-server speaking the OVSDB management protocol (RFC 7047).
+
+Serves one in-memory Open_vSwitch database with the tables and columns
+dockernet touches on a UNIX socket: list_dbs, echo, monitor and transact
+with insert, update, mutate, select and delete operations. A transaction
+is applied to a copy of the database and dropped when one of its
+operations fails. After each commit the fake ovs-vswitchd catches up,
+cur_cfg follows next_cfg, and monitors get the changed rows as update
+notifications. Like ovsdb-server's inactivity probe, every monitor
+request is answered after an echo request to the client.
+
+check_client() runs the OvsdbClient through a transact, echo and error
+round trip against it.
+"""
+
+import copy
+import itertools
+import json
+import os
+import socket
+import threading
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+from dockernet import ovsdb
+
+
+DB_NAME = ovsdb.DB_NAME
+# table -> column -> kind, 'set' and 'map' columns are sent in their wire form
+SCHEMA = {'Open_vSwitch': {'bridges': 'set', 'cur_cfg': 'int', 'next_cfg': 'int',
+                           'manager_options': 'set', 'other_config': 'map'},
+          'Bridge': {'name': 'str', 'ports': 'set', 'controller': 'set'},
+          'Port': {'name': 'str', 'interfaces': 'set'},
+          'Interface': {'name': 'str', 'ofport': 'int', 'external_ids': 'map'}}
+DEFAULTS = {'set': ['set', []], 'map': ['map', []], 'int': 0, 'str': ''}
+
+
+class OpError(Exception):
+    def __init__(self, error, details=''):
+        Exception.__init__(self, error)
+        self.error = error
+        self.details = details
+
+
+def set_items(value):
+    # a set column value as a list of atoms, a single atom is a set of one
+    if isinstance(value, list) and value and value[0] == 'set':
+        return list(value[1])
+    return [value]
+
+
+def map_items(value):
+    return [list(pair) for pair in value[1]]
+
+
+class FakeOvsdb(object):
+    def __init__(self, bridge='br-int'):
+        self.tables = dict((table, {}) for table in SCHEMA)
+        self.counters = {'requests': 0, 'transactions': 0, 'echo_replies': 0}
+        self._uuids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._monitors = []
+        iface = self._new_row('Interface', {'name': bridge, 'ofport': 65534})
+        port = self._new_row('Port', {'name': bridge, 'interfaces': ['set', [['uuid', iface]]]})
+        br = self._new_row('Bridge', {'name': bridge, 'ports': ['set', [['uuid', port]]]})
+        self._new_row('Open_vSwitch', {'bridges': ['set', [['uuid', br]]]})
+
+    def _new_uuid(self):
+        return '00000000-0000-4000-8000-%012d' % next(self._uuids)
+
+    def _new_row(self, table, row, tables=None):
+        uuid = self._new_uuid()
+        full = dict((column, copy.deepcopy(DEFAULTS[kind])) for column, kind in SCHEMA[table].items())
+        full.update(row)
+        (self.tables if tables is None else tables)[table][uuid] = full
+        return uuid
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def add_monitor(self, send, monitor_id, requests):
+        # initial rows of the monitored columns, later changes go to send
+        with self._lock:
+            columns = {}
+            for table, request in requests.items():
+                if table not in SCHEMA:
+                    raise OpError('unknown table', table)
+                columns[table] = request.get('columns') or list(SCHEMA[table])
+            self._monitors.append((send, monitor_id, columns))
+            return self._updates(columns, {}, self.tables)
+
+    def remove_monitors(self, send):
+        with self._lock:
+            self._monitors = [monitor for monitor in self._monitors if monitor[0] != send]
+
+    def _updates(self, columns, old_tables, new_tables):
+        updates = {}
+        for table, table_columns in columns.items():
+            old_rows = old_tables.get(table, {})
+            new_rows = new_tables.get(table, {})
+            for uuid in set(old_rows) | set(new_rows):
+                old = old_rows.get(uuid)
+                new = new_rows.get(uuid)
+                if old == new:
+                    continue
+                update = {}
+                if old is not None:
+                    update['old'] = dict((column, old[column]) for column in table_columns)
+                if new is not None:
+                    update['new'] = dict((column, new[column]) for column in table_columns)
+                updates.setdefault(table, {})[uuid] = update
+        return updates
+
+    def transact(self, ops):
+        with self._lock:
+            self.counters['transactions'] += 1
+            tables = copy.deepcopy(self.tables)
+            names = {}
+            results = []
+            for op in ops:
+                try:
+                    results.append(self._op(tables, names, op))
+                except OpError as e:
+                    # nothing of a failed transaction is committed
+                    results.append({'error': e.error, 'details': e.details})
+                    return results
+            self._collect_garbage(tables)
+            # ovs-vswitchd applies the new configuration at once
+            for row in tables['Open_vSwitch'].values():
+                row['cur_cfg'] = row['next_cfg']
+            old_tables = self.tables
+            self.tables = tables
+            for send, monitor_id, columns in self._monitors:
+                updates = self._updates(columns, old_tables, tables)
+                if updates:
+                    send({'method': 'update', 'params': [monitor_id, updates], 'id': None})
+            return results
+
+    def _resolve(self, value, names):
+        # named-uuid references of this transaction to uuids
+        if isinstance(value, list):
+            if len(value) == 2 and value[0] == 'named-uuid':
+                if value[1] not in names:
+                    raise OpError('referential integrity violation', 'unknown named-uuid %s' % value[1])
+                return ['uuid', names[value[1]]]
+            return [self._resolve(item, names) for item in value]
+        return value
+
+    def _matches(self, uuid, row, where):
+        for column, function, value in where:
+            actual = ['uuid', uuid] if column == '_uuid' else row.get(column)
+            if function == '==' and actual != value:
+                return False
+            if function == '!=' and actual == value:
+                return False
+            if function not in ('==', '!='):
+                raise OpError('syntax error', 'unsupported function %s' % function)
+        return True
+
+    def _rows(self, tables, op):
+        table = op.get('table')
+        if table not in SCHEMA:
+            raise OpError('unknown table', str(table))
+        where = self._resolve(op.get('where', []), {})
+        return table, [(uuid, row) for uuid, row in tables[table].items() if self._matches(uuid, row, where)]
+
+    def _check_columns(self, table, row):
+        for column in row:
+            if column not in SCHEMA[table]:
+                raise OpError('unknown column', '%s has no column %s' % (table, column))
+
+    def _op(self, tables, names, op):
+        kind = op.get('op')
+        if kind == 'insert':
+            table = op.get('table')
+            if table not in SCHEMA:
+                raise OpError('unknown table', str(table))
+            row = self._resolve(op.get('row', {}), names)
+            self._check_columns(table, row)
+            uuid = self._new_row(table, row, tables)
+            if op.get('uuid-name'):
+                names[op['uuid-name']] = uuid
+            return {'uuid': ['uuid', uuid]}
+        if kind == 'select':
+            table, rows = self._rows(tables, op)
+            columns = op.get('columns') or list(SCHEMA[table])
+            return {'rows': [dict((column, row[column]) for column in columns) for uuid, row in rows]}
+        if kind == 'update':
+            table, rows = self._rows(tables, op)
+            row_update = self._resolve(op.get('row', {}), names)
+            self._check_columns(table, row_update)
+            for uuid, row in rows:
+                row.update(copy.deepcopy(row_update))
+            return {'count': len(rows)}
+        if kind == 'mutate':
+            table, rows = self._rows(tables, op)
+            mutations = self._resolve(op.get('mutations', []), names)
+            for uuid, row in rows:
+                for column, mutator, value in mutations:
+                    self._mutate(table, row, column, mutator, value)
+            return {'count': len(rows)}
+        if kind == 'delete':
+            table, rows = self._rows(tables, op)
+            for uuid, row in rows:
+                del tables[table][uuid]
+            return {'count': len(rows)}
+        raise OpError('syntax error', 'unknown operation %s' % kind)
+
+    def _mutate(self, table, row, column, mutator, value):
+        kind = SCHEMA[table].get(column)
+        if kind is None:
+            raise OpError('unknown column', '%s has no column %s' % (table, column))
+        if kind == 'int' and mutator in ('+=', '-='):
+            row[column] += value if mutator == '+=' else -value
+        elif kind == 'set' and mutator in ('insert', 'delete'):
+            items = set_items(row[column])
+            changes = set_items(value)
+            if mutator == 'insert':
+                items += [item for item in changes if item not in items]
+            else:
+                items = [item for item in items if item not in changes]
+            row[column] = ['set', items]
+        elif kind == 'map' and mutator in ('insert', 'delete'):
+            items = map_items(row[column])
+            if mutator == 'insert':
+                keys = [key for key, item_value in items]
+                items += [pair for pair in map_items(value) if pair[0] not in keys]
+            else:
+                # a set of keys, or a map of key value pairs
+                if isinstance(value, list) and value and value[0] == 'map':
+                    items = [pair for pair in items if pair not in map_items(value)]
+                else:
+                    keys = set_items(value)
+                    items = [pair for pair in items if pair[0] not in keys]
+            row[column] = ['map', items]
+        else:
+            raise OpError('constraint violation', 'can not apply %s to %s column %s' % (mutator, kind, column))
+
+    def _collect_garbage(self, tables):
+        # Bridge, Port and Interface rows are only kept while referenced, as in the real schema
+        for table, parent, column in (('Bridge', 'Open_vSwitch', 'bridges'), ('Port', 'Bridge', 'ports'),
+                                      ('Interface', 'Port', 'interfaces')):
+            referenced = set([item[1] for row in tables[parent].values() for item in set_items(row[column])])
+            for uuid in list(tables[table]):
+                if uuid not in referenced:
+                    del tables[table][uuid]
+
+
+class FakeOvsdbHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.fake = self.server.fake
+        self.send_lock = threading.Lock()
+        self.echo_ids = itertools.count(1)
+
+    def send(self, msg):
+        with self.send_lock:
+            try:
+                self.request.sendall(json.dumps(msg).encode('utf-8'))
+            except socket.error as e:
+                pass
+
+    def handle(self):
+        stream = ovsdb.JsonStream()
+        try:
+            while True:
+                try:
+                    data = self.request.recv(ovsdb.READ_SIZE)
+                except socket.error as e:
+                    return
+                if not data:
+                    return
+                for msg in stream.feed(data):
+                    self.dispatch(msg)
+        finally:
+            self.fake.remove_monitors(self.send)
+
+    def dispatch(self, msg):
+        method = msg.get('method')
+        if method is None:
+            # reply to an echo request of ours
+            if str(msg.get('id', '')).startswith('echo'):
+                self.fake.count('echo_replies')
+            return
+        self.fake.count('requests')
+        params = msg.get('params') or []
+        result = None
+        error = None
+        if method == 'echo':
+            result = params
+        elif method == 'list_dbs':
+            result = [DB_NAME]
+        elif method in ('monitor', 'transact') and (not params or params[0] != DB_NAME):
+            error = 'unknown database'
+        elif method == 'monitor':
+            # inactivity probe, the client has to answer it while it waits for the reply
+            self.send({'method': 'echo', 'params': [], 'id': 'echo%d' % next(self.echo_ids)})
+            try:
+                result = self.fake.add_monitor(self.send, params[1], params[2])
+            except OpError as e:
+                error = e.error
+        elif method == 'transact':
+            result = self.fake.transact(params[1:])
+        else:
+            error = 'unknown method'
+        self.send({'id': msg.get('id'), 'result': result, 'error': error})
+
+
+class FakeOvsdbServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, fake):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, FakeOvsdbHandler)
+        self.fake = fake
+
+
+def check_client(socket_path):
+    # OvsdbClient round trip against a fresh fake, returns a list of failures
+    fake = FakeOvsdb()
+    server = FakeOvsdbServer(socket_path, fake)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    failures = []
+    client = ovsdb.OvsdbClient('unix:' + socket_path, timeout=5)
+    try:
+        client.connect()
+        if client.call('echo', ['ping']) != ['ping']:
+            failures.append('echo did not return its params')
+        client.monitor()
+        if client.find('Bridge', 'br-int') is None:
+            failures.append('monitor did not report br-int')
+
+        client.commit(ovsdb.add_ports_ops(client, 'br-int', [('tap1', {'iface-id': 'port-1'}),
+                                                             ('tap2', {'iface-id': 'port-2'})]))
+        if client.find('Port', 'tap1') is None or client.find('Port', 'tap2') is None:
+            failures.append('added ports missing from the monitor updates')
+        if fake.counters['echo_replies'] != 1:
+            failures.append('echo request of the server was not answered')
+        client.commit(ovsdb.del_ports_ops(client, 'br-int', ['tap1']))
+        if client.find('Port', 'tap1') is not None or client.find('Interface', 'tap1') is not None:
+            failures.append('deleted port still in the monitor updates')
+
+        # a failing operation aborts the whole transaction
+        try:
+            client.transact([{'op': 'insert', 'table': 'Port', 'row': {'name': 'tap3'}},
+                             {'op': 'insert', 'table': 'NoSuchTable', 'row': {}}])
+            failures.append('transaction on an unknown table did not fail')
+        except ovsdb.OvsdbError as e:
+            if 'unknown table' not in str(e):
+                failures.append('unexpected transaction error: %s' % e)
+        if [row for row in fake.tables['Port'].values() if row['name'] == 'tap3']:
+            failures.append('failed transaction was committed')
+        try:
+            client.call('no_such_method', [])
+            failures.append('unknown method did not fail')
+        except ovsdb.OvsdbError as e:
+            pass
+        try:
+            ovsdb.add_ports_ops(client, 'br-missing', [('tap4', {})])
+            failures.append('port on a missing bridge did not fail')
+        except ovsdb.OvsdbError as e:
+            pass
+    except ovsdb.OvsdbError as e:
+        failures.append(str(e))
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    return failures
@@ -0,0 +1,284 @@
+"""
+Benchmark dockernet's own overhead against local stand-ins.
+
+A fake docker engine (UNIX socket) and a fake neutron REST server run in
+this process while the real dockernet commands run against them, each in
+its own python process, at every requested switch count. For every
+command the wall time, container execs, docker API requests, local
+process spawns, REST requests and peak memory are reported and appended
+to a results file so runs of different versions can be compared. The
+OVSDB client is first run through a transact, echo and error round trip
+against a fake ovsdb-server.
+
+Note the benchmark uses /tmp/network.json, /tmp/subnetwork.json and
+/tmp/docker_ping_ips.txt like dockernet itself, do not run it next to a
+real testbed.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from oslo_config import cfg
+
+from dockernet.bench.fakedocker import FakeDocker, FakeDockerServer
+from dockernet.bench.fakeodl import FakeOdl, FakeOdlServer
+from dockernet.bench.fakeovsdb import check_client
+
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(PACKAGE_ROOT, 'dockernet', 'data')
+ODL_REST_PORT = 8181
+NEUTRON_FILES = ('network.json', 'subnetwork.json')
+
+# name, dockernet arguments for switch count n, ports per switch p and controller ip
+BENCH_COMMANDS = [
+    ('start-switches', lambda n, p, ip: ['--start-switches', str(n), '--controller-ip', ip]),
+    ('add-ports', lambda n, p, ip: ['--add-ports', str(p)]),
+    ('bind-ports', lambda n, p, ip: ['--bind-ports', str(p), '--controller-ip', ip]),
+    ('dump', lambda n, p, ip: ['--dump', 'all', '--range', '1,%d' % n]),
+    ('verify-flows', lambda n, p, ip: ['--verify-flows', '--range', '1,%d' % n, '--controller-ip', ip]),
+    ('create-ping-ips-file', lambda n, p, ip: ['--create-ping-ips-file', '--range', '1,%d' % n]),
+    ('ping-all', lambda n, p, ip: ['--ping-all', '--range', '1,%d' % n]),
+    ('throughput', lambda n, p, ip: ['--throughput', '--range', '1,%d' % n, '--throughput-duration', '1']),
+    ('cleanup', lambda n, p, ip: ['--cleanup', '--controller-ip', ip]),
+]
+BENCH_COMMAND_NAMES = [name for name, args in BENCH_COMMANDS]
+
+CHILD_SCRIPT = 'import sys; from dockernet.bench.run import run_child; run_child(sys.argv[1], sys.argv[2:])'
+
+BENCH_OPTS = [
+    cfg.ListOpt('switches',
+                default=['10', '100', '1000'],
+                help='Switch counts to benchmark'),
+    cfg.IntOpt('ports',
+               min=1,
+               default=2,
+               help='Ports added and bound per switch'),
+    cfg.IntOpt('workers',
+               min=1,
+               default=10,
+               help='--workers passed to every dockernet command'),
+    cfg.ListOpt('commands',
+                default=BENCH_COMMAND_NAMES,
+                help='Commands to run, in order, out of %s' % ','.join(BENCH_COMMAND_NAMES)),
+    cfg.FloatOpt('exec-latency',
+                 min=0,
+                 default=0.005,
+                 help='Seconds the fake docker engine takes per exec'),
+    cfg.IntOpt('flows',
+               min=0,
+               default=20,
+               help='Flows the fake switches report'),
+    cfg.StrOpt('odl-ip',
+               default='127.0.0.1',
+               help='Address the fake neutron REST server listens on, port %d' % ODL_REST_PORT),
+    cfg.StrOpt('results-file',
+               default='dockernet-bench-results.jsonl',
+               help='Results are appended here'),
+    cfg.StrOpt('label',
+               help='Label of this run in the results file, by default git describe of the tree'),
+    cfg.StrOpt('compare',
+               help='Compare this run against the latest results recorded with this label'),
+    cfg.BoolOpt('ovsdb-check',
+                default=True,
+                help='Run the OVSDB client through a round trip against a fake ovsdb-server first'),
+]
+
+
+def run_child(stats_path, args):
+    # runs in the benchmarked python process
+    import resource
+
+    from dockernet import trace
+    from dockernet.cmd import dockernet
+
+    trace.enable()
+    start_time = time.time()
+    dockernet.start(args)
+    command_time = time.time() - start_time
+
+    rows = trace.get_tracer().summary()
+    stats = {'command_s': command_time,
+             'local_spawns': sum([row['count'] for row in rows if row['op'].startswith('shell.')]),
+             'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    with open(stats_path, 'w') as f:
+        json.dump(stats, f)
+
+
+def get_label():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            label = subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                            cwd=PACKAGE_ROOT, stderr=devnull)
+        return label.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError) as e:
+        return 'unlabeled'
+
+
+def prepare_neutron_files():
+    # dockernet reads the neutron network and subnet from /tmp, keep existing ones
+    for fname in NEUTRON_FILES:
+        path = os.path.join('/tmp', fname)
+        if not os.path.exists(path):
+            shutil.copy(os.path.join(DATA_DIR, fname), path)
+
+
+def run_command(work_dir, docker_socket, args, log):
+    stats_path = os.path.join(work_dir, 'stats.json')
+    if os.path.exists(stats_path):
+        os.unlink(stats_path)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([PACKAGE_ROOT] + [path for path in [env.get('PYTHONPATH')] if path])
+    args = args + ['--docker-socket', docker_socket,
+                   '--inventory-file', os.path.join(work_dir, 'inventory.json')]
+
+    start_time = time.time()
+    rc = subprocess.call([sys.executable, '-c', CHILD_SCRIPT, stats_path] + args,
+                         stdout=log, stderr=subprocess.STDOUT, env=env, cwd=work_dir)
+    wall_time = time.time() - start_time
+
+    stats = {}
+    if os.path.exists(stats_path):
+        with open(stats_path) as f:
+            stats = json.load(f)
+    stats['wall_s'] = wall_time
+    stats['ok'] = rc == 0 and 'command_s' in stats
+    return stats
+
+
+def load_baseline(results_file, label):
+    # latest record of every (switches, command) run under label
+    baseline = {}
+    if not os.path.exists(results_file):
+        return baseline
+    with open(results_file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('label') == label:
+                baseline[(record['switches'], record['command'])] = record
+    return baseline
+
+
+def format_delta(value, base):
+    if not base:
+        return '-'
+    return '%+.1f%%' % (100.0 * (value - base) / base)
+
+
+def run_benchmark(conf):
+    for name in conf.commands:
+        if name not in BENCH_COMMAND_NAMES:
+            print('ERROR: Unknown command %s, expected %s.' % (name, ','.join(BENCH_COMMAND_NAMES)))
+            return -1
+    commands = [(name, args) for name, args in BENCH_COMMANDS if name in conf.commands]
+    label = conf.label or get_label()
+    baseline = load_baseline(conf.results_file, conf.compare) if conf.compare else {}
+
+    work_dir = tempfile.mkdtemp(prefix='dockernet-bench-')
+    if conf.ovsdb_check:
+        failures = check_client(os.path.join(work_dir, 'ovsdb.sock'))
+        if failures:
+            print('ERROR: OVSDB client round trip against the fake ovsdb-server failed: %s.' % '; '.join(failures))
+            shutil.rmtree(work_dir)
+            return -1
+        print('OVSDB client round trip against the fake ovsdb-server passed.')
+    docker_socket = os.path.join(work_dir, 'docker.sock')
+    fake_odl = FakeOdl()
+    try:
+        odl_server = FakeOdlServer((conf.odl_ip, ODL_REST_PORT), fake_odl)
+    except (OSError, IOError) as e:
+        print('ERROR: Could not listen on %s:%d for the fake neutron REST server: %s' %
+              (conf.odl_ip, ODL_REST_PORT, e))
+        shutil.rmtree(work_dir)
+        return -1
+    docker_server = FakeDockerServer(docker_socket, None)
+    for server in (odl_server, docker_server):
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    prepare_neutron_files()
+    log = open(os.path.join(work_dir, 'dockernet.log'), 'w')
+    results = open(conf.results_file, 'a')
+    header = '%9s %-22s %9s %9s %8s %9s %7s %7s %9s' % (
+        'switches', 'command', 'wall s', 'cmd s', 'execs', 'api reqs', 'spawns', 'rest', 'rss MiB')
+    if conf.compare:
+        header += ' %9s %9s' % ('wall', 'rss')
+    print('Benchmarking %s with %d ports per switch, %d workers, %.3fs exec latency.' %
+          (label, conf.ports, conf.workers, conf.exec_latency))
+    print(header)
+    try:
+        for switches in [int(count) for count in conf.switches]:
+            # every switch count starts from an empty docker engine and inventory
+            fake_docker = FakeDocker(conf.exec_latency, flows=conf.flows)
+            docker_server.fake = fake_docker
+            fake_odl.docker = fake_docker
+            inventory_file = os.path.join(work_dir, 'inventory.json')
+            if os.path.exists(inventory_file):
+                os.unlink(inventory_file)
+
+            for name, args in commands:
+                fake_docker.reset_counters()
+                fake_odl.reset_counters()
+                args = args(switches, conf.ports, conf.odl_ip) + ['--workers', str(conf.workers)]
+                stats = run_command(work_dir, docker_socket, args, log)
+                record = {'label': label,
+                          'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                          'switches': switches,
+                          'ports': conf.ports,
+                          'workers': conf.workers,
+                          'exec_latency': conf.exec_latency,
+                          'command': name,
+                          'ok': stats['ok'],
+                          'wall_s': round(stats['wall_s'], 3),
+                          'command_s': round(stats.get('command_s', 0), 3),
+                          'container_execs': fake_docker.counters['execs'],
+                          'docker_requests': fake_docker.counters['requests'],
+                          'local_spawns': stats.get('local_spawns'),
+                          'rest_requests': fake_odl.counters['requests'],
+                          'peak_rss_kb': stats.get('peak_rss_kb')}
+                results.write(json.dumps(record, sort_keys=True) + '\n')
+                results.flush()
+
+                line = '%9d %-22s %9.2f %9.2f %8d %9d %7s %7d %9.1f' % (
+                    switches, name + ('' if record['ok'] else ' FAILED'), record['wall_s'], record['command_s'],
+                    record['container_execs'], record['docker_requests'], record['local_spawns'],
+                    record['rest_requests'], (record['peak_rss_kb'] or 0) / 1024.0)
+                if conf.compare:
+                    base = baseline.get((switches, name), {})
+                    line += ' %9s %9s' % (format_delta(record['wall_s'], base.get('wall_s')),
+                                          format_delta(record['peak_rss_kb'] or 0, base.get('peak_rss_kb')))
+                print(line)
+                sys.stdout.flush()
+    finally:
+        log.close()
+        results.close()
+        docker_server.shutdown()
+        odl_server.shutdown()
+        docker_server.server_close()
+        odl_server.server_close()
+        shutil.rmtree(work_dir)
+
+    print('Results are appended to %s with label %s.' % (conf.results_file, label))
+    return 0
+
+
+def main(args=None):
+    conf = cfg.ConfigOpts()
+    conf.register_cli_opts(BENCH_OPTS)
+    conf(args=sys.argv[1:] if args is None else args, project='dockernet-bench')
+    return run_benchmark(conf)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
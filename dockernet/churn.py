@@ -0,0 +1,233 @@
+"""
+Rate controlled churn of switches, ports and neutron port bindings.
+
+Operations are started at a target rate set by a token bucket, each one
+picked at random from a weighted mix, and run on a bounded set of
+workers. No token is taken while every worker is busy, so a controller
+that cannot keep up shows as an achieved rate below the target instead of
+a growing backlog. Every interval the achieved rate, the error rate and
+per operation latency percentiles are reported.
+"""
+
+import random
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from dockernet.convergence import percentile
+
+
+# errors kept per operation and interval
+MAX_ERRORS = 3
+
+
+class ChurnError(Exception):
+    pass
+
+
+def parse_mix(mix, names):
+    # ['add-port:4', 'del-port'] as a list of (operation, weight), weight 1 by default
+    weights = []
+    for item in mix:
+        name, sep, weight = item.partition(':')
+        if name not in names:
+            raise ValueError('unknown churn operation %s, expected %s' % (name, ','.join(names)))
+        try:
+            weight = float(weight) if sep else 1.0
+        except ValueError:
+            raise ValueError('invalid weight in churn mix entry %s' % item)
+        if weight < 0:
+            raise ValueError('invalid weight in churn mix entry %s' % item)
+        weights.append((name, weight))
+    if not [weight for name, weight in weights if weight > 0]:
+        raise ValueError('churn mix has no operation with a positive weight')
+    return weights
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        # start with a single token, not a burst
+        self.tokens = 1.0
+        self.last = time.time()
+
+    def take(self, deadline=None):
+        # blocks until a token is available, False when that is past deadline
+        while True:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class OpStats(object):
+    def __init__(self):
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.latencies = []
+        self.errors = []
+
+    def add(self, outcome, latency, error=None):
+        if outcome is None:
+            self.skipped += 1
+            return
+        self.latencies.append(latency)
+        if outcome:
+            self.done += 1
+        else:
+            self.failed += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append(error)
+
+    def record(self):
+        latencies = dict((key, round(value, 4) if value is not None else None)
+                         for key, value in (('p50', percentile(self.latencies, 50)),
+                                            ('p95', percentile(self.latencies, 95)),
+                                            ('p99', percentile(self.latencies, 99)),
+                                            ('max', max(self.latencies) if self.latencies else None)))
+        record = {'done': self.done,
+                  'failed': self.failed,
+                  'skipped': self.skipped,
+                  'errors': self.errors}
+        record.update(latencies)
+        return record
+
+
+def rate_record(t, elapsed, target_rate, stats):
+    # testbed-wide numbers of per operation stats gathered over elapsed seconds
+    done = sum([op.done for op in stats.values()])
+    failed = sum([op.failed for op in stats.values()])
+    return {'t': round(t, 3),
+            'target_rate': target_rate,
+            'achieved_rate': round((done + failed) / max(elapsed, 1e-6), 2),
+            'done': done,
+            'failed': failed,
+            'skipped': sum([op.skipped for op in stats.values()]),
+            'error_rate': round(float(failed) / (done + failed), 4) if done + failed else 0.0,
+            'ops': dict((name, op.record()) for name, op in stats.items())}
+
+
+class Churn(object):
+    def __init__(self, operations, mix, rate, burst=1, workers=1):
+        # operations maps the mix names to callables returning None when there
+        # was nothing to act on, raising an exception when the operation failed
+        self.operations = operations
+        self.mix = [(name, weight) for name, weight in mix if weight > 0]
+        self.rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.random = random.Random()
+        self.started = time.time()
+        self.finished = None
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stopped = threading.Event()
+        self._queue = queue.Queue()
+        self._interval = {}
+        self._total = {}
+        self._last_report = self.started
+
+    def pick(self):
+        point = self.random.uniform(0, sum([weight for name, weight in self.mix]))
+        for name, weight in self.mix:
+            point -= weight
+            if point <= 0:
+                return name
+        return self.mix[-1][0]
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def wait_stopped(self, seconds):
+        # sleep up to seconds, True when the churn got stopped meanwhile
+        self._stopped.wait(seconds)
+        return self._stopped.is_set()
+
+    def _run_op(self, name):
+        start_time = time.time()
+        error = None
+        try:
+            outcome = None if self.operations[name]() is None else True
+        except Exception as e:
+            outcome = False
+            error = str(e) or e.__class__.__name__
+        latency = time.time() - start_time
+        with self._cond:
+            for stats in (self._interval, self._total):
+                stats.setdefault(name, OpStats()).add(outcome, latency, error)
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _worker(self):
+        # long lived, so operations can keep per thread connections
+        while True:
+            name = self._queue.get()
+            if name is None:
+                return
+            self._run_op(name)
+
+    def run(self, duration=0):
+        # starts operations until duration seconds passed (0 until stopped), then waits for them
+        self.started = self._last_report = time.time()
+        deadline = self.started + duration if duration else None
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+        try:
+            while not self._stopped.is_set():
+                with self._cond:
+                    while (self._in_flight >= self.workers and not self._stopped.is_set() and
+                           (deadline is None or time.time() < deadline)):
+                        self._cond.wait(1.0)
+                if self._stopped.is_set() or not self.bucket.take(deadline):
+                    break
+                name = self.pick()
+                with self._cond:
+                    self._in_flight += 1
+                self._queue.put(name)
+        except KeyboardInterrupt:
+            # no new operations, the running ones still finish and get counted
+            self._stopped.set()
+        for i in range(self.workers):
+            self._queue.put(None)
+        with self._cond:
+            while self._in_flight:
+                self._cond.wait(1.0)
+        self.finished = time.time()
+        self._stopped.set()
+
+    def report(self):
+        # numbers of the operations finished since the previous report
+        now = time.time()
+        with self._cond:
+            stats = self._interval
+            self._interval = {}
+            in_flight = self._in_flight
+        record = rate_record(now - self.started, now - self._last_report, self.rate, stats)
+        record['in_flight'] = in_flight
+        self._last_report = now
+        return record
+
+    def summary(self):
+        # numbers of all operations of the run
+        elapsed = (self.finished or time.time()) - self.started
+        with self._cond:
+            return rate_record(elapsed, elapsed, self.rate, self._total)
@@ -0,0 +1,44 @@
+"""
+Thin dockernet command line client.
+
+Forwards the command to a running dockernet daemon (dockernet --daemon)
+and streams its output back, so oslo option parsing and docker state
+discovery are not paid per command. Without a daemon, or with
+DOCKERNET_NO_DAEMON set, the command runs in this process.
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+
+from dockernet import daemon
+
+
+NO_DAEMON_ENV = 'DOCKERNET_NO_DAEMON'
+
+
+def get_daemon_socket(args):
+    # --daemon-socket is read here without loading the option parser
+    for i, arg in enumerate(args):
+        if arg == '--daemon-socket' and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith('--daemon-socket='):
+            return arg.split('=', 1)[1]
+    return daemon.DEFAULT_DAEMON_SOCKET
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if args and '--daemon' not in args and not os.environ.get(NO_DAEMON_ENV):
+        rc = daemon.forward(get_daemon_socket(args), args, os.getcwd(), sys.stdout)
+        if rc is not None:
+            return rc
+
+    from dockernet.cmd import dockernet
+    return dockernet.start(args or None)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
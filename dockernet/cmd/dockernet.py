@@ -8,25 +8,58 @@
 
 """
 
+from __future__ import absolute_import
+
 import sys
 import os
+import json
+import random
+import re
+import shlex
+import signal
+import threading
 import time
 import subprocess
+from multiprocessing.pool import ThreadPool
 
 from oslo_config import cfg
 from oslo_log import log as logging
 
+from dockernet.docker_client import DockerClient, DockerError, ShardedDockerClient
+from dockernet.docker_client import DEFAULT_DOCKER_SOCKET, PLACEMENT_POLICIES, parse_endpoint
+from dockernet.inventory import Inventory, DEFAULT_INVENTORY_FILE
+from dockernet.rest_client import RestClient
+from dockernet import allocator
+from dockernet import churn
+from dockernet import containerinfo
+from dockernet import convergence
+from dockernet import daemon
+from dockernet import flows
+from dockernet import flowwatch
+from dockernet import ovsdb
+from dockernet import ping
+from dockernet import pool
+from dockernet import resources
+from dockernet import restconf
+from dockernet import snapshot
+from dockernet import throughput
+from dockernet import topology
+from dockernet import trace
+
 logging.register_options(cfg.CONF)
 LOG = logging.getLogger(__name__)
 
+OVSDB_TRANSPORTS = ('exec', 'tcp', 'unix')
+CHURN_OPERATIONS = ('add-port', 'del-port', 'bind-port', 'unbind-port', 'add-switch', 'del-switch')
+
 CLI_OPTS = [
     cfg.IntOpt('start-switches',
                min=1,
-               max=200,
+               max=allocator.MAX_SWITCHES,
                help='Specify number of switches to run in docker containers'),
     cfg.IntOpt('stop-switches',
                min=1,
-               max=200,
+               max=allocator.MAX_SWITCHES,
                help='Specify number of switches to stop running in docker containers'),
     cfg.StrOpt('controller-ip',
                max_length=16,
@@ -41,6 +74,17 @@ CLI_OPTS = [
                 help='Displays or writes into file - details of running containers'),
     cfg.BoolOpt('show-container-count',
                 help='Display count of running containers'),
+    cfg.StrOpt('info-format',
+               default='inspect',
+               choices=containerinfo.FORMATS,
+               help='Output format of --show-containers-info, inspect writes the full docker inspect '
+                    'JSON, table, jsonl and csv write the --info-fields of every switch'),
+    cfg.ListOpt('info-fields',
+                default=containerinfo.DEFAULT_FIELDS,
+                help='Fields --show-containers-info writes out of %s' % ','.join(containerinfo.FIELDS)),
+    cfg.BoolOpt('unhealthy',
+                help='With --show-containers-info, only switches whose container is missing, '
+                     'not running or failing its health check'),
     cfg.BoolOpt('create-network',
                 help='Flag to create network in neutron module'),
     cfg.BoolOpt('create-subnet',
@@ -49,28 +93,238 @@ CLI_OPTS = [
                 help='Flag to delete neutron data of network, subnetwork and ports'),
     cfg.IntOpt('add-ports',
                min=1,
-               max=30,
+               max=allocator.MAX_PORTS,
                help='Specify number of ports to add to switch running in docker container'),
     cfg.IntOpt('bind-ports',
                min=1,
-               max=30,
+               max=allocator.MAX_PORTS,
                help='Specify number of ports to bind port to neutron'),
     cfg.IntOpt('del-ports',
                min=1,
-               max=30,
+               max=allocator.MAX_PORTS,
                help='Specify number of ports to delete from switch running in docker container'),
+    cfg.StrOpt('port-cidr',
+               default=allocator.DEFAULT_PORT_CIDR,
+               help='Pool VM port IP addresses are allocated from, must be the cidr of the neutron subnet'),
+    cfg.IntOpt('ports-per-switch',
+               min=1,
+               max=allocator.MAX_PORTS,
+               default=allocator.DEFAULT_PORTS_PER_SWITCH,
+               help='Addresses of --port-cidr reserved per switch, the most ports a switch can have'),
     cfg.BoolOpt('create-ping-ips-file',
                 help='Flag to create input file of list of IP addresses to ping each other'),
     cfg.BoolOpt('ping-all',
                 help='Flag to ping all IPs present in file'),
     cfg.BoolOpt('cleanup',
-                help='Cleanup of ports, ovs, containers and output files')
+                help='Cleanup of ports, ovs, containers and output files'),
+    cfg.IntOpt('workers',
+               min=1,
+               default=10,
+               help='Number of switches to operate on concurrently'),
+    cfg.IntOpt('ready-timeout',
+               min=1,
+               default=60,
+               help='Seconds to wait for ovsdb-server/ovs-vswitchd to come up in a started switch'),
+    cfg.IntOpt('bind-batch-size',
+               min=1,
+               default=50,
+               help='Number of neutron ports created per bulk REST request with --bind-ports'),
+    cfg.StrOpt('dump-format',
+               default='text',
+               choices=['text', 'jsonl'],
+               help='Output format of --dump, jsonl writes parsed flow/group records'),
+    cfg.BoolOpt('snapshot',
+                help='With --dump flows, report only flows added/removed since the last snapshot, '
+                     'removed flows by hash as the snapshot keeps no flow text'),
+    cfg.StrOpt('snapshot-file',
+               default=snapshot.DEFAULT_SNAPSHOT_FILE,
+               help='Local index of per-switch flow fingerprints used by --snapshot'),
+    cfg.BoolOpt('watch-flows',
+                help='Keep the flow tables of --range switches (all by default) current from OpenFlow '
+                     'flow monitor events and report event rates; in the daemon it keeps running'),
+    cfg.IntOpt('watch-duration',
+               min=0,
+               default=0,
+               help='Seconds to watch flows, 0 watches until interrupted or the daemon stops'),
+    cfg.FloatOpt('watch-interval',
+                 min=0.1,
+                 default=5.0,
+                 help='Seconds between flow event rate reports of --watch-flows'),
+    cfg.BoolOpt('flow-diff',
+                help='Flows added, modified and deleted since the previous --flow-diff, '
+                     'answered by a dockernet daemon running --watch-flows'),
+    cfg.BoolOpt('verify-flows',
+                help='Compare the flows in the controller config and operational inventory (RESTCONF) '
+                     'with the flows --range switches (all by default) report'),
+    cfg.BoolOpt('churn',
+                help='Keep adding and removing ports, neutron port bindings and switches at '
+                     '--churn-rate operations per second to load the controller'),
+    cfg.FloatOpt('churn-rate',
+                 min=0.01,
+                 default=10.0,
+                 help='Target operations per second of --churn'),
+    cfg.IntOpt('churn-burst',
+               min=1,
+               default=1,
+               help='Operations --churn may start at once to catch up after falling behind its rate'),
+    cfg.ListOpt('churn-mix',
+                default=['add-port:4', 'del-port:4', 'bind-port:3', 'unbind-port:3', 'add-switch:1', 'del-switch:1'],
+                help='Weighted operations of --churn as OPERATION:WEIGHT out of %s' % ','.join(CHURN_OPERATIONS)),
+    cfg.IntOpt('churn-duration',
+               min=0,
+               default=60,
+               help='Seconds to churn, 0 churns until interrupted'),
+    cfg.FloatOpt('churn-interval',
+                 min=0.1,
+                 default=5.0,
+                 help='Seconds between --churn rate, error and latency reports'),
+    cfg.BoolOpt('throughput',
+                help='Measure datapath throughput of concurrent transfers between VM ports of --range '
+                     'switches (all by default) that run in different containers'),
+    cfg.IntOpt('throughput-pairs',
+               min=0,
+               default=0,
+               help='VM port pairs transferring at once with --throughput, 0 for one per switch'),
+    cfg.IntOpt('throughput-parallelism',
+               min=1,
+               default=1,
+               help='Parallel streams per VM port pair with --throughput'),
+    cfg.StrOpt('throughput-protocol',
+               default='tcp',
+               choices=['tcp', 'udp'],
+               help='Transfer protocol of --throughput'),
+    cfg.IntOpt('throughput-duration',
+               min=1,
+               default=10,
+               help='Seconds every --throughput transfer runs'),
+    cfg.FloatOpt('throughput-bandwidth',
+                 min=0,
+                 default=0,
+                 help='Target Mbit/s per pair with --throughput-protocol udp, 0 sends as fast as possible'),
+    cfg.StrOpt('throughput-tool',
+               default='auto',
+               choices=('auto',) + throughput.TOOLS,
+               help='Transfer tool of --throughput, auto uses iperf3 or iperf when the image has them '
+                    'and the bundled python sender/receiver otherwise'),
+    cfg.BoolOpt('measure-convergence',
+                help='With --start-switches or --add-ports, measure time until switches connect and flows stabilize'),
+    cfg.FloatOpt('convergence-interval',
+                 min=0.1,
+                 default=2.0,
+                 help='Seconds between switch polls with --measure-convergence'),
+    cfg.IntOpt('convergence-stable-polls',
+               min=1,
+               default=3,
+               help='Consecutive polls of a connected switch with an unchanged flow count (zero too) '
+                    'after which its flows are stable'),
+    cfg.IntOpt('convergence-timeout',
+               min=1,
+               default=600,
+               help='Seconds to wait for all switches to converge with --measure-convergence'),
+    cfg.BoolOpt('sample-resources',
+                help='With --start-switches or --add-ports, sample switch container CPU and memory usage'),
+    cfg.FloatOpt('sample-interval',
+                 min=0.1,
+                 default=1.0,
+                 help='Seconds between resource samples'),
+    cfg.StrOpt('cgroup-root',
+               default=resources.DEFAULT_CGROUP_ROOT,
+               help='Mount point of the cgroup hierarchy holding the docker containers'),
+    cfg.StrOpt('ping-format',
+               default='text',
+               choices=['text', 'json', 'csv'],
+               help='Output format of --ping-all results'),
+    cfg.IntOpt('ping-count',
+               min=1,
+               default=2,
+               help='Number of echo requests sent per source/destination pair with --ping-all'),
+    cfg.IntOpt('ping-parallelism',
+               min=1,
+               default=64,
+               help='Concurrent ping processes per switch when fping is not in the image'),
+    cfg.IntOpt('stop-timeout',
+               min=0,
+               default=10,
+               help='Seconds docker waits for a switch container to stop before killing it'),
+    cfg.BoolOpt('fast-cleanup',
+                help='With --cleanup, skip per-port deletion since the containers are removed anyway'),
+    cfg.IntOpt('pool-size',
+               min=0,
+               default=0,
+               help='Booted switch containers, not connected to any controller, kept in the warm pool; '
+                    '--start-switches claims them first and then refills the pool'),
+    cfg.BoolOpt('fill-pool',
+                help='Boot containers until the warm pool holds --pool-size of them'),
+    cfg.IntOpt('switches-per-container',
+               min=1,
+               default=1,
+               help='With --start-switches, run this many switches as separate bridges in one container'),
+    cfg.StrOpt('apply',
+               help='Bring up the testbed described by the given topology file'),
+    cfg.BoolOpt('trace',
+                help='Time every docker, exec, REST, shell and sleep operation, print a latency '
+                     'summary and write a Chrome trace file on exit'),
+    cfg.StrOpt('docker-socket',
+               default=DEFAULT_DOCKER_SOCKET,
+               help='Path of the docker engine API UNIX socket'),
+    cfg.ListOpt('docker-hosts',
+                help='Spread switches over these docker endpoints '
+                     '(UNIX socket paths, unix:// or tcp:// DOCKER_HOST values) instead of --docker-socket'),
+    cfg.StrOpt('placement',
+               default='round-robin',
+               choices=PLACEMENT_POLICIES,
+               help='How new switches are placed on --docker-hosts'),
+    cfg.StrOpt('ovsdb-transport',
+               default='exec',
+               choices=OVSDB_TRANSPORTS,
+               help='How switch bridges and ports are configured: ovs-vsctl execs, or OVSDB transactions '
+                    'to ovsdb-server on the container address and --ovsdb-port or on its UNIX socket'),
+    cfg.IntOpt('ovsdb-port',
+               min=1,
+               max=65535,
+               default=ovsdb.DEFAULT_OVSDB_PORT,
+               help='Port switches listen on for OVSDB connections with --ovsdb-transport tcp'),
+    cfg.StrOpt('inventory-file',
+               default=DEFAULT_INVENTORY_FILE,
+               help='Local store of switches and ports created by dockernet'),
+    cfg.BoolOpt('daemon',
+                help='Run as a daemon serving dockernet commands on --daemon-socket'),
+    cfg.StrOpt('daemon-socket',
+               default=daemon.DEFAULT_DAEMON_SOCKET,
+               help='UNIX socket the dockernet daemon listens on')
 ]
 
 
 cfg.CONF.register_cli_opts(CLI_OPTS)
 DUMP_LIST_ALL = ['flows', 'flow-count', 'ports', 'groups', 'tables','ovs-show']
+DUMP_CMDS = {'flows': 'ovs-ofctl dump-flows -O Openflow13 %(bridge)s',
+             'ports': 'ovs-ofctl dump-ports -O Openflow13 %(bridge)s',
+             'groups': 'ovs-ofctl dump-groups -O Openflow13 %(bridge)s',
+             'tables': 'ovs-ofctl dump-tables -O Openflow13 %(bridge)s',
+             'ovs-show': 'ovs-vsctl show',
+             'datapath-id': 'ovs-vsctl get Bridge %(bridge)s datapath-id'}
+DUMP_SECTION_MARKER = '@@DUMP '
 DEFAULT_COMMAND_LINE_OPTIONS = tuple(sys.argv[1:])
+READY_POLL_INTERVAL = 0.5
+PORT_TEMPLATE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'port.json')
+NEUTRON_PORTS_PATH = '/controller/nb/v2/neutron/ports'
+DENSITY_HOST_PREFIX = 'ovshost'
+OVSDB_CONTAINER_SOCKET = '/var/run/openvswitch/db.sock'
+OPENFLOW_PORT = 6653
+# switches tried per churn port operation before it is skipped
+CHURN_PICK_ATTEMPTS = 8
+
+_docker_client = None
+_docker_client_key = None
+_docker_client_lock = threading.Lock()
+_inventory = None
+_inventory_reconciled = False
+_inventory_lock = threading.Lock()
+_port_allocator = None
+_rest_clients = {}
+_in_daemon = False
+_flow_watch = None
+_pool_refiller = None
 
 def start_switch_arg_handling(conf):
     err_flag=False
@@ -120,6 +374,9 @@ def start_switch_arg_handling(conf):
         elif conf.ping_all:
             print("ERROR: --ping-all option can not be given with --start-switches option.")
             err_flag=True
+        elif conf.apply:
+            print("ERROR: --apply option can not be given with --start-switches option.")
+            err_flag=True
 
     return err_flag
 
@@ -137,6 +394,10 @@ def range_opt_validation(range_list):
     return 0
 
 def check_args_and_perform_action(conf):
+    if conf.ovsdb_transport == 'unix' and [host for host in conf.docker_hosts or [conf.docker_socket]
+                                           if parse_endpoint(host)[0] != 'unix']:
+        print("ERROR: --ovsdb-transport unix needs local docker daemons, use tcp or exec with tcp:// docker hosts.")
+        return -1
     if conf.start_switches:
         err_flag = start_switch_arg_handling(conf)
 
@@ -144,12 +405,92 @@ def check_args_and_perform_action(conf):
             return -1
 
         # normal switch start case
-        docker_ovs_run_connect(conf.start_switches, conf.controller_ip)
+        sampler = None
+        if conf.sample_resources:
+            sampler = start_resource_sampler(conf)
+        watcher = None
+        if conf.measure_convergence:
+            watcher = start_convergence_watcher(conf)
+        docker_ovs_run_connect(conf.start_switches, conf.controller_ip,
+                               conf.workers, conf.ready_timeout, watcher,
+                               conf.switches_per_container)
+        if watcher is not None:
+            report_convergence(watcher)
+        if sampler is not None:
+            report_resources(sampler)
         return 0
     elif conf.stop_switches:
         # normal switch stop case
-        docker_down(conf.stop_switches)
+        docker_down(conf.stop_switches, conf.workers, conf.stop_timeout)
+        return 0
+    elif conf.apply:
+        try:
+            spec = topology.load_topology(conf.apply)
+        except (IOError, ValueError) as e:
+            print("ERROR: Could not load topology file %s: %s" % (conf.apply, e))
+            return -1
+        if conf.controller_ip:
+            spec['controller_ip'] = conf.controller_ip
+        if not spec['controller_ip']:
+            print("ERROR: Mandatory to specify controller_ip in the topology file or --controller-ip with --apply option.")
+            return -1
+
+        apply_topology(spec, conf.output_file, conf.workers, conf.ready_timeout,
+                       conf.ping_format, conf.ping_count, conf.ping_parallelism)
+        return 0
+    elif conf.daemon:
+        return run_daemon(conf.daemon_socket)
+    elif conf.fill_pool:
+        if not conf.pool_size:
+            print("ERROR: Mandatory to specify --pool-size with --fill-pool option.")
+            return -1
+        fill_pool(conf.pool_size, conf.workers, conf.ready_timeout)
         return 0
+    elif conf.watch_flows:
+        if conf.range is None:
+            cont_count = int(get_container_count())
+            if not cont_count:
+                print("ERROR: No switch is running to watch flows of.")
+                return -1
+            sw_range = [1, cont_count]
+        else:
+            if range_opt_validation(conf.range) == -1:
+                return -1
+            sw_range = conf.range
+        watch_flows(sw_range, conf.watch_duration, conf.watch_interval, conf.output_file, conf.ready_timeout)
+        return 0
+    elif conf.flow_diff:
+        if conf.range is not None and range_opt_validation(conf.range) == -1:
+            return -1
+        return flow_diff(conf.range, conf.output_file)
+    elif conf.verify_flows:
+        if not conf.controller_ip:
+            print("ERROR: Mandatory to specify --controller-ip with --verify-flows option.")
+            return -1
+        if conf.range is None:
+            sw_range = [1, int(get_container_count())]
+        else:
+            if range_opt_validation(conf.range) == -1:
+                return -1
+            sw_range = conf.range
+        return verify_flows(conf.controller_ip, sw_range, conf.output_file, conf.workers)
+    elif conf.churn:
+        if not conf.controller_ip:
+            print("ERROR: Mandatory to specify --controller-ip with --churn option.")
+            return -1
+        return churn_testbed(conf.controller_ip, conf.churn_mix, conf.churn_rate, conf.churn_burst,
+                             conf.churn_duration, conf.churn_interval, conf.workers, conf.output_file,
+                             conf.ready_timeout, conf.stop_timeout)
+    elif conf.throughput:
+        if conf.range is None:
+            sw_range = [1, int(get_container_count())]
+        else:
+            if range_opt_validation(conf.range) == -1:
+                return -1
+            sw_range = conf.range
+        return throughput_test(sw_range, conf.throughput_pairs, conf.throughput_parallelism,
+                               conf.throughput_protocol, conf.throughput_duration, conf.throughput_bandwidth,
+                               conf.throughput_tool, conf.output_file, conf.workers)
     elif conf.controller_ip:
         if (conf.start_switches is None and
             conf.create_network is None and
@@ -168,11 +509,12 @@ def check_args_and_perform_action(conf):
             if conf.create_subnet:
                 create_subnet(conf.controller_ip)
             if conf.bind_ports:
-                bind_ports_to_neutron(conf.bind_ports, conf.controller_ip)
+                bind_ports_to_neutron(conf.bind_ports, conf.controller_ip,
+                                      conf.workers, conf.bind_batch_size)
             if conf.del_neutron_data:
                 del_neutron_data(conf.controller_ip)
             if conf.cleanup:
-                cleanup(conf.controller_ip)
+                cleanup(conf.controller_ip, conf.workers, conf.stop_timeout, conf.fast_cleanup)
             return 0
     elif conf.dump:
         for elem in conf.dump:
@@ -188,24 +530,41 @@ def check_args_and_perform_action(conf):
         if (retval == -1):
             return retval
 
+        if conf.snapshot:
+            if 'flows' not in conf.dump and 'all' not in conf.dump:
+                print("ERROR: --snapshot option is supported only with --dump flows.")
+                return -1
+            snapshot_flows(conf.range, conf.output_file, conf.workers, conf.snapshot_file)
+            return 0
+
         if 'all' in conf.dump:
             # Perform dump all operation
-            for elem in DUMP_LIST_ALL:
-                dump_ovs(elem, conf.range, conf.output_file)
+            dump_ovs(DUMP_LIST_ALL, conf.range, conf.output_file,
+                     conf.workers, conf.dump_format)
             return 0       
 
+        # Perform specific dump operations
+        dump_keys = []
         for elem in conf.dump:
-            if elem is not 'all':
-                # Perform specific dump operation
-                dump_ovs(elem, conf.range, conf.output_file)
+            if elem not in dump_keys:
+                dump_keys.append(elem)
+        dump_ovs(dump_keys, conf.range, conf.output_file,
+                 conf.workers, conf.dump_format)
         return 0
     elif conf.show_containers_info:
+        try:
+            containerinfo.check_fields(conf.info_fields)
+        except ValueError as e:
+            print("ERROR: Wrong value given with --info-fields option: %s." % e)
+            return -1
         filePath=None
         if conf.output_file:
             prefix = 'show-container-outfile-'
-            filePath = get_outfile_path(prefix)
+            ext = '.txt' if conf.info_format in ('inspect', 'table') else '.' + conf.info_format
+            filePath = get_outfile_path(prefix, ext)
 
-        show_containers_info(conf.show_containers_info, filePath)
+        show_containers_info(conf.show_containers_info, filePath, conf.workers,
+                             conf.info_format, conf.info_fields, conf.unhealthy)
         return 0
     elif conf.show_container_count:
         cont_count = get_container_count()
@@ -216,14 +575,24 @@ def check_args_and_perform_action(conf):
             print("ERROR: Mandatory to specify --controller-ip with --cleanup option.")  
         return 0
     elif conf.add_ports:
-        add_ports_to_ovs(conf.add_ports)
+        sampler = None
+        if conf.sample_resources:
+            sampler = start_resource_sampler(conf)
+        watcher = None
+        if conf.measure_convergence:
+            watcher = start_convergence_watcher(conf)
+        add_ports_to_ovs(conf.add_ports, conf.workers, watcher)
+        if watcher is not None:
+            report_convergence(watcher)
+        if sampler is not None:
+            report_resources(sampler)
         return 0
     elif conf.bind_ports:
         if not conf.controller_ip:
             print("ERROR: Mandatory to specify --controller-ip with --bind-ports option.")  
         return 0
     elif conf.del_ports:
-        del_and_unbind_ports(conf.del_ports)
+        del_and_unbind_ports(conf.del_ports, conf.workers)
         return 0
     elif conf.create_ping_ips_file:
         if conf.range is None:
@@ -243,7 +612,8 @@ def check_args_and_perform_action(conf):
         if (retval == -1):
             return retval
 
-        ping_ips_from_file(conf.range, conf.output_file)
+        ping_ips_from_file(conf.range, conf.output_file, conf.workers,
+                           conf.ping_format, conf.ping_count, conf.ping_parallelism)
         return 0
     elif conf.create_network:
         if not conf.controller_ip:
@@ -275,13 +645,43 @@ def printHelp():
             [--controller-ip CONTROLLER_IP]
             [--dump <all,flows,flow-count,ports,groups,tables,ovs-show>]
             [--show-container-count] [--show-containers-info NUM_OF_CONTAINERS]
+            [--info-format <inspect,table,jsonl,csv>] [--info-fields <FIELD,...>] [--unhealthy]
             [--add-ports NUM_OF_PORTS_TO_ADD_TO_SWITCH]
             [--bind-ports NUM_OF_PORTS_TO_BIND_TO_NEUTRON]
             [--del-ports NUM_OF_PORTS_TO_DELETE_FROM_SWITCH]
+            [--port-cidr <CIDR>] [--ports-per-switch NUM_OF_ADDRESSES_PER_SWITCH]
             [--create-network] [--create-subnet] [--del-neutron-data]
             [--create-ping-ips-file] [--ping-all]
             [--range <START_NUM,END_NUM>]
             [--output-file]
+            [--workers NUM_OF_CONCURRENT_SWITCH_OPERATIONS]
+            [--ready-timeout SECONDS_TO_WAIT_FOR_SWITCH_READY]
+            [--switches-per-container NUM_OF_BRIDGES_PER_CONTAINER]
+            [--pool-size NUM_OF_WARM_CONTAINERS] [--fill-pool]
+            [--stop-timeout SECONDS] [--fast-cleanup]
+            [--apply TOPOLOGY_FILE]
+            [--trace]
+            [--docker-socket DOCKER_API_SOCKET_PATH]
+            [--docker-hosts <DOCKER_ENDPOINT,...>] [--placement <round-robin,least-loaded>]
+            [--ovsdb-transport <exec,tcp,unix>] [--ovsdb-port OVSDB_PORT]
+            [--inventory-file INVENTORY_STORE_PATH]
+            [--daemon] [--daemon-socket DAEMON_SOCKET_PATH]
+            [--bind-batch-size NUM_OF_PORTS_PER_REST_REQUEST]
+            [--dump-format <text,jsonl>]
+            [--snapshot] [--snapshot-file SNAPSHOT_INDEX_PATH]
+            [--watch-flows] [--watch-duration SECONDS] [--watch-interval SECONDS] [--flow-diff]
+            [--verify-flows]
+            [--churn] [--churn-rate OPERATIONS_PER_SECOND] [--churn-burst NUM_OF_OPERATIONS]
+            [--churn-mix <OPERATION:WEIGHT,...>] [--churn-duration SECONDS] [--churn-interval SECONDS]
+            [--throughput] [--throughput-pairs NUM_OF_PORT_PAIRS]
+            [--throughput-parallelism NUM_OF_STREAMS_PER_PAIR] [--throughput-protocol <tcp,udp>]
+            [--throughput-duration SECONDS] [--throughput-bandwidth MBIT_PER_SECOND]
+            [--throughput-tool <auto,iperf3,iperf,builtin>]
+            [--measure-convergence] [--convergence-interval SECONDS]
+            [--convergence-stable-polls NUM_OF_POLLS] [--convergence-timeout SECONDS]
+            [--sample-resources] [--sample-interval SECONDS] [--cgroup-root CGROUP_MOUNT_PATH]
+            [--ping-format <text,json,csv>] [--ping-count NUM_OF_ECHO_REQUESTS]
+            [--ping-parallelism NUM_OF_CONCURRENT_PINGS_PER_SWITCH]
             [--cleanup]"""
 
     print(helpStr)
@@ -301,7 +701,14 @@ def start(args=None):
     conf = cfg.CONF
     # prepare conf
     cfg.CONF(args=args)
-    ret = check_args_and_perform_action(conf)
+    if conf.trace:
+        trace.enable()
+    with trace.span('command', ' '.join(args)):
+        ret = check_args_and_perform_action(conf)
+    if _inventory is not None:
+        _inventory.save()
+    if conf.trace:
+        report_trace()
     if (ret != 0):
         return 0
 
@@ -311,47 +718,295 @@ def start(args=None):
 
 
 def system(cmd):
-    rc = os.system(cmd)
+    # output is passed through sys.stdout, in the daemon it reaches the client of the calling thread
+    with trace.span('shell.' + cmd.split()[0]) as span:
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = proc.communicate()[0]
+        rc = proc.returncode
+        span.status = rc
+    if not isinstance(output, str):
+        output = output.decode('utf-8', 'replace')
+    sys.stdout.write(output)
     if rc != 0:
         sys.stderr.write('Error executing "%s", return code %i\n' % (cmd, rc))
     return rc == 0
 
+def check_output(cmd):
+    with trace.span('shell.' + cmd.split()[0]):
+        return subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+
+def report_trace():
+    tracer = trace.get_tracer()
+    tracer.write_summary(sys.stdout)
+    filePath = get_outfile_path('trace-outfile-', '.json')
+    f = open(filePath, 'w')
+    tracer.write_chrome_trace(f)
+    f.close()
+    print("Chrome trace is written into %s" % filePath)
+
+def run_daemon(socket_path):
+    global _in_daemon
+    _in_daemon = True
+    server = daemon.DaemonServer(socket_path, run_daemon_command)
+    try:
+        server.bind()
+    except (RuntimeError, IOError, OSError) as e:
+        print("ERROR: Could not start dockernet daemon: %s" % e)
+        return -1
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, interrupt)
+
+    print("dockernet daemon is listening on %s." % socket_path)
+    refill_pool(cfg.CONF.workers, cfg.CONF.ready_timeout)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("dockernet daemon stopped.")
+    return 0
+
+def run_daemon_command(args):
+    # configuration, docker and REST connections and the inventory stay loaded between commands
+    global _inventory_reconciled
+    if '--daemon' in args:
+        print("ERROR: --daemon option can not be given to a running dockernet daemon.")
+        return -1
+    _inventory_reconciled = False
+    try:
+        return start(list(args))
+    finally:
+        trace.disable()
+
+def get_docker_client():
+    # kept across daemon commands while the docker hosts stay the same
+    global _docker_client, _docker_client_key
+    with _docker_client_lock:
+        conf = cfg.CONF
+        hosts = conf.docker_hosts or [conf.docker_socket]
+        key = (tuple(hosts), conf.placement)
+        if _docker_client is None or _docker_client_key != key:
+            clients = [DockerClient(host, pool_size=conf.workers) for host in hosts]
+            if len(clients) == 1:
+                _docker_client = clients[0]
+            else:
+                _docker_client = ShardedDockerClient(clients, conf.placement)
+            _docker_client_key = key
+
+    return _docker_client
+
+def get_rest_client(controller_ip):
+    # one keep-alive connection per controller, reused by later daemon commands
+    client = _rest_clients.get(controller_ip)
+    if client is None:
+        client = _rest_clients[controller_ip] = RestClient(controller_ip)
+    return client
+
+def get_port_allocator():
+    global _port_allocator
+    conf = cfg.CONF
+    if (_port_allocator is None or _port_allocator.cidr != conf.port_cidr or
+            _port_allocator.ports_per_switch != conf.ports_per_switch):
+        _port_allocator = allocator.PortAllocator(conf.port_cidr, conf.ports_per_switch)
+    return _port_allocator
+
+def check_port_allocation(sw_count, ports_num):
+    # every port of every switch needs an address of the pool
+    try:
+        get_port_allocator().check(sw_count, ports_num)
+    except allocator.AllocationError as e:
+        print("ERROR: %s, see --port-cidr and --ports-per-switch." % e)
+        return False
+    return True
+
+def get_inventory():
+    # loaded once per process, reconciled with a single container list call on
+    # first use and again on first use by every daemon command, containers may
+    # have been removed behind the daemon's back
+    global _inventory, _inventory_reconciled
+    with _inventory_lock:
+        if _inventory is None or _inventory.path != cfg.CONF.inventory_file:
+            _inventory = Inventory(cfg.CONF.inventory_file)
+            _inventory_reconciled = False
+        if not _inventory_reconciled:
+            reconcile_inventory(_inventory)
+            _inventory_reconciled = True
+
+    return _inventory
+
+def reconcile_inventory(inventory):
+    containers = get_docker_client().ps(name='ovs')
+    containers = dict((cont['Names'][0].lstrip('/'), cont['Id']) for cont in containers)
+    for host in inventory.reconcile(containers, DENSITY_HOST_PREFIX):
+        # density host missing from the store, its bridges are its switches
+        try:
+            bridges = docker_exec(host, ['ovs-vsctl', 'list-br']).split()
+        except (subprocess.CalledProcessError, DockerError) as e:
+            continue
+        for bridge in bridges:
+            if bridge.startswith('ovs') and bridge[3:].isdigit():
+                inventory.add_switch(bridge, containers[host], host, ports_known=False)
+
+def get_switch_location(cont_name):
+    # container to exec in and bridge of a switch, density mode switches are
+    # bridges named after the switch in a shared host container
+    host = get_inventory().container_of(cont_name)
+    if host is None:
+        return cont_name, 'br-int'
+    return host, cont_name
+
 def docker_exec(cont_name, cmd):
-    cmd = 'docker exec %s %s' % (cont_name, cmd)
-    result = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+    # run cmd in container, raise CalledProcessError on non-zero exit status
+    if not isinstance(cmd, list):
+        cmd = shlex.split(cmd)
+    rc, result = get_docker_client().exec_run(cont_name, cmd)
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, ' '.join(cmd), result)
     return result
 
+def docker_call(cont_name, cmd, f=None):
+    # run cmd in container, echo its output and return exit status
+    if not isinstance(cmd, list):
+        cmd = shlex.split(cmd)
+    try:
+        rc, result = get_docker_client().exec_run(cont_name, cmd)
+    except DockerError as e:
+        rc, result = -1, '%s\n' % e
+    if f is None:
+        f = sys.stdout
+    f.write(result)
+    return rc
+
+def get_ovsdb_remote(cont_name):
+    # ovsdb-server of a switch container as an ovs remote, for --ovsdb-transport tcp or unix
+    conf = cfg.CONF
+    try:
+        info = get_docker_client().inspect(cont_name)
+        if conf.ovsdb_transport == 'tcp':
+            return 'tcp:%s:%d' % (info['NetworkSettings']['IPAddress'], conf.ovsdb_port)
+        # the container's own socket, reachable through its root only when docker runs locally
+        endpoint = get_docker_client().endpoint_of(cont_name)
+        if parse_endpoint(endpoint)[0] != 'unix':
+            raise ovsdb.OvsdbError('%s runs on %s, --ovsdb-transport unix needs a local docker daemon'
+                                   % (cont_name, endpoint))
+        return 'unix:/proc/%d/root%s' % (info['State']['Pid'], OVSDB_CONTAINER_SOCKET)
+    except (KeyError, TypeError) as e:
+        raise ovsdb.OvsdbError('no ovsdb address for %s in its docker inspect output' % cont_name)
+
+def get_ovsdb_listener_args():
+    # ovs-vsctl commands making ovsdb-server also listen on --ovsdb-port
+    return ['--', '--id=@m', 'create', 'Manager', 'target="ptcp:%d"' % cfg.CONF.ovsdb_port,
+            '--', 'add', 'Open_vSwitch', '.', 'manager_options', '@m']
+
+def ovsdb_commit(cont_name, build_ops, wait=True):
+    # one OVSDB transaction built by build_ops(client) from the switch's current
+    # database, returns exit status and output like docker_exec_batch
+    try:
+        client = ovsdb.OvsdbClient(get_ovsdb_remote(cont_name))
+        client.connect()
+        try:
+            client.monitor()
+            ops = build_ops(client)
+            if ops:
+                client.commit(ops, wait)
+        finally:
+            client.close()
+    except (ovsdb.OvsdbError, DockerError) as e:
+        return -1, 'OVSDB transaction on %s failed: %s\n' % (cont_name, e)
+    return 0, ''
+
+def ip_batch_cmd(ip_cmds):
+    # feed all ip commands to a single "ip -batch" run, continuing past errors
+    script = "ip -force -batch - <<'EOF'\n%s\nEOF" % '\n'.join(ip_cmds)
+    return ['sh', '-c', script]
+
+def ip_batch_failures(ip_cmds, output):
+    # "ip -batch" only names the line numbers of failed commands
+    lines = [int(num) for num in re.findall(r'Command failed -:(\d+)', output)]
+    return ''.join(['Error executing "ip %s"\n' % ip_cmds[num - 1] for num in lines if 0 < num <= len(ip_cmds)])
+
+def docker_exec_batch(cont_name, cmds):
+    # run each cmd in container, return first non-zero exit status and joined output
+    rc = 0
+    output = ''
+    for cmd in cmds:
+        try:
+            cmd_rc, result = get_docker_client().exec_run(cont_name, cmd)
+        except DockerError as e:
+            cmd_rc, result = -1, '%s\n' % e
+        output += result
+        if rc == 0:
+            rc = cmd_rc
+
+    return rc, output
+
+def run_parallel(func, items, workers):
+    # yield func(item) results in completion order using up to workers threads
+    if not items:
+        return
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        for result in pool.imap_unordered(daemon.inherit_output(func), items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
 def del_neutron_data(controller_ip):
     #delete neutron data 
     cmd = 'curl -u admin:admin -H "Content-Type: application/json" -X DELETE http://%s:8181/restconf/config/neutron:neutron' % controller_ip
     system(cmd)
     print("Deleted neutron data.")
 
-def del_and_unbind_ports(ports_num):
+def del_switch_ports(cont_name, sw_num, ports_num, first_port=1):
+    if ports_num < 1:
+        return cont_name, 0, ''
+
+    container, bridge = get_switch_location(cont_name)
+    ip_cmds = []
+    ovs_cmd = ['ovs-vsctl']
+    tap_names = []
+    for i in range(first_port,first_port+ports_num):
+        # prepare port names
+        tapPortName = allocator.tap_name(sw_num, i)
+        vm_port_name = allocator.vm_name(sw_num, i)
+
+        # delete tap port on ovs
+        ovs_cmd += ['--', '--if-exists', 'del-port', bridge, tapPortName]
+        tap_names.append(tapPortName)
+        # delete vm port, its tap peer goes with it
+        ip_cmds.append('link delete %s' % vm_port_name)
+
+    if cfg.CONF.ovsdb_transport == 'exec':
+        rc, output = docker_exec_batch(container, [ovs_cmd])
+    else:
+        rc, output = ovsdb_commit(container, lambda client: ovsdb.del_ports_ops(client, bridge, tap_names))
+    ip_rc, ip_output = docker_exec_batch(container, [ip_batch_cmd(ip_cmds)])
+    rc = rc or ip_rc
+    output += ip_output + ip_batch_failures(ip_cmds, ip_output)
+    inventory = get_inventory()
+    for i in range(first_port,first_port+ports_num):
+        inventory.remove_port(cont_name, i)
+    return cont_name, rc, output
+
+def del_and_unbind_ports(ports_num, workers=1):
     sw_count = int(get_container_count())
-    for j in range(1,sw_count+1):
-        cont_name = 'ovs'+str(j)
-        for i in range(1,ports_num+1):
-            # prepare port names
-            ovsnum="%02d" % j
-            portnum="%02d" % i
-            tapPortName = "tap2d9def%s-%s" % ( ovsnum, portnum )
-            vm_port_name = "vm-port%s%s" % ( ovsnum, portnum )
-
-            # delete tap port on ovs
-            cmd = 'docker exec %s ovs-vsctl del-port br-int %s' % ( cont_name, tapPortName )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-            # delete vm port
-            cmd = 'docker exec %s ip link delete %s' % ( cont_name, vm_port_name )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-
-            time.sleep(1)
-            print("Deleted %s and %s from %s switch." % ( tapPortName, vm_port_name, cont_name ))
+
+    def del_one(j):
+        return del_switch_ports('ovs'+str(j), j, ports_num)
+
+    for cont_name, rc, output in run_parallel(del_one, range(1,sw_count+1), workers):
+        sys.stdout.write(output)
+        if rc != 0:
+            print("Failure: Deleting ports from %s switch returned %d." % ( cont_name, rc ))
+        print("Deleted total %d tap and vm ports from %s switch." % ( ports_num, cont_name ))
 
 def get_network_id():
     # Get nw ID
     cmd = 'cat /tmp/network.json | grep \\"id\\" | cut -d \'\"\' -f 4'
-    network_id = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+    network_id = check_output(cmd)
     network_id = network_id.strip('\n')
     
     return network_id
@@ -359,7 +1014,7 @@ def get_network_id():
 def get_subnet_id():
     # Get subnet ID
     cmd = 'cat /tmp/subnetwork.json | grep \\"id\\" | cut -d \'\"\' -f 4'
-    subnet_id = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+    subnet_id = check_output(cmd)
     subnet_id = subnet_id.strip('\n')
 
     return subnet_id
@@ -367,25 +1022,40 @@ def get_subnet_id():
 def create_network(controller_ip):
     #create network
     cmd = 'curl -u admin:admin -H "Content-Type: application/json" --data @/tmp/network.json -X POST http://%s:8181/controller/nb/v2/neutron/networks' % controller_ip
-    system(cmd)
+    ok = system(cmd)
     print("Created network.")
+    return ok
 
 def create_subnet(controller_ip):
     #create subnetwork
     cmd = 'curl -u admin:admin -H "Content-Type: application/json" --data @/tmp/subnetwork.json -X POST http://%s:8181/controller/nb/v2/neutron/subnets' % controller_ip
-    system(cmd)
+    ok = system(cmd)
     print("Created sub-network.")
+    return ok
 
 def get_port_ips_from_ovs(cont_name):
     # create list of IPs of VM ports connected to OVS
-    ip_pattern = '20.0'
-    cmd = 'docker exec %s ip a show | awk \'/inet / {print $2}\' | grep -o ^[^/]* | grep %s' % (cont_name, ip_pattern)
+    ports = get_inventory().ports(cont_name)
+    if ports is not None:
+        return [ports[num]['ip'] for num in sorted(ports) if 'ip' in ports[num]]
+
+    container, bridge = get_switch_location(cont_name)
+    # host container also holds the ports of its other switches
+    sw_num = int(cont_name[len('ovs'):]) if container != cont_name else None
+    port_allocator = get_port_allocator()
+    port_ips_list = []
     try:
-        retval = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
-        port_ips_list = list(retval.split("\n"))
-        port_ips_list.remove('')
-    except subprocess.CalledProcessError as e:
-        port_ips_list = []
+        retval = docker_exec(container, 'ip a show')
+    except (subprocess.CalledProcessError, DockerError) as e:
+        return port_ips_list
+
+    for line in retval.split("\n"):
+        fields = line.split()
+        if len(fields) > 1 and fields[0] == 'inet':
+            ip = fields[1].split('/')[0]
+            location = port_allocator.locate(ip)
+            if location is not None and sw_num in (None, location[0]):
+                port_ips_list.append(ip)
 
     return port_ips_list
 
@@ -404,302 +1074,1566 @@ def create_ping_ips_file(sw_range):
     f.close()
     print("Created file %s containing IP addresses of VM ports in DPNs." % ping_ips_file)
 
-def ping_ips_from_file(sw_range, output_file):
+def probe_switch_ports(cont_name, dsts, count, parallelism):
+    # one exec per switch probing all its VM port IPs against all destinations
+    srcs = get_port_ips_from_ovs(cont_name)
+    if not srcs or not dsts:
+        return cont_name, srcs, {}
+    container = get_switch_location(cont_name)[0]
+    dsts_file = ping.DSTS_FILE % cont_name
+    cmd = ping.build_probe_cmd(srcs, dsts_file, count, parallelism)
+    try:
+        get_docker_client().put_file(container, dsts_file, ping.dsts_file_data(dsts))
+        rc, output = get_docker_client().exec_run(container, cmd)
+    except DockerError as e:
+        print("Failure: Could not run ping probes on %s switch: %s" % ( cont_name, e ))
+        return cont_name, srcs, {}
+
+    return cont_name, srcs, ping.parse_probe_output(output, count)
+
+def ping_ips_from_file(sw_range, output_file, workers=1, ping_format='text', count=2, parallelism=64):
     ping_ips_file = '/tmp/docker_ping_ips.txt'
     f = open(ping_ips_file, 'r')
-    port_ips_list_from_file = f.readlines()
+    port_ips_list_from_file = [dst.strip('\n') for dst in f.readlines() if dst.strip()]
     f.close()
 
     f = None
     if output_file:
         prefix = 'ping-ips-outfile-'
-        filePath = get_outfile_path(prefix)
+        ext = '.txt' if ping_format == 'text' else '.' + ping_format
+        filePath = get_outfile_path(prefix, ext)
         f = open(filePath,'w')
- 
+    out = f or sys.stdout
+
+    def probe_one(j):
+        return probe_switch_ports('ovs'+str(j), port_ips_list_from_file, count, parallelism)
+
+    matrix = ping.PingMatrix(port_ips_list_from_file, count)
     start = int(sw_range[0])
     end = int(sw_range[1])
-    for j in range(start,end+1):
-        cont_name = 'ovs'+str(j)
-        ovs_port_ips_list = get_port_ips_from_ovs(cont_name)
-
-	if f is None:
-            print("================== PING from %s switch ==================" % cont_name)
-	else:
-            f.write("================== PING from %s switch ==================\n" % cont_name)
-            f.flush()
-        for src in ovs_port_ips_list:
+    for cont_name, srcs, results in run_parallel(probe_one, range(start,end+1), workers):
+        matrix.add(srcs, results)
+        if ping_format != 'text':
+            continue
+        out.write("================== PING from %s switch ==================\n" % cont_name)
+        for src in srcs:
             for dst in port_ips_list_from_file:
-                dst = dst.strip('\n')
-                cmd = 'docker exec %s ping -c 2 -I %s %s' % (cont_name, src, dst)
-                try:
-                    resp = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
-                    if '0% packet loss' not in resp:
-                        if f is None:
-                            print("ping src=%s dst=%s FAILED." % (src, dst))
-                        else:
-                            f.write("ping src=%s dst=%s FAILED.\n" % (src, dst))
-                            f.flush()
-                    else:
-                        if f is None:
-                            print("ping src=%s dst=%s PASSED." % (src, dst))
-                        else:
-                            f.write("ping src=%s dst=%s PASSED.\n" % (src, dst))
-                            f.flush()
-                except subprocess.CalledProcessError as e:
-                    if f is None:
-                        print("ping src=%s dst=%s FAILED." % (src, dst))
-                    else:
-                        f.write("ping src=%s dst=%s FAILED.\n" % (src, dst))
-                        f.flush()
+                status = 'PASSED' if ping.is_passed(matrix.results[(src, dst)]) else 'FAILED'
+                out.write("ping src=%s dst=%s %s.\n" % (src, dst, status))
+        out.flush()
+
+    if ping_format == 'json':
+        matrix.write_json(out)
+    elif ping_format == 'csv':
+        matrix.write_csv(out)
+
+    summary = matrix.summary()
+    print("Ping summary: %d pairs, %d passed, %d failed." % (summary['pairs'], summary['passed'], summary['failed']))
     if f is not None:
         print("--ping-all output is written into %s" % filePath)
         f.close()
 
-def bind_ports_to_neutron(ports_num, controller_ip):
+def get_port_mac_addrs(cont_name):
+    # map of interface name to mac address for all links in the container
+    mac_addrs = {}
+    retval = docker_exec(get_switch_location(cont_name)[0], 'ip -o link show')
+    for line in retval.split("\n"):
+        fields = line.split()
+        if len(fields) < 2 or 'link/ether' not in fields:
+            continue
+        port_name = fields[1].rstrip(':').split('@')[0]
+        mac_addrs[port_name] = fields[fields.index('link/ether') + 1]
+
+    return mac_addrs
+
+def load_port_template():
+    with open(PORT_TEMPLATE_FILE) as f:
+        return json.load(f)['ports'][0]
+
+def fill_template(node, values):
+    # substitute placeholders in every string of the template
+    if isinstance(node, dict):
+        return dict((key, fill_template(val, values)) for key, val in node.items())
+    if isinstance(node, list):
+        return [fill_template(val, values) for val in node]
+    if isinstance(node, basestring):
+        for placeholder, value in values:
+            node = node.replace(placeholder, value)
+    return node
+
+def get_switch_port_payloads(port_template, cont_name, sw_num, ports_num, network_id, subnet_id, first_port=1):
+    # VM port mac addresses come from the inventory, else from the container
+    port_nums = range(first_port,first_port+ports_num)
+    ports = get_inventory().ports(cont_name) or {}
+    mac_addrs = {}
+    for port in ports.values():
+        if 'vm' in port and 'mac' in port:
+            mac_addrs[port['vm']] = port['mac']
+    if [i for i in port_nums if allocator.vm_name(sw_num, i) not in mac_addrs]:
+        mac_addrs = get_port_mac_addrs(cont_name)
+    port_allocator = get_port_allocator()
+    payloads = []
+    for i in port_nums:
+        # Prepare port attribute values
+        port = port_allocator.port(sw_num, i)
+
+        values = [('OVS_IFACE_ID', port['iface_id']),
+                  ('DEVICE_ID', port['device_id']),
+                  ('PORT_NAME', port['tap']),
+                  ('PORT_MAC_ADDR', mac_addrs.get(port['vm'], '')),
+                  ('PORT_IP_ADDR', port['ip']),
+                  ('NETWORK_ID', network_id),
+                  ('SUBNET_ID', subnet_id),
+                  ('PORT_SEC_ENABLED', 'false')]
+        payloads.append((i, fill_template(port_template, values)))
+
+    return payloads
+
+def post_neutron_ports(rest_client, ports):
+    # Perform neutron create port operation for all ports in one REST call,
+    # ports is a list of (switch name, port number, payload)
+    status, data = rest_client.request('POST', NEUTRON_PORTS_PATH, {'ports': [port[2] for port in ports]})
+    if status >= 300:
+        print("Failure: Creating %d neutron ports returned HTTP %d: %s" % ( len(ports), status, data ))
+        return False
+    inventory = get_inventory()
+    for cont_name, port_num, payload in ports:
+        inventory.set_port(cont_name, port_num, neutron_id=payload['id'])
+    print("Created %d neutron ports." % len(ports))
+    return True
+
+def bind_ports_to_neutron(ports_num, controller_ip, workers=1, batch_size=50):
     sw_count = int(get_container_count())
+    if not check_port_allocation(sw_count, ports_num):
+        return
     network_id = get_network_id()
     subnet_id = get_subnet_id()
-    for j in range(1,sw_count+1):
+    port_template = load_port_template()
+    rest_client = get_rest_client(controller_ip)
+
+    def collect_one(j):
         cont_name = 'ovs'+str(j)
-        for i in range(1,ports_num+1):
-            # Prepare port attribute values
-            ovsnum = "%02d" % j
-            portnum = "%02d" % i
-            tapPortName = "tap2d9def%s-%s" % ( ovsnum, portnum )
-
-            ovs_iface_id = "d6c144c2-%s%s-%s%s-ba74-ceaf8df1ac17" % ( ovsnum, ovsnum, portnum, portnum )
-            device_id = "e957c01d-%s%s-%s%s-b79e-17aae1a6733d" % ( ovsnum, ovsnum, portnum, portnum )
-            vm_port_name = "vm-port%s%s" % ( ovsnum, portnum )
-
-            # Fetch VM port mac address to set while creating neutron port
-            cmd = "docker exec %s ip a show %s  | awk '/ether / {print $2}'" % ( cont_name, vm_port_name )
-            port_mac_addr = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
-            port_mac_addr = port_mac_addr.strip('\n')
-
-            port_ip_addr = '20.0.' + str(j) + '.' + str(i)
-
-            # Create json required in REST URL to create neutron port
-            cmd = 'cp /tmp/port.json /tmp/port_copy.json'
-            system(cmd)
-            filePath = '/tmp/port_copy.json'
-
-            # Update port specific details in the body for json
-            cmd = 'sed -i "s/OVS_IFACE_ID/%s/g" %s' % (ovs_iface_id,filePath)
-            system(cmd)
-            cmd = 'sed -i "s/DEVICE_ID/%s/g" %s' % (device_id,filePath)
-            system(cmd)
-            cmd = 'sed -i "s/PORT_NAME/%s/g" %s' % (tapPortName,filePath)
-            system(cmd)
-            cmd = 'sed -i "s/PORT_MAC_ADDR/%s/g" %s' % (port_mac_addr,filePath)
-            system(cmd)
-            cmd = 'sed -i "s/PORT_IP_ADDR/%s/g" %s' % (port_ip_addr,filePath)
-            system(cmd)
-            cmd = 'sed -i "s/NETWORK_ID/%s/g" %s' % (network_id,filePath)
-            system(cmd)
-            cmd = 'sed -i "s/SUBNET_ID/%s/g" %s' % (subnet_id,filePath)
-            system(cmd)
-            cmd = 'sed -i "s/PORT_SEC_ENABLED/false/g" %s' % (filePath)
-            system(cmd)
-
-            # Perform neutron create port operation via REST call
-            cmd = 'curl -u admin:admin -H "Content-Type: application/json" --data @/tmp/port_copy.json -X POST http://%s:8181/controller/nb/v2/neutron/ports' % controller_ip
-            system(cmd)
-
-            time.sleep(1)
-            print("Created neutron port %s and bound to %s on %s switch." % ( ovs_iface_id, tapPortName, cont_name ))
-
-        time.sleep(1)
-        print("Created total %d neutron ports on %s switch." % ( ports_num, cont_name  ))
-
-
-def add_ports_to_ovs(ports_num):
+        try:
+            payloads = get_switch_port_payloads(port_template, cont_name, j, ports_num, network_id, subnet_id)
+        except (subprocess.CalledProcessError, DockerError) as e:
+            print("Failure: Could not read VM port mac addresses on %s switch: %s" % ( cont_name, e ))
+            payloads = []
+        return cont_name, [(cont_name, i, payload) for i, payload in payloads]
+
+    # mac collection runs on the worker pool while full batches are posted here
+    batch = []
+    created = 0
+    for cont_name, payloads in run_parallel(collect_one, range(1,sw_count+1), workers):
+        print("Prepared %d neutron ports for %s switch." % ( len(payloads), cont_name ))
+        batch.extend(payloads)
+        while len(batch) >= batch_size:
+            if post_neutron_ports(rest_client, batch[:batch_size]):
+                created += batch_size
+            batch = batch[batch_size:]
+    if batch and post_neutron_ports(rest_client, batch):
+        created += len(batch)
+
+    print("Created total %d neutron ports on %d switches." % ( created, sw_count ))
+
+
+def add_switch_ports(cont_name, sw_num, ports_num, first_port=1):
+    container, bridge = get_switch_location(cont_name)
+    ip_cmds = []
+    ovs_cmd = ['ovs-vsctl']
+    ovs_ports = []
+    ports = {}
+    port_allocator = get_port_allocator()
+    for i in range(first_port,first_port+ports_num):
+        # create tap port
+        port = port_allocator.port(sw_num, i)
+        tapPortName = port['tap']
+
+        # add tap port to ovs switch with below external_ids attributes
+        ovs_iface_id = port['iface_id']
+        vm_port_name = port['vm']
+
+        # create veth pair port to emulate guest VM connecting to switch
+        port_mac_addr = port['mac']
+        ip_cmds.append('link add %s address %s type veth peer name %s' % ( vm_port_name, port_mac_addr, tapPortName ))
+        port_ip_addr = port['ip']
+        ip_cmds.append('addr add %s/%d dev %s' % ( port_ip_addr, port_allocator.prefixlen, vm_port_name ))
+        # Bring UP veth interfaces
+        ip_cmds.append('link set dev %s up' % vm_port_name)
+        ip_cmds.append('link set dev %s up' % tapPortName)
+
+        ovs_cmd += ['--', '--may-exist', 'add-port', bridge, tapPortName,
+                    '--', 'set', 'Interface', tapPortName, 'external_ids:iface-id=%s' % ovs_iface_id]
+        ovs_ports.append((tapPortName, {'iface-id': ovs_iface_id}))
+        ports[i] = {'tap': tapPortName, 'vm': vm_port_name, 'ip': port_ip_addr,
+                    'mac': port_mac_addr, 'iface_id': ovs_iface_id}
+
+    # all veth ports in one ip batch, then all tap ports in one ovsdb transaction,
+    # whatever the transport the ports are added even when some ip command failed
+    rc, output = docker_exec_batch(container, [ip_batch_cmd(ip_cmds)])
+    output += ip_batch_failures(ip_cmds, output)
+    if cfg.CONF.ovsdb_transport == 'exec':
+        ovs_rc, ovs_output = docker_exec_batch(container, [ovs_cmd])
+    else:
+        ovs_rc, ovs_output = ovsdb_commit(container, lambda client: ovsdb.add_ports_ops(client, bridge, ovs_ports))
+    rc = rc or ovs_rc
+    output += ovs_output
+    if rc == 0:
+        inventory = get_inventory()
+        for i, port in ports.items():
+            inventory.set_port(cont_name, i, **port)
+    return cont_name, rc, output
+
+def add_ports_to_ovs(ports_num, workers=1, watcher=None):
     sw_count = int(get_container_count())
-    for j in range(1,sw_count+1):
-        cont_name = 'ovs'+str(j)
-        for i in range(1,ports_num+1):
-            # create tap port
-            ovsnum="%02d" % j
-            portnum="%02d" % i
-            tapPortName="tap2d9def%s-%s" % ( ovsnum, portnum )
-
-            # add tap port to ovs switch with below external_ids attributes
-            ovs_iface_id="d6c144c2-%s%s-%s%s-ba74-ceaf8df1ac17" % ( ovsnum, ovsnum, portnum, portnum )
-            vm_port_name = "vm-port%s%s" % ( ovsnum, portnum )
-
-            # create veth pair port to emulate guest VM connecting to switch
-            cmd = 'docker exec %s ip link add %s type veth peer name %s' % ( cont_name, vm_port_name, tapPortName )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-
-            #docker exec ovs$j ip link add nsp$ovsnum$portnum type veth peer name $portName
-            port_ip_addr='20.0.' + str(j) + '.' + str(i) + '/16'
-            cmd = 'docker exec %s ip addr add %s dev %s' % ( cont_name, port_ip_addr, vm_port_name )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-            #docker exec ovs$j ip addr add $port_ip_addr/16 dev nsp$ovsnum$portnum
-            cmd = 'docker exec %s ip link set dev %s up' % ( cont_name, vm_port_name )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-            #docker exec ovs$j ip link set dev nsp$ovsnum$portnum up
-
-            cmd = 'docker exec %s ovs-vsctl add-port br-int %s -- set Interface %s external_ids:iface-id=%s ' % ( cont_name, tapPortName, tapPortName, ovs_iface_id )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-            #docker exec ovs$j ovs-vsctl add-port br-int $portName -- set Interface $portName external_ids:iface-id=$ovs_iface_id
-
-            # Bring UP veth interfaces
-            cmd = 'docker exec %s ip link set dev %s up' % ( cont_name, tapPortName )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-            #docker exec ovs$j ip link set dev $portName up
-
-            time.sleep(1)
-            print("Created tap port %s on %s switch." % ( tapPortName, cont_name  ))
-
-        time.sleep(1)
+    if not check_port_allocation(sw_count, ports_num):
+        return
+
+    def add_one(j):
+        start_time = time.time()
+        result = add_switch_ports('ovs'+str(j), j, ports_num)
+        if watcher is not None:
+            watcher.track('ovs'+str(j), start_time)
+        return result
+
+    for cont_name, rc, output in run_parallel(add_one, range(1,sw_count+1), workers):
+        sys.stdout.write(output)
+        if rc != 0:
+            print("Failure: Adding ports to %s switch returned %d." % ( cont_name, rc ))
         print("Created total %d tap port on %s switch." % ( ports_num, cont_name  ))
 
 
-def get_dump(dump_key, sw_range, filePath):
+def get_dump_cmd(dump_keys, bridge='br-int'):
+    # one script running every requested dump, each output section tagged
+    script = []
+    for fetch_key in get_dump_fetch_keys(dump_keys):
+        script.append('echo "%s%s"' % ( DUMP_SECTION_MARKER, fetch_key ))
+        script.append('%s 2>&1' % (DUMP_CMDS[fetch_key] % {'bridge': bridge}))
+    return ['sh', '-c', '\n'.join(script)]
+
+def get_dump_fetch_keys(dump_keys):
+    # flow-count is computed from dump-flows output, fetch it only once
+    fetch_keys = []
+    for dump_key in dump_keys:
+        fetch_key = 'flows' if dump_key == 'flow-count' else dump_key
+        if fetch_key not in fetch_keys:
+            fetch_keys.append(fetch_key)
+    return fetch_keys
+
+def split_dump_output(output):
+    sections = {}
+    fetch_key = None
+    for line in output.splitlines(True):
+        if line.startswith(DUMP_SECTION_MARKER):
+            fetch_key = line[len(DUMP_SECTION_MARKER):].strip()
+            sections[fetch_key] = ''
+        elif fetch_key is not None:
+            sections[fetch_key] += line
+    return sections
+
+def collect_switch_dump(cont_name, dump_keys):
+    # flow-count alone is answered from flow monitor state while a daemon watches flows
+    if dump_keys == ['flow-count'] and _flow_watch is not None and not _flow_watch.stopped():
+        flow_lines = _flow_watch.flow_lines(cont_name)
+        if flow_lines is not None:
+            return cont_name, {'flows': flow_lines}
+    try:
+        container, bridge = get_switch_location(cont_name)
+        rc, output = get_docker_client().exec_run(container, get_dump_cmd(dump_keys, bridge))
+        sections = split_dump_output(output)
+    except DockerError as e:
+        sections = dict((fetch_key, '%s\n' % e) for fetch_key in get_dump_fetch_keys(dump_keys))
+    return cont_name, sections
+
+def format_dump(cont_name, dump_key, sections, dump_format):
+    output = sections.get('flows' if dump_key == 'flow-count' else dump_key, '')
+    if dump_format == 'text':
+        if dump_key == 'flow-count':
+            output = '%d\n' % len(flows.parse_flows(output))
+        return '=================== %s %s =====================\n\n%s' % (cont_name, dump_key, output)
+
+    if dump_key == 'flow-count':
+        flow_list = flows.parse_flows(output)
+        records = [{'switch': cont_name,
+                    'flow_count': len(flow_list),
+                    'tables': dict((str(table), count) for table, count in flows.table_histogram(flow_list).items())}]
+    elif dump_key == 'flows':
+        records = flows.parse_flows(output)
+    elif dump_key == 'groups':
+        records = flows.parse_groups(output)
+    else:
+        records = [{'dump': dump_key, 'output': output}]
+
+    lines = []
+    for record in records:
+        record['switch'] = cont_name
+        lines.append(json.dumps(record, sort_keys=True) + '\n')
+    return ''.join(lines)
+
+def get_dump(dump_keys, sw_range, filePaths, workers=1, dump_format='text'):
     start = int(sw_range[0])
     end = int(sw_range[1])
+    files = {}
+    for dump_key in dump_keys:
+        if filePaths.get(dump_key) is not None:
+            files[dump_key] = open(filePaths[dump_key],'w')
+
+    def collect_one(i):
+        return collect_switch_dump('ovs'+str(i), dump_keys)
+
+    # sections are written as each switch answers, not in range order
+    for cont_name, sections in run_parallel(collect_one, range(start,end+1), workers):
+        for dump_key in dump_keys:
+            f = files.get(dump_key, sys.stdout)
+            f.write(format_dump(cont_name, dump_key, sections, dump_format))
+            f.flush()
+
+    for dump_key in dump_keys:
+        if dump_key in files:
+            files[dump_key].close()
+            print("--dump %s output is written into %s" % (dump_key, filePaths[dump_key]))
+
+def snapshot_switch_flows(cont_name, flow_snapshot):
+    # cheap fingerprint first, full flows only for switches that changed
+    container, bridge = get_switch_location(cont_name)
+    rc, fingerprint = get_docker_client().exec_run(container, snapshot.fingerprint_cmd(bridge))
+    fingerprint = fingerprint.strip()
+    if rc != 0 or not fingerprint:
+        return cont_name, None, None
+    if fingerprint == flow_snapshot.fingerprint(cont_name):
+        return cont_name, fingerprint, None
+
+    # a failed dump must not be stored as a switch without flows
+    rc, output = get_docker_client().exec_run(container, shlex.split(DUMP_CMDS['flows'] % {'bridge': bridge}))
+    if rc != 0 or not output.strip():
+        return cont_name, None, None
+    return cont_name, fingerprint, snapshot.hash_flows(output)
+
+def snapshot_flows(sw_range, output_file, workers=1, snapshot_file=snapshot.DEFAULT_SNAPSHOT_FILE):
+    flow_snapshot = snapshot.FlowSnapshot(snapshot_file)
     f = None
-    if filePath is not None:
+    if output_file:
+        prefix = 'flow-snapshot-diff-outfile-'
+        filePath = get_outfile_path(prefix)
         f = open(filePath,'w')
+    out = f or sys.stdout
 
-    for i in range(start,end+1):
-        cont_name = 'ovs'+str(i)
-        cmd = ''
-        if dump_key == 'ovs-show':
-            cmd = 'docker exec %s ovs-vsctl show' % (cont_name)
-        elif dump_key == 'flow-count':
-            cmd = 'docker exec %s ovs-ofctl dump-flows -O Openflow13 br-int | grep cookie | wc -l' % (cont_name)
-        else:
-            cmd = 'docker exec %s ovs-ofctl dump-%s -O Openflow13 br-int' % (cont_name, dump_key)
+    def snapshot_one(i):
+        try:
+            return snapshot_switch_flows('ovs'+str(i), flow_snapshot)
+        except DockerError as e:
+            return 'ovs'+str(i), None, None
+
+    checked = changed = added_count = removed_count = 0
+    start = int(sw_range[0])
+    end = int(sw_range[1])
+    for cont_name, fingerprint, hashed in run_parallel(snapshot_one, range(start,end+1), workers):
+        checked += 1
+        if fingerprint is None:
+            out.write("Failure: Could not read flows of %s switch, its snapshot is kept.\n" % cont_name)
+            continue
+        if hashed is None:
+            continue
+        added, removed = flow_snapshot.update(cont_name, fingerprint, hashed)
+        changed += 1
+        added_count += len(added)
+        removed_count += len(removed)
+        out.write('=================== %s flows +%d -%d =====================\n' % (cont_name, len(added), len(removed)))
+        for flow in added:
+            out.write('+ %s\n' % flow)
+        for key in removed:
+            out.write('- flow %s\n' % key)
+        out.flush()
+
+    flow_snapshot.save()
+    print("Flow snapshot: %d switches checked, %d changed, %d flows added, %d flows removed." %
+          (checked, changed, added_count, removed_count))
+    if f is not None:
+        print("--snapshot output is written into %s" % filePath)
+        f.close()
 
-        if filePath is None:
-            print('=================== %s %s =====================\n' % (cont_name, dump_key) )
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
+def watch_flows(sw_range, duration=0, interval=5.0, output_file=False, ready_timeout=60):
+    global _flow_watch
+    if _flow_watch is not None:
+        _flow_watch.stop()
+        _flow_watch = None
+
+    names = ['ovs'+str(i) for i in range(int(sw_range[0]), int(sw_range[1])+1)]
+    watch = flowwatch.FlowWatch([(name,) + get_switch_location(name) for name in names],
+                                get_docker_client().exec_stream)
+    watch.start()
+    if not watch.wait_synced(ready_timeout):
+        print("Failure: Flow tables of all switches did not arrive in %d seconds." % ready_timeout)
+    records = watch.report()
+    watched = 0
+    for record in records:
+        if record['error']:
+            print("Failure: Could not watch flows of %s switch: %s" % (record['switch'], record['error']))
         else:
-            f.write('=================== %s %s =====================\n' % (cont_name, dump_key) )
+            watched += 1
+    print("Watching flows of %d switches, %d flows." % (watched, sum([record['flows'] for record in records])))
+
+    f = None
+    if output_file or _in_daemon:
+        filePath = get_outfile_path('flow-watch-outfile-', '.jsonl')
+        f = open(filePath, 'w')
+    if _in_daemon:
+        # keeps answering --dump flow-count and --flow-diff from memory
+        _flow_watch = watch
+        thread = threading.Thread(target=report_flow_watch, args=(watch, interval, duration, None, f))
+        thread.daemon = True
+        thread.start()
+        print("Flow watch runs in the dockernet daemon, event rates are written into %s" % filePath)
+        return
+
+    try:
+        report_flow_watch(watch, interval, duration, sys.stdout, f)
+    except KeyboardInterrupt:
+        watch.stop()
+        if f is not None:
+            f.close()
+    for name, added, modified, deleted in watch.diff(names):
+        if added or modified or deleted:
+            print("%s: %d flows, %d added, %d modified, %d deleted while watched." %
+                  (name, watch.flow_count(name), len(added), len(modified), len(deleted)))
+    if f is not None:
+        print("--watch-flows output is written into %s" % filePath)
+
+def report_flow_watch(watch, interval, duration, out, f):
+    # event rates every interval until duration has passed or the watch is stopped
+    deadline = time.time() + duration if duration else None
+    while not watch.stopped():
+        wait = interval if deadline is None else min(interval, deadline - time.time())
+        if wait > 0 and watch.wait_stopped(wait):
+            break
+        records = watch.report()
+        if out is not None:
+            active = [record for record in records if not record['error']]
+            events = [record for record in active if record['added'] or record['modified'] or record['deleted']]
+            out.write("%7.1fs: %d flows, %.1f events/s (%d added, %d modified, %d deleted) on %d of %d switches\n" %
+                      (records[0]['t'] if records else 0,
+                       sum([record['flows'] for record in active]),
+                       sum([record['events_per_sec'] for record in events]),
+                       sum([record['added'] for record in events]),
+                       sum([record['modified'] for record in events]),
+                       sum([record['deleted'] for record in events]),
+                       len(events), len(active)))
+            for record in events:
+                out.write("    %s: %d flows, %.1f events/s (%d added, %d modified, %d deleted)\n" %
+                          (record['switch'], record['flows'], record['events_per_sec'],
+                           record['added'], record['modified'], record['deleted']))
+            out.flush()
+        if f is not None:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
             f.flush()
-            subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT, shell=True)
+        if deadline is not None and time.time() >= deadline:
+            break
+    watch.stop()
+    if f is not None:
+        f.close()
 
-    if filePath is not None:
-        f.flush()
+def flow_diff(sw_range, output_file):
+    watch = _flow_watch
+    if watch is None:
+        print("ERROR: --flow-diff option needs a dockernet daemon running --watch-flows.")
+        return -1
+    if sw_range is None:
+        names = sorted(watch.switches, key=lambda name: (len(name), name))
+    else:
+        names = ['ovs'+str(i) for i in range(int(sw_range[0]), int(sw_range[1])+1)]
+    f = None
+    if output_file:
+        filePath = get_outfile_path('flow-diff-outfile-')
+        f = open(filePath, 'w')
+    out = f or sys.stdout
+
+    checked = changed = added_count = modified_count = deleted_count = 0
+    for name, added, modified, deleted in watch.diff(names):
+        checked += 1
+        if not (added or modified or deleted):
+            continue
+        changed += 1
+        added_count += len(added)
+        modified_count += len(modified)
+        deleted_count += len(deleted)
+        out.write('=================== %s flows +%d ~%d -%d =====================\n' %
+                  (name, len(added), len(modified), len(deleted)))
+        for flow in added:
+            out.write('+ %s\n' % flow)
+        for flow in modified:
+            out.write('~ %s\n' % flow)
+        for flow in deleted:
+            out.write('- %s\n' % flow)
+
+    print("Flow diff: %d switches watched, %d changed, %d flows added, %d modified, %d deleted%s." %
+          (checked, changed, added_count, modified_count, deleted_count,
+           ', watch has stopped' if watch.stopped() else ''))
+    if f is not None:
+        print("--flow-diff output is written into %s" % filePath)
         f.close()
-        print("--dump %s output is written into %s" % (dump_key, filePath))
-        
-        
+    return 0
+
+def collect_switch_tables(cont_name):
+    # (switch, hex datapath id or None when unreachable, {table: flow count})
+    cont_name, sections = collect_switch_dump(cont_name, ['flows', 'datapath-id'])
+    dpid = sections.get('datapath-id', '').strip().strip('"')
+    try:
+        int(dpid, 16)
+    except ValueError:
+        return cont_name, None, {}
+    return cont_name, dpid, flows.table_histogram(flows.parse_flows(sections.get('flows', '')))
+
+def read_inventory_nodes(add):
+    # consume function of a streamed inventory request, returns the node count
+    def consume(read):
+        count = 0
+        for node_id, tables in restconf.iter_nodes(restconf.JsonReader(read)):
+            add(node_id, tables)
+            count += 1
+        return count
+    return consume
+
+def verify_flows(controller_ip, sw_range, output_file, workers=1):
+    names = ['ovs'+str(i) for i in range(int(sw_range[0]), int(sw_range[1])+1)]
+    start_time = time.time()
+    switches = list(run_parallel(collect_switch_tables, names, workers))
+    print("Read flows of %d switches in %.2f seconds." % (len(switches), time.time() - start_time))
+
+    # config flow ids first, so each operational node is checked as it streams in
+    check = restconf.InventoryCheck(switches)
+    rest_client = get_rest_client(controller_ip)
+    for datastore, path, add in (('config', restconf.CONFIG_NODES_PATH, check.add_config),
+                                 ('operational', restconf.OPERATIONAL_NODES_PATH, check.add_operational)):
+        start_time = time.time()
+        try:
+            status, result = rest_client.request_stream('GET', path, read_inventory_nodes(add))
+        except restconf.JsonError as e:
+            print("Failure: Could not parse the controller %s inventory: %s" % (datastore, e))
+            return -1
+        if status == 404:
+            # no node in the datastore yet
+            result = 0
+        elif status >= 300:
+            print("Failure: Reading the controller %s inventory returned HTTP %d: %s" % (datastore, status, result[:200]))
+            return -1
+        print("Read %d %s inventory nodes in %.2f seconds." % (result, datastore, time.time() - start_time))
 
-def dump_ovs(elem, sw_range, output_file):
-    filePath=None
+    f = None
     if output_file:
-        prefix = 'dump-%s-outfile-' % elem
-        filePath = get_outfile_path(prefix)
+        filePath = get_outfile_path('verify-flows-outfile-', '.jsonl')
+        f = open(filePath, 'w')
+    records = check.records()
+    for record in records:
+        if f is not None:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+        if record['ok']:
+            continue
+        if record['node'] is None:
+            print("%s: could not read its datapath id and flows." % record['switch'])
+            continue
+        problems = []
+        if not record['connected']:
+            problems.append('not in the operational inventory')
+        if record['not_installed']:
+            problems.append('%d flows not installed (%s%s)' % (
+                record['not_installed'], ', '.join(record['not_installed_ids']),
+                ', ...' if record['not_installed'] > len(record['not_installed_ids']) else ''))
+        for table, counts in sorted(record['table_mismatches'].items(), key=lambda item: int(item[0])):
+            problems.append('table %s %d operational and %d switch flows' % (table, counts['operational'], counts['switch']))
+        print("%s (%s): %s config, %s operational, %s switch flows; %s." % (
+            record['switch'], record['node'], record['config_flows'],
+            '-' if record['operational_flows'] is None else record['operational_flows'],
+            record['switch_flows'], '; '.join(problems)))
+
+    print("Verified flows of %d switches against the controller: %d consistent, %d not connected, "
+          "%d with flows not installed, %d with table count mismatches, %d unmanaged flows." %
+          (len(records),
+           len([record for record in records if record['ok']]),
+           len([record for record in records if not record['connected']]),
+           len([record for record in records if record['not_installed']]),
+           len([record for record in records if record['table_mismatches']]),
+           sum([record['unmanaged'] for record in records])))
+    if f is not None:
+        print("--verify-flows output is written into %s" % filePath)
+        f.close()
+    return 0
 
-    get_dump(elem, sw_range, filePath)
+def write_throughput_record(record, out):
+    if record['error'] is not None:
+        out.write("%s %s -> %s %s: FAILED, %s\n" % (record['src_switch'], record['src'],
+                                                   record['dst_switch'], record['dst'], record['error']))
+        return
+    line = "%s %s -> %s %s: %.3f Gbps" % (record['src_switch'], record['src'],
+                                          record['dst_switch'], record['dst'], record['gbps'])
+    if record['pps'] is not None:
+        line += ", %.0f pps, %.2f%% loss" % (record['pps'], record['loss_pct'])
+    if record.get('retransmits') is not None:
+        line += ", %d retransmits" % record['retransmits']
+    out.write(line + "\n")
+
+def throughput_test(sw_range, pairs_num=0, streams=1, proto='tcp', duration=10, mbps=0, tool='auto',
+                    output_file=False, workers=1):
+    names = ['ovs'+str(i) for i in range(int(sw_range[0]), int(sw_range[1])+1)]
+
+    def switch_ports(name):
+        return name, get_port_ips_from_ovs(name)
+
+    port_ips = dict(run_parallel(switch_ports, names, workers))
+    ports = [(name, get_switch_location(name)[0], ip) for name in names for ip in port_ips.get(name, [])]
+    pairs = throughput.pick_pairs(ports, pairs_num or len(names))
+    if not pairs:
+        print("ERROR: No VM ports on switches in different containers to transfer between, see --add-ports.")
+        return -1
+    try:
+        rc, available = get_docker_client().exec_run(pairs[0][0][1], throughput.DETECT_CMD)
+        tool, python = throughput.choose_tool(available, tool)
+    except (DockerError, ValueError) as e:
+        print("Failure: Could not find a transfer tool: %s" % e)
+        return -1
+
+    # every pair gets a port of its own, receivers per destination and senders per source container
+    servers = {}
+    clients = {}
+    for k, (src, dst) in enumerate(pairs):
+        port = throughput.DEFAULT_BASE_PORT + k
+        servers.setdefault(dst[1], []).append((dst[2], port))
+        clients.setdefault(src[1], []).append((src[2], dst[2], port))
+    print("Running %d %s transfers of %d seconds with %s, %d streams per pair." %
+          (len(pairs), proto.upper(), duration, tool, streams))
+
+    def start_servers(container):
+        cmd = throughput.build_server_script(tool, proto, servers[container], duration, streams, python)
+        return container, docker_exec_batch(container, [cmd])
+
+    for container, (rc, output) in run_parallel(start_servers, list(servers), workers):
+        if rc != 0:
+            print("Failure: Could not start receivers on %s: %s" % (container, output.strip()))
+
+    def run_clients(container):
+        cmd = throughput.build_client_script(tool, proto, clients[container], duration, streams, mbps, python)
+        return container, docker_exec_batch(container, [cmd])
+
+    if len(clients) > workers:
+        print("Only %d of %d source switches transfer at once, see --workers." % (workers, len(clients)))
+    results = {}
+    for container, (rc, output) in run_parallel(run_clients, list(clients), workers):
+        results.update(throughput.split_sections(output, '@@ PAIR '))
+
+    def collect_servers(container):
+        cmd = throughput.build_collect_script([port for ip, port in servers[container]], wait=tool == 'builtin')
+        return container, docker_exec_batch(container, [cmd])
+
+    server_results = {}
+    for container, (rc, output) in run_parallel(collect_servers, list(servers), workers):
+        server_results.update(throughput.split_sections(output, '@@ PORT '))
+
+    f = None
+    if output_file:
+        filePath = get_outfile_path('throughput-outfile-', '.jsonl')
+        f = open(filePath, 'w')
+    records = []
+    for k, (src, dst) in enumerate(pairs):
+        port = str(throughput.DEFAULT_BASE_PORT + k)
+        text = results.get((src[2], dst[2], port))
+        if text is None:
+            record = throughput.pair_record(src, dst, error='no result from %s' % src[1])
+        else:
+            try:
+                result = throughput.parse_result(tool, proto, text, server_results.get((port,), ''))
+                record = throughput.pair_record(src, dst, result)
+            except ValueError as e:
+                record = throughput.pair_record(src, dst, error=str(e))
+        records.append(record)
+        write_throughput_record(record, sys.stdout)
+        if f is not None:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    summary = throughput.summary(records)
+    line = ("Throughput summary: %d pairs, %d failed, %.3f Gbps aggregate" %
+            (summary['pairs'], summary['failed'], summary['gbps']))
+    if summary['pair_gbps_min'] is not None:
+        line += ", %.3f to %.3f Gbps per pair" % (summary['pair_gbps_min'], summary['pair_gbps_max'])
+    if summary['pps'] is not None:
+        line += ", %.0f pps, %.2f%% loss" % (summary['pps'], summary['loss_pct'])
+    print(line + ".")
+    if f is not None:
+        summary['summary'] = True
+        f.write(json.dumps(summary, sort_keys=True) + '\n')
+        print("--throughput output is written into %s" % filePath)
+        f.close()
+    return 0
 
-def cleanup(controller_ip):
+def dump_ovs(dump_keys, sw_range, output_file, workers=1, dump_format='text'):
+    filePaths = {}
+    if output_file:
+        ext = '.txt' if dump_format == 'text' else '.' + dump_format
+        for elem in dump_keys:
+            prefix = 'dump-%s-outfile-' % elem
+            filePaths[elem] = get_outfile_path(prefix, ext)
+
+    get_dump(dump_keys, sw_range, filePaths, workers, dump_format)
+
+def cleanup(controller_ip, workers=1, stop_timeout=10, fast=False):
     cont_count = int(get_container_count())
-    port_count = get_ports_count()
-    # Delete ovs ports and neutron ports
-    del_and_unbind_ports(port_count)
+    if not fast:
+        port_count = get_ports_count()
+        # Delete ovs ports and neutron ports
+        del_and_unbind_ports(port_count, workers)
 
     #delete neutron data 
     del_neutron_data(controller_ip)
 
-    # Stop switches and remove containers
-    docker_down(cont_count)
+    # Stop switches and remove containers, their ports go with them
+    docker_down(cont_count, workers, stop_timeout)
+    remove_pool(workers)
 
-    # Removes show-containers, dump, ping-all output files
-    cmd = 'rm -f /tmp/show-container-out*.txt  /tmp/dump-*.txt /tmp/ping*.txt'
+    # Removes show-containers, dump, ping-all, convergence, snapshot and throughput output files
+    cmd = ('rm -f /tmp/show-container-out*  /tmp/dump-*.txt /tmp/dump-*.jsonl /tmp/ping*.txt '
+           '/tmp/ping*.json /tmp/ping*.csv /tmp/convergence-outfile-*.json /tmp/flow-snapshot-diff-outfile-*.txt '
+           '/tmp/resources-outfile-*.json /tmp/trace-outfile-*.json /tmp/throughput-outfile-*.jsonl')
     system(cmd)
     print ('Removed output files from /tmp dir.')
      
 
-def get_outfile_path(fnamePrefix):
+def get_outfile_path(fnamePrefix, ext='.txt'):
     cmd = 'date +%F-%T'
-    dt = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+    dt = check_output(cmd)
     dt = dt.replace(':','-')
     dt = dt.strip('\n')
-    fname = '/tmp/' + fnamePrefix + dt + '.txt'
+    fname = '/tmp/' + fnamePrefix + dt + ext
  
     return fname
 
 def get_docker_image():
-    cmd = 'docker images  -q "*dockernet*" '
-    dock_img_id = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+    images = get_docker_client().images('*dockernet*')
+    dock_img_id = '\n'.join([image['Id'] for image in images])
 
     return dock_img_id
 
 def get_container_count():
-    cmd='docker ps -a | grep ovs | wc -l'
-    cont_count = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
-    cont_count = cont_count.strip('\n')
+    cont_count = str(len(get_ovs_names_list()))
 
     return cont_count
 
 def get_ports_count():
     ovs_list = get_ovs_names_list() 
+    if not ovs_list:
+        return 0
     cont_name = ovs_list[0]
     port_count = len(get_port_ips_from_ovs(cont_name))
 
     return port_count
 
-def show_containers_info(count, filePath):
+def inspect_container(container):
+    try:
+        return container, get_docker_client().inspect(container)
+    except DockerError as e:
+        return container, e
+
+def show_containers_info(count, filePath, workers=1, info_format='inspect', fields=None, unhealthy=False):
+    fields = fields or containerinfo.DEFAULT_FIELDS
+    locations = [('ovs' + str(i), get_switch_location('ovs' + str(i))[0]) for i in range(1, count+1)]
+    # one container list call answers the list fields of every switch
+    containers = dict((cont['Names'][0].lstrip('/'), cont) for cont in get_docker_client().ps(name='ovs'))
+    records = [containerinfo.list_record(name, container, containers.get(container))
+               for name, container in locations]
+
+    # inspect only for the full output or fields the list does not have, all containers in parallel
+    infos = {}
+    if info_format == 'inspect':
+        infos = dict(run_parallel(inspect_container, sorted(set([container for name, container in locations])),
+                                  workers))
+    elif containerinfo.needs_inspect(fields):
+        infos = dict(run_parallel(inspect_container, sorted(set([record['container'] for record in records
+                                                                 if record['id'] is not None])), workers))
+    now = time.time()
+    for record in records:
+        info = infos.get(record['container'])
+        if isinstance(info, dict):
+            containerinfo.add_inspect_fields(record, info, now)
+    if unhealthy:
+        records = [record for record in records if containerinfo.is_unhealthy(record)]
+
     f = None
     if filePath is not None:
         f = open(filePath,'w')
-     
-    for i in range(1, count+1):
-        container_name = 'ovs' + str(i)
-        cmd='docker inspect %s' % container_name
-        if filePath is None:
-            subprocess.call(cmd, stderr=subprocess.STDOUT, shell=True)
-        else:
-            subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT, shell=True)
+    out = f or sys.stdout
+    if info_format == 'inspect':
+        for record in records:
+            info = infos.get(record['container'])
+            if isinstance(info, dict):
+                out.write(json.dumps([info], indent=4) + '\n')
+            else:
+                out.write('Error: %s\n' % info)
+    elif info_format == 'table':
+        containerinfo.write_table(out, records, fields)
+    elif info_format == 'jsonl':
+        containerinfo.write_jsonl(out, records, fields)
+    else:
+        containerinfo.write_csv(out, records, fields)
 
-    if filePath is not None:
+    if unhealthy and (f is not None or info_format == 'table'):
+        print("%d of %d switches are missing, not running or unhealthy." % (len(records), len(locations)))
+    if f is not None:
         f.close()
         print("--show-containers-info output is written into %s" % filePath)
 
-def docker_ovs_run_connect(switch_count, controller_ip):
+def is_switch_ready(cont_name):
+    # ovsdb-server and ovs-vswitchd both answer on their control sockets once up
+    cmd = ['sh', '-c', 'ovs-appctl -t ovsdb-server version && ovs-appctl -t ovs-vswitchd version']
+    try:
+        rc, output = get_docker_client().exec_run(cont_name, cmd)
+    except DockerError as e:
+        return False
+
+    return rc == 0
+
+def wait_for_switch_ready(cont_name, timeout):
+    deadline = time.time() + timeout
+    while not is_switch_ready(cont_name):
+        if time.time() >= deadline:
+            return False
+        trace.sleep(READY_POLL_INTERVAL, cont_name)
+
+    return True
+
+def start_switch(container_name, dock_image_id, controller_ip, ready_timeout):
+    start_time = time.time()
+    try:
+        cont_id = get_docker_client().run(container_name, dock_image_id,
+                                          env=['MODE=tcp:%s' % controller_ip],
+                                          cap_add=['NET_ADMIN'])
+        get_inventory().add_switch(container_name, cont_id)
+    except DockerError as e:
+        sys.stderr.write('Error starting %s: %s\n' % (container_name, e))
+        return container_name, False, time.time() - start_time
+
+    ready = wait_for_switch_ready(container_name, ready_timeout)
+    if ready and cfg.CONF.ovsdb_transport == 'tcp':
+        rc, output = docker_exec_batch(container_name, [['ovs-vsctl'] + get_ovsdb_listener_args()])
+        if rc != 0:
+            sys.stderr.write('Error adding ovsdb listener to %s: %s' % (container_name, output))
+            ready = False
+    return container_name, ready, time.time() - start_time
+
+def get_pool_containers():
+    # (name, container id, running) of the warm pool containers, lowest number first
+    containers = []
+    for cont in get_docker_client().ps(name=pool.POOL_PREFIX):
+        name = cont['Names'][0].lstrip('/')
+        if pool.is_pool_name(name):
+            containers.append((pool.pool_number(name), name, cont['Id'], cont.get('State') == 'running'))
+    return [(name, cont_id, running) for num, name, cont_id, running in sorted(containers)]
+
+def remove_pool_container(name):
+    try:
+        get_docker_client().rm(name, force=True)
+    except DockerError as e:
+        pass
+
+    return name
+
+def start_pool_container(name, dock_image_id, ready_timeout, quiet=False):
+    start_time = time.time()
+    try:
+        # no MODE, the switch boots without a manager
+        get_docker_client().run(name, dock_image_id, cap_add=['NET_ADMIN'])
+    except DockerError as e:
+        if quiet:
+            LOG.warning('Error starting warm pool container %s: %s', name, e)
+        else:
+            sys.stderr.write('Error starting %s: %s\n' % (name, e))
+        return name, False, time.time() - start_time
+
+    ready = wait_for_switch_ready(name, ready_timeout)
+    if not ready:
+        # a half booted container is never claimed
+        remove_pool_container(name)
+    return name, ready, time.time() - start_time
+
+def fill_pool(size, workers=1, ready_timeout=60, quiet=False):
+    # boot pool containers until size of them run, returns the number started,
+    # quiet writes failures to the log only, for refills in the background
+    dock_image_ids = get_docker_image().split()
+    if not dock_image_ids:
+        if quiet:
+            LOG.warning("No docker image to run the warm pool containers.")
+        else:
+            print("Failure: No docker image to run the container.")
+        return 0
+
+    containers = get_pool_containers()
+    for name, cont_id, running in containers:
+        if not running:
+            remove_pool_container(name)
+    warm = [name for name, cont_id, running in containers if running]
+    names = pool.new_names(warm, size - len(warm))
+
+    def run_one(name):
+        return start_pool_container(name, dock_image_ids[0], ready_timeout, quiet)
+
+    wall_start = time.time()
+    started = 0
+    for name, ready, latency in run_parallel(run_one, names, workers):
+        if ready:
+            started += 1
+        elif quiet:
+            LOG.warning('Warm pool container %s is not ready after %.2f seconds.', name, latency)
+        else:
+            print ('Failure: warm pool container %s is not ready after %.2f seconds.' % (name, latency))
+    if not quiet:
+        print ('Added %d of %d containers to the warm pool in %.2f seconds, %d warm.' %
+               (started, len(names), time.time() - wall_start, len(warm) + started))
+
+    return started
+
+def get_pool_refiller():
+    global _pool_refiller
+    if _pool_refiller is None:
+        _pool_refiller = pool.Refiller()
+    return _pool_refiller
+
+def refill_pool(workers=1, ready_timeout=60):
+    # back to --pool-size warm containers, in the background in the daemon
+    size = cfg.CONF.pool_size
+    if not size:
+        return
+    if _in_daemon:
+        refiller = get_pool_refiller()
+        if refiller.error is not None:
+            print("Failure: Last warm pool refill failed: %s" % refiller.error)
+        refiller.request(lambda: refill_pool_in_background(size, workers, ready_timeout))
+        print("Refilling the warm pool to %d containers in the daemon." % size)
+        return
+    fill_pool(size, workers, ready_timeout)
+
+def refill_pool_in_background(size, workers, ready_timeout):
+    # no client is connected to the refiller thread, the daemon's log gets its diagnostics
+    try:
+        started = fill_pool(size, workers, ready_timeout, quiet=True)
+    except Exception as e:
+        LOG.exception("Warm pool refill failed.")
+        raise
+    LOG.info("Added %d containers to the warm pool.", started)
+
+def remove_pool(workers=1):
+    if _pool_refiller is not None:
+        _pool_refiller.cancel()
+    names = [name for name, cont_id, running in get_pool_containers()]
+    for name in run_parallel(remove_pool_container, names, workers):
+        pass
+    if names:
+        print ('Removed %d warm pool containers.' % len(names))
+
+def claim_switch(pool_name, cont_id, container_name, controller_ip, ready_timeout):
+    # the warm container becomes the switch, None when it got claimed meanwhile
+    start_time = time.time()
+    try:
+        get_docker_client().rename(pool_name, container_name)
+    except DockerError as e:
+        return None
+    get_inventory().add_switch(container_name, cont_id)
+
+    ready = wait_for_switch_ready(container_name, ready_timeout)
+    if ready:
+        # the manager target MODE sets when a switch boots connected
+        ovs_cmd = ['ovs-vsctl', 'set-manager', 'tcp:%s' % controller_ip]
+        if cfg.CONF.ovsdb_transport == 'tcp':
+            ovs_cmd += get_ovsdb_listener_args()
+        rc, output = docker_exec_batch(container_name, [ovs_cmd])
+        if rc != 0:
+            sys.stderr.write('Error connecting %s to the controller: %s' % (container_name, output))
+            ready = False
+    return container_name, ready, time.time() - start_time
+
+def get_switch_dpid(sw_num):
+    return 'd0d0%012x' % sw_num
+
+def start_switch_host(host_name, switch_names, dock_image_id, controller_ip, ready_timeout):
+    # density mode: one container, each switch a bridge with its own
+    # datapath-id and openflow connection, all added in one transaction
+    start_time = time.time()
+    try:
+        cont_id = get_docker_client().run(host_name, dock_image_id,
+                                          env=['MODE=tcp:%s' % controller_ip],
+                                          cap_add=['NET_ADMIN'])
+    except DockerError as e:
+        sys.stderr.write('Error starting %s: %s\n' % (host_name, e))
+        return host_name, switch_names, False, time.time() - start_time
+
+    ready = wait_for_switch_ready(host_name, ready_timeout)
+    if ready:
+        ovs_cmd = ['ovs-vsctl']
+        for name in switch_names:
+            ovs_cmd += ['--', '--may-exist', 'add-br', name,
+                        '--', 'set', 'Bridge', name, 'protocols=OpenFlow13',
+                        'other-config:datapath-id=%s' % get_switch_dpid(int(name[len('ovs'):])),
+                        '--', 'set-controller', name, 'tcp:%s:%d' % (controller_ip, OPENFLOW_PORT)]
+        if cfg.CONF.ovsdb_transport == 'tcp':
+            ovs_cmd += get_ovsdb_listener_args()
+        rc, output = docker_exec_batch(host_name, [ovs_cmd])
+        if rc != 0:
+            sys.stderr.write('Error adding bridges to %s: %s' % (host_name, output))
+            ready = False
+        else:
+            inventory = get_inventory()
+            for name in switch_names:
+                inventory.add_switch(name, cont_id, host_name)
+    return host_name, switch_names, ready, time.time() - start_time
+
+def docker_ovs_run_connect(switch_count, controller_ip, workers=1, ready_timeout=60, watcher=None,
+                           switches_per_container=1):
+    dock_image_ids = get_docker_image().split()
+    if not dock_image_ids:
+        print("Failure: No docker image to run the container.")
+        return
+    dock_image_id = dock_image_ids[0]
+
     running_cont=get_container_count()
     start=int(running_cont)+1
     end=switch_count+start
-    for i in range(start, end):
-        container_name = 'ovs' + str(i)
-        dock_image_id = get_docker_image()
-        if not dock_image_id:
+    container_names = ['ovs' + str(i) for i in range(start, end)]
+
+    if switches_per_container > 1:
+        docker_ovs_host_run_connect(container_names, dock_image_id, controller_ip,
+                                    switches_per_container, workers, ready_timeout, watcher)
+        return
+
+    # warm pool containers first, new containers for the rest
+    warm = [(name, cont_id) for name, cont_id, running in get_pool_containers() if running]
+    claims = dict(zip(container_names, warm))
+    claimed = []
+
+    def run_one(container_name):
+        start_time = time.time()
+        result = None
+        if container_name in claims:
+            pool_name, cont_id = claims[container_name]
+            result = claim_switch(pool_name, cont_id, container_name, controller_ip, ready_timeout)
+            if result is not None:
+                claimed.append(container_name)
+        if result is None:
+            result = start_switch(container_name, dock_image_id, controller_ip, ready_timeout)
+        if watcher is not None and result[1]:
+            watcher.track(container_name, start_time)
+        return result
+
+    wall_start = time.time()
+    latencies = []
+    for container_name, ready, latency in run_parallel(run_one, container_names, workers):
+        source = ' from the warm pool' if container_name in claimed else ''
+        if ready:
+            latencies.append(latency)
+            print ('Started docker container %s%s in %.2f seconds.' % (container_name, source, latency))
+        else:
+            print ('Failure: docker container %s%s is not ready after %.2f seconds.' % (container_name, source, latency))
+    wall_time = time.time() - wall_start
+
+    print ('Started %d of %d docker containers in %.2f seconds.' % (len(latencies), len(container_names), wall_time))
+    if claimed:
+        print ('Claimed %d of %d warm pool containers.' % (len(claimed), len(warm)))
+    if latencies:
+        print ('Switch start latency: min %.2f, avg %.2f, max %.2f seconds.' %
+               (min(latencies), sum(latencies) / len(latencies), max(latencies)))
+    refill_pool(workers, ready_timeout)
+
+
+def docker_ovs_host_run_connect(switch_names, dock_image_id, controller_ip, switches_per_container,
+                                workers=1, ready_timeout=60, watcher=None):
+    hosts = get_inventory().host_names()
+    next_host = max([int(host[len(DENSITY_HOST_PREFIX):]) for host in hosts] or [0]) + 1
+    host_switches = []
+    for i in range(0, len(switch_names), switches_per_container):
+        host_switches.append((DENSITY_HOST_PREFIX + str(next_host), switch_names[i:i+switches_per_container]))
+        next_host += 1
+
+    def run_one(item):
+        start_time = time.time()
+        result = start_switch_host(item[0], item[1], dock_image_id, controller_ip, ready_timeout)
+        if watcher is not None and result[2]:
+            for name in item[1]:
+                watcher.track(name, start_time)
+        return result
+
+    wall_start = time.time()
+    started = 0
+    for host_name, names, ready, latency in run_parallel(run_one, host_switches, workers):
+        if ready:
+            started += len(names)
+            print ('Started docker container %s with switches %s in %.2f seconds.' % (host_name, ','.join(names), latency))
+        else:
+            print ('Failure: docker container %s is not ready after %.2f seconds.' % (host_name, latency))
+    wall_time = time.time() - wall_start
+
+    print ('Started %d of %d switches in %d docker containers in %.2f seconds.' %
+           (started, len(switch_names), len(host_switches), wall_time))
+
+def poll_switch_convergence(cont_name):
+    # flow count None when the flows could not be dumped, that is not a switch without flows
+    container, bridge = get_switch_location(cont_name)
+    try:
+        rc, output = get_docker_client().exec_run(container, get_dump_cmd(['ovs-show', 'flow-count'], bridge))
+    except DockerError as e:
+        return cont_name, False, None
+    sections = split_dump_output(output)
+    connected = convergence.parse_ovs_show_connected(sections.get('ovs-show', ''),
+                                                     None if container == cont_name else bridge)
+    # dump-flows runs last, its status is the script's
+    flow_output = sections.get('flows')
+    if rc != 0 or flow_output is None or flow_output.startswith('ovs-ofctl:'):
+        return cont_name, connected, None
+
+    return cont_name, connected, len(flows.parse_flows(flow_output))
+
+def start_convergence_watcher(conf):
+    def poll_all(names):
+        return run_parallel(poll_switch_convergence, names, conf.workers)
+
+    watcher = convergence.ConvergenceWatcher(poll_all, conf.convergence_interval,
+                                             conf.convergence_stable_polls,
+                                             conf.convergence_timeout)
+    watcher.start()
+    return watcher
+
+def report_convergence(watcher):
+    print("Waiting for switches to connect and flows to stabilize...")
+    watcher.finish()
+    summary = watcher.summary()
+    for key, label in (('time_to_connect', 'Time to connect'), ('time_to_flows', 'Time to flows')):
+        stats = summary[key]
+        if not stats['count']:
+            print("%s: no switch converged." % label)
+            continue
+        print("%s (%d of %d switches): p50 %.2f, p95 %.2f, p99 %.2f, max %.2f seconds." %
+              (label, stats['count'], summary['switches'], stats['p50'], stats['p95'], stats['p99'], stats['max']))
+    if summary['zero_flow_switches']:
+        print("%d switches converged with no flows." % summary['zero_flow_switches'])
+
+    filePath = get_outfile_path('convergence-outfile-', '.json')
+    f = open(filePath, 'w')
+    watcher.write_json(f)
+    f.close()
+    print("Convergence time series is written into %s" % filePath)
+
+def start_resource_sampler(conf):
+    # sampling runs in this process, reading the switches known to the inventory
+    sampler = resources.ResourceSampler(get_inventory().switch_ids, conf.sample_interval, conf.cgroup_root)
+    sampler.start()
+    return sampler
+
+def report_resources(sampler):
+    sampler.finish()
+    summary = sampler.summary()
+    if summary['missing_switches']:
+        print("Resource usage: no cgroup found for %d switches, they run on another host or cgroup root." %
+              summary['missing_switches'])
+    if summary['switches']:
+        print("Resource usage (%d switches, %d samples): cpu avg %s%%, max %s%%, memory peak %.1f MiB, %.1f MiB per switch." %
+              (summary['switches'], summary['samples'], summary['cpu_pct_avg'], summary['cpu_pct_max'],
+               summary['mem_bytes_peak'] / 1048576.0, (summary['mem_bytes_per_switch_at_peak'] or 0) / 1048576.0))
+
+    filePath = get_outfile_path('resources-outfile-', '.json')
+    f = open(filePath, 'w')
+    sampler.write_json(f)
+    f.close()
+    print("Resource usage time series is written into %s" % filePath)
+
+def apply_topology(spec, output_file=False, workers=1, ready_timeout=60,
+                   ping_format='text', ping_count=2, ping_parallelism=64):
+    controller_ip = spec['controller_ip']
+    sw_count = spec['switches']
+    ports_num = spec['ports_per_switch']
+    sw_range = ['1', str(sw_count)]
+    if ports_num and not check_port_allocation(sw_count, ports_num):
+        return
+    existing = set(get_ovs_names_list())
+    graph = topology.TaskGraph()
+
+    dock_image_id = None
+    if len(existing) < sw_count:
+        dock_image_ids = get_docker_image().split()
+        if not dock_image_ids:
             print("Failure: No docker image to run the container.")
             return
+        dock_image_id = dock_image_ids[0]
+
+    if spec['network']:
+        def network_step():
+            if not create_network(controller_ip):
+                raise topology.TaskError('network create request failed')
+        graph.add('network', network_step)
+    if spec['subnet']:
+        def subnet_step():
+            if not create_subnet(controller_ip):
+                raise topology.TaskError('subnet create request failed')
+        graph.add('subnet', subnet_step, ['network'])
+
+    if spec['bind_ports']:
+        network_id = get_network_id()
+        subnet_id = get_subnet_id()
+        port_template = load_port_template()
+        rest_client = get_rest_client(controller_ip)
+        rest_lock = threading.Lock()
+
+    def start_step(cont_name):
+        if cont_name in existing:
+            return
+        cont_name, ready, latency = start_switch(cont_name, dock_image_id, controller_ip, ready_timeout)
+        if not ready:
+            raise topology.TaskError('not ready after %.2f seconds' % latency)
 
-        cmd='docker run --name %s -e MODE=tcp:%s -itd --cap-add NET_ADMIN %s ' % ( container_name, controller_ip, dock_image_id )
-        system(cmd)
-        time.sleep(10)
-        print ('Started docker container %s.' % container_name)
+    def ports_step(cont_name, sw_num):
+        ports = get_inventory().ports(cont_name) or {}
+        if all([i in ports for i in range(1,ports_num+1)]):
+            return
+        cont_name, rc, output = add_switch_ports(cont_name, sw_num, ports_num)
+        sys.stdout.write(output)
+        if rc != 0:
+            raise topology.TaskError('adding ports returned %d' % rc)
+
+    def bind_step(cont_name, sw_num):
+        ports = get_inventory().ports(cont_name) or {}
+        if all(['neutron_id' in ports.get(i, {}) for i in range(1,ports_num+1)]):
+            return
+        payloads = get_switch_port_payloads(port_template, cont_name, sw_num, ports_num, network_id, subnet_id)
+        # one keep-alive connection shared by all switches
+        with rest_lock:
+            if not post_neutron_ports(rest_client, [(cont_name, i, payload) for i, payload in payloads]):
+                raise topology.TaskError('neutron port create request failed')
+
+    # every switch runs its own start -> ports -> bind pipeline
+    last_steps = []
+    for j in range(1,sw_count+1):
+        cont_name = 'ovs'+str(j)
+        step = graph.add('start:'+cont_name, lambda cont_name=cont_name: start_step(cont_name))
+        if ports_num:
+            step = graph.add('ports:'+cont_name, lambda cont_name=cont_name, j=j: ports_step(cont_name, j), [step])
+        if spec['bind_ports']:
+            step = graph.add('bind:'+cont_name, lambda cont_name=cont_name, j=j: bind_step(cont_name, j), [step, 'subnet'])
+        last_steps.append(step)
+
+    # verification needs the whole testbed in place
+    if 'ping-all' in spec['verify']:
+        graph.add('ping-ips-file', lambda: create_ping_ips_file(sw_range), last_steps)
+        graph.add('verify:ping-all',
+                  lambda: ping_ips_from_file(sw_range, output_file, workers, ping_format, ping_count, ping_parallelism),
+                  ['ping-ips-file'])
+    for dump_key in ('flow-count', 'ovs-show'):
+        if dump_key in spec['verify']:
+            graph.add('verify:'+dump_key,
+                      lambda dump_key=dump_key: dump_ovs([dump_key], sw_range, output_file, workers),
+                      last_steps)
+
+    def report_step(task):
+        if task.state == topology.DONE:
+            print("Step %s done in %.2f seconds." % (task.name, task.duration))
+        elif task.state == topology.FAILED:
+            print("Failure: Step %s failed after %.2f seconds: %s" % (task.name, task.duration, task.error))
+        else:
+            print("Step %s skipped." % task.name)
+
+    wall_start = time.time()
+    graph.run(workers, report_step)
+
+    summary = graph.summary()
+    print("Applied topology: %d steps done, %d failed, %d skipped in %.2f seconds." %
+          (summary[topology.DONE], summary[topology.FAILED], summary[topology.SKIPPED], time.time() - wall_start))
+
+def write_churn_record(record, out):
+    def seconds(value):
+        return '-' if value is None else '%.2f' % value
+
+    out.write("%7.1fs: %.1f ops/s of %.1f target, %d done, %d failed (%.1f%% errors), %d skipped\n" %
+              (record['t'], record['achieved_rate'], record['target_rate'], record['done'],
+               record['failed'], 100 * record['error_rate'], record['skipped']))
+    for name in CHURN_OPERATIONS:
+        op = record['ops'].get(name)
+        if op is None:
+            continue
+        out.write("    %-11s %6d done, %5d failed, %5d skipped, latency p50 %s p95 %s p99 %s max %s seconds\n" %
+                  (name, op['done'], op['failed'], op['skipped'],
+                   seconds(op['p50']), seconds(op['p95']), seconds(op['p99']), seconds(op['max'])))
+        for error in op['errors']:
+            out.write("    %-11s error: %s\n" % (name, error))
+    out.flush()
+
+def churn_testbed(controller_ip, mix, rate, burst=1, duration=60, interval=5.0, workers=1,
+                  output_file=False, ready_timeout=60, stop_timeout=10):
+    try:
+        mix = churn.parse_mix(mix, CHURN_OPERATIONS)
+    except ValueError as e:
+        print("ERROR: %s." % e)
+        return -1
+    churned = set([name for name, weight in mix if weight > 0])
+    inventory = get_inventory()
+    port_allocator = get_port_allocator()
+    # del-switch only removes switches added on top of the testbed
+    base_count = len(get_ovs_names_list())
+    if not check_port_allocation(base_count, 1):
+        return -1
+    if 'bind-port' in churned:
+        network_id = get_network_id()
+        subnet_id = get_subnet_id()
+        port_template = load_port_template()
+    if 'add-switch' in churned:
+        dock_image_ids = get_docker_image().split()
+        if not dock_image_ids:
+            print("Failure: No docker image to run the container.")
+            return -1
+        dock_image_id = dock_image_ids[0]
+
+    lock = threading.Lock()
+    # switches an operation runs on, and numbers of switches being added
+    busy = set()
+    adding = set()
+    picker = random.Random()
+    local = threading.local()
+    rest_clients = []
+
+    def rest_client():
+        # one keep-alive connection per churn worker
+        client = getattr(local, 'rest_client', None)
+        if client is None:
+            client = local.rest_client = RestClient(controller_ip)
+            rest_clients.append(client)
+        return client
+
+    def switch_nums():
+        return [int(name[len('ovs'):]) for name in get_ovs_names_list()]
+
+    def claim_port(want):
+        # (switch, switch number, port number) of a random port whose attributes,
+        # None when it does not exist, satisfy want, the switch stays busy until released
+        with lock:
+            names = [name for name in get_ovs_names_list() if name not in busy]
+            for name in picker.sample(names, min(len(names), CHURN_PICK_ATTEMPTS)):
+                ports = inventory.ports(name) or {}
+                port_nums = [i for i in range(1,port_allocator.ports_per_switch+1) if want(ports.get(i))]
+                if port_nums:
+                    busy.add(name)
+                    return name, int(name[len('ovs'):]), picker.choice(port_nums)
+        return None
+
+    def release(name):
+        with lock:
+            busy.discard(name)
+
+    def unbind(name, port_num, neutron_id):
+        status, data = rest_client().request('DELETE', '%s/%s' % (NEUTRON_PORTS_PATH, neutron_id))
+        if status >= 300 and status != 404:
+            raise churn.ChurnError('deleting neutron port of %s port %d returned HTTP %d' % (name, port_num, status))
+        inventory.set_port(name, port_num, neutron_id=None)
+
+    def add_port():
+        claimed = claim_port(lambda port: port is None)
+        if claimed is None:
+            return None
+        name, sw_num, port_num = claimed
+        try:
+            cont_name, rc, output = add_switch_ports(name, sw_num, 1, port_num)
+            if rc != 0:
+                raise churn.ChurnError('adding port %d to %s returned %d' % (port_num, name, rc))
+            return True
+        finally:
+            release(name)
+
+    def del_port():
+        claimed = claim_port(lambda port: port is not None)
+        if claimed is None:
+            return None
+        name, sw_num, port_num = claimed
+        try:
+            neutron_id = inventory.ports(name)[port_num].get('neutron_id')
+            if neutron_id:
+                unbind(name, port_num, neutron_id)
+            cont_name, rc, output = del_switch_ports(name, sw_num, 1, port_num)
+            if rc != 0:
+                raise churn.ChurnError('deleting port %d from %s returned %d' % (port_num, name, rc))
+            return True
+        finally:
+            release(name)
+
+    def bind_port():
+        claimed = claim_port(lambda port: port is not None and not port.get('neutron_id'))
+        if claimed is None:
+            return None
+        name, sw_num, port_num = claimed
+        try:
+            payloads = get_switch_port_payloads(port_template, name, sw_num, 1, network_id, subnet_id, port_num)
+            payload = payloads[0][1]
+            status, data = rest_client().request('POST', NEUTRON_PORTS_PATH, {'ports': [payload]})
+            if status >= 300:
+                raise churn.ChurnError('creating neutron port of %s port %d returned HTTP %d' % (name, port_num, status))
+            inventory.set_port(name, port_num, neutron_id=payload['id'])
+            return True
+        finally:
+            release(name)
+
+    def unbind_port():
+        claimed = claim_port(lambda port: port is not None and port.get('neutron_id'))
+        if claimed is None:
+            return None
+        name, sw_num, port_num = claimed
+        try:
+            unbind(name, port_num, inventory.ports(name)[port_num]['neutron_id'])
+            return True
+        finally:
+            release(name)
+
+    def add_switch():
+        # switches are numbered without gaps, so new ones go on top
+        with lock:
+            sw_num = max(switch_nums() + list(adding) + [0]) + 1
+            name = 'ovs'+str(sw_num)
+            adding.add(sw_num)
+            busy.add(name)
+        try:
+            cont_name, ready, latency = start_switch(name, dock_image_id, controller_ip, ready_timeout)
+            if not ready:
+                raise churn.ChurnError('%s is not ready after %.2f seconds' % (name, latency))
+            return True
+        finally:
+            with lock:
+                adding.discard(sw_num)
+                busy.discard(name)
+
+    def del_switch():
+        # the top switch, when it was added by churn and is not being added to
+        with lock:
+            sw_nums = switch_nums()
+            if adding or not sw_nums or max(sw_nums) <= base_count:
+                return None
+            name = 'ovs'+str(max(sw_nums))
+            if name in busy:
+                return None
+            busy.add(name)
+        try:
+            for port_num, port in sorted((inventory.ports(name) or {}).items()):
+                if port.get('neutron_id'):
+                    unbind(name, port_num, port['neutron_id'])
+            stop_switch(name, stop_timeout)
+            return True
+        finally:
+            release(name)
+
+    operations = {'add-port': add_port,
+                  'del-port': del_port,
+                  'bind-port': bind_port,
+                  'unbind-port': unbind_port,
+                  'add-switch': add_switch,
+                  'del-switch': del_switch}
+    churner = churn.Churn(operations, mix, rate, burst, workers)
 
+    f = None
+    if output_file:
+        filePath = get_outfile_path('churn-outfile-', '.jsonl')
+        f = open(filePath, 'w')
+
+    def report_churn():
+        # the operations still finishing when the run ends are only in the summary
+        while not churner.wait_stopped(interval):
+            record = churner.report()
+            inventory.save()
+            write_churn_record(record, sys.stdout)
+            if f is not None:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+                f.flush()
+
+    print("Churning %s at %.1f operations/s with %d workers on %d switches%s." %
+          (','.join(['%s:%g' % item for item in mix]), rate, workers, base_count,
+           ' for %d seconds' % duration if duration else ''))
+    reporter = threading.Thread(target=daemon.inherit_output(report_churn))
+    reporter.daemon = True
+    reporter.start()
+    churner.run(duration)
+    reporter.join()
+    for client in rest_clients:
+        client.close()
+
+    summary = churner.summary()
+    print("Churn summary of %d operations:" % (summary['done'] + summary['failed']))
+    summary['summary'] = True
+    write_churn_record(summary, sys.stdout)
+    if f is not None:
+        f.write(json.dumps(summary, sort_keys=True) + '\n')
+        f.close()
+        print("--churn output is written into %s" % filePath)
+    return 0
 
 def get_ovs_names_list():
-    cmd='docker ps -a --filter "name=ovs" --format "{{.Names}}" | sort'
-    retval = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
-    ovs_list=list(retval.split("\n"))
-    ovs_list.remove('')
+    ovs_list = get_inventory().switch_names()
 
     return ovs_list
 
-def docker_down(end):
+def stop_host_switch(cont_name, host_name, stop_timeout):
+    # density mode: drop the bridge and its vm ports, the host container
+    # goes with its last switch
+    inventory = get_inventory()
+    ports = inventory.ports(cont_name) or {}
+    cmds = []
+    if cfg.CONF.ovsdb_transport == 'exec':
+        cmds.append(['ovs-vsctl', '--', '--if-exists', 'del-br', cont_name])
+    else:
+        ovsdb_commit(host_name, lambda client: ovsdb.del_bridge_ops(client, cont_name))
+    vm_ports = [port['vm'] for port in ports.values() if 'vm' in port]
+    if vm_ports:
+        cmds.append(ip_batch_cmd(['link delete %s' % vm_port for vm_port in vm_ports]))
+    if cmds:
+        docker_exec_batch(host_name, cmds)
+    inventory.remove_switch(cont_name)
+    if not inventory.switches_in(host_name):
+        try:
+            get_docker_client().stop(host_name, stop_timeout)
+        except DockerError as e:
+            pass
+        try:
+            get_docker_client().rm(host_name, force=True)
+        except DockerError as e:
+            pass
+
+    return cont_name
+
+def stop_switch(container_name, stop_timeout):
+    host_name = get_inventory().container_of(container_name)
+    if host_name is not None:
+        return stop_host_switch(container_name, host_name, stop_timeout)
+
+    # Remove local-ip to remove tunnels from ODL, then disconnect openflow
+    # and ovsdb channels, all in one ovsdb transaction. A missing br-int must
+    # not abort it, the manager is still removed then
+    if cfg.CONF.ovsdb_transport == 'exec':
+        docker_exec_batch(container_name, [['ovs-vsctl',
+                                            '--', 'remove', 'Open_vSwitch', '.', 'other_config', 'local_ip',
+                                            '--', '--if-exists', 'clear', 'Bridge', 'br-int', 'controller',
+                                            '--', 'del-manager']])
+    else:
+        # the container goes away next, no need to wait for ovs-vswitchd
+        ovsdb_commit(container_name, lambda client: ovsdb.disconnect_ops('br-int'), wait=False)
+    # Stop container and suppress cmd result
+    try:
+        get_docker_client().stop(container_name, stop_timeout)
+    except DockerError as e:
+        pass
+    # Remove container and suppress cmd result
+    try:
+        get_docker_client().rm(container_name, force=True)
+    except DockerError as e:
+        pass
+    get_inventory().remove_switch(container_name)
+
+    return container_name
+
+def docker_down(end, workers=1, stop_timeout=10):
     ovs_list = get_ovs_names_list() 
-    for i in range(0, end):
-        #container_name = 'ovs' + str(i)
-        container_name = ovs_list[i]
-        # Remove local-ip to remove tunnels from ODL
-        system('docker exec %s ovs-vsctl remove Open_vSwitch . other_config local_ip' % container_name)
-        time.sleep(2)
-        # Disconnect openflow channel
-        system('docker exec %s ovs-vsctl del-controller br-int' % container_name )
-        # Disconnect ovsdb channel
-        system('docker exec %s ovs-vsctl del-manager' % container_name )
-        # Stop container and suppress cmd result
-        system(('docker stop %s' % container_name) + ' >/dev/null 2>&1')
-        # Remove container and suppress cmd result
-        system(('docker rm -f %s' % container_name ) + ' >/dev/null 2>&1')
+    wall_start = time.time()
+
+    def stop_one(container_name):
+        return stop_switch(container_name, stop_timeout)
 
+    for container_name in run_parallel(stop_one, ovs_list[:end], workers):
         print ('Stopped docker container %s.' % container_name)
 
+    wall_time = time.time() - wall_start
+    stopped = len(ovs_list[:end])
+    print ('Stopped %d docker containers in %.2f seconds (%.2f switches/second).' %
+           (stopped, wall_time, stopped / wall_time if wall_time > 0 else 0))
@@ -0,0 +1,135 @@
+"""
+Compact per switch container records for --show-containers-info.
+
+One docker container list call answers the list fields for every
+container at once; only fields the list does not carry (pid, start time,
+restart count, memory limit) need a docker inspect per container.
+"""
+
+import calendar
+import csv
+import json
+import re
+import time
+
+
+# in column order
+FIELDS = ('switch', 'container', 'id', 'state', 'health', 'status', 'ip', 'pid',
+          'uptime', 'started_at', 'restart_count', 'memory_limit')
+# answered by the container list call
+LIST_FIELDS = ('switch', 'container', 'id', 'state', 'health', 'status', 'ip')
+DEFAULT_FIELDS = ['switch', 'state', 'health', 'ip', 'status']
+FORMATS = ('inspect', 'table', 'jsonl', 'csv')
+HEALTH_RE = re.compile(r'\((healthy|unhealthy|health: starting)\)')
+# docker reports a container that never started with this time
+ZERO_TIME = '0001-01-01T00:00:00Z'
+
+
+def check_fields(fields):
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError('unknown field %s, expected %s' % (','.join(unknown), ','.join(FIELDS)))
+
+
+def needs_inspect(fields):
+    return len([field for field in fields if field not in LIST_FIELDS]) > 0
+
+
+def container_ip(network_settings):
+    if not network_settings:
+        return None
+    ips = [network.get('IPAddress') for name, network in sorted((network_settings.get('Networks') or {}).items())]
+    ips = [ip for ip in ips if ip] or [network_settings.get('IPAddress')]
+    return ips[0] or None
+
+
+def parse_time(value):
+    # epoch seconds of a docker RFC 3339 time, None for an unset one
+    if not value or value == ZERO_TIME:
+        return None
+    try:
+        return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+    except ValueError:
+        return None
+
+
+def list_record(switch, container, cont):
+    # record of a switch from its container list entry, None when there is no container
+    if cont is None:
+        return {'switch': switch, 'container': container, 'id': None, 'state': 'missing',
+                'health': None, 'status': None, 'ip': None}
+    match = HEALTH_RE.search(cont.get('Status') or '')
+    return {'switch': switch,
+            'container': container,
+            'id': cont['Id'][:12],
+            'state': cont.get('State'),
+            'health': match.group(1).replace('health: ', '') if match else None,
+            'status': cont.get('Status'),
+            'ip': container_ip(cont.get('NetworkSettings'))}
+
+
+def add_inspect_fields(record, info, now=None):
+    state = info.get('State') or {}
+    started = parse_time(state.get('StartedAt'))
+    if now is None:
+        now = time.time()
+    record['pid'] = state.get('Pid') or None
+    record['started_at'] = state.get('StartedAt') if started is not None else None
+    record['uptime'] = int(now - started) if started is not None and state.get('Running') else None
+    record['restart_count'] = info.get('RestartCount')
+    # 0 is docker's unlimited
+    record['memory_limit'] = (info.get('HostConfig') or {}).get('Memory') or None
+    health = state.get('Health')
+    if health:
+        record['health'] = health.get('Status')
+    if record.get('ip') is None:
+        record['ip'] = container_ip(info.get('NetworkSettings'))
+    return record
+
+
+def is_unhealthy(record):
+    # missing, stopped, or failing its health check
+    return record['state'] != 'running' or record.get('health') == 'unhealthy'
+
+
+def format_uptime(seconds):
+    if seconds is None:
+        return '-'
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return '%dd%02dh' % (days, hours)
+    if hours:
+        return '%dh%02dm' % (hours, minutes)
+    return '%dm%02ds' % (minutes, seconds)
+
+
+def format_value(field, value):
+    if value is None:
+        return '-'
+    if field == 'uptime':
+        return format_uptime(value)
+    if field == 'memory_limit':
+        return '%dM' % (value // 1048576)
+    return str(value)
+
+
+def write_table(f, records, fields):
+    rows = [[field.upper() for field in fields]]
+    rows.extend([[format_value(field, record.get(field)) for field in fields] for record in records])
+    widths = [max([len(row[i]) for row in rows]) for i in range(len(fields))]
+    for row in rows:
+        f.write('  '.join([value.ljust(width) for value, width in zip(row, widths)]).rstrip() + '\n')
+
+
+def write_jsonl(f, records, fields):
+    for record in records:
+        f.write(json.dumps(dict((field, record.get(field)) for field in fields), sort_keys=True) + '\n')
+
+
+def write_csv(f, records, fields):
+    writer = csv.writer(f)
+    writer.writerow(fields)
+    for record in records:
+        writer.writerow(['' if record.get(field) is None else record.get(field) for field in fields])
@@ -0,0 +1,171 @@
+"""
+Controller convergence measurement.
+
+Switches are polled for their ovsdb manager / openflow controller
+connection state and flow count. For every switch the time from its
+start (or port change) until it was connected and until its flow count
+stopped changing is recorded, together with a testbed-wide time series.
+"""
+
+import json
+import math
+import threading
+import time
+
+from dockernet import trace
+
+
+def parse_ovs_show_connected(output, bridge=None):
+    # True when the manager and every controller (of bridge, when given)
+    # report is_connected: true
+    manager = None
+    controllers = []
+    current = None
+    current_bridge = None
+    for line in output.split('\n'):
+        line = line.strip()
+        if line.startswith('Manager '):
+            current = 'manager'
+            manager = False
+        elif line.startswith('Controller '):
+            current = None
+            if bridge is None or current_bridge == bridge:
+                current = len(controllers)
+                controllers.append(False)
+        elif line.startswith('is_connected:') and current is not None:
+            connected = line.split(':', 1)[1].strip() == 'true'
+            if current == 'manager':
+                manager = connected
+            else:
+                controllers[current] = connected
+        elif line.startswith('Bridge ') or line.startswith('Port '):
+            current = None
+            if line.startswith('Bridge '):
+                current_bridge = line[len('Bridge '):].strip('"')
+
+    return bool(manager) and bool(controllers) and all(controllers)
+
+
+def percentile(values, pct):
+    # nearest-rank percentile
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class SwitchConvergence(object):
+    def __init__(self, name, start_time):
+        self.name = name
+        self.start_time = start_time
+        self.connected_at = None
+        self.stable_at = None
+        self.flow_count = None
+        self.count_since = None
+        self.stable_polls = 0
+
+    def converged(self):
+        return self.connected_at is not None and self.stable_at is not None
+
+    def update(self, now, connected, flow_count, stable_polls):
+        # flow_count is None when the switch could not be polled
+        if connected and self.connected_at is None:
+            self.connected_at = now
+        if flow_count != self.flow_count:
+            self.flow_count = flow_count
+            self.count_since = now
+            self.stable_polls = 0
+        elif self.connected_at is None or flow_count is None:
+            # an unconnected switch's count says nothing about the controller yet
+            self.stable_polls = 0
+        else:
+            self.stable_polls += 1
+        # any count counts once stable, a switch may legitimately have no flows
+        if self.stable_at is None and self.stable_polls >= stable_polls:
+            self.stable_at = max(self.count_since, self.connected_at)
+
+    def record(self):
+        return {'switch': self.name,
+                'time_to_connect': None if self.connected_at is None else self.connected_at - self.start_time,
+                'time_to_flows': None if self.stable_at is None else self.stable_at - self.start_time,
+                'flow_count': self.flow_count}
+
+
+class ConvergenceWatcher(object):
+    def __init__(self, poll_all, interval=1.0, stable_polls=3, timeout=300):
+        # poll_all(names) yields (name, connected, flow_count) for each name
+        self.poll_all = poll_all
+        self.interval = interval
+        self.stable_polls = stable_polls
+        self.timeout = timeout
+        self.switches = {}
+        self.series = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self._watch_start = None
+
+    def track(self, name, start_time=None):
+        with self._lock:
+            self.switches[name] = SwitchConvergence(name, start_time or time.time())
+
+    def start(self):
+        self._watch_start = time.time()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def finish(self):
+        # no more switches will be tracked, wait for them to converge or time out
+        deadline = time.time() + self.timeout
+        while time.time() < deadline and not self._all_converged():
+            trace.sleep(self.interval, 'convergence')
+        self._done.set()
+        self._thread.join()
+
+    def _all_converged(self):
+        with self._lock:
+            return all([sw.converged() for sw in self.switches.values()])
+
+    def _run(self):
+        while not self._done.is_set():
+            poll_start = time.time()
+            with self._lock:
+                pending = [name for name, sw in self.switches.items() if not sw.converged()]
+            for name, connected, flow_count in self.poll_all(pending):
+                now = time.time()
+                with self._lock:
+                    self.switches[name].update(now, connected, flow_count, self.stable_polls)
+            self._sample(time.time())
+            self._done.wait(max(0, self.interval - (time.time() - poll_start)))
+
+    def _sample(self, now):
+        with self._lock:
+            switches = list(self.switches.values())
+        self.series.append({'t': round(now - self._watch_start, 3),
+                            'switches': len(switches),
+                            'connected': len([sw for sw in switches if sw.connected_at is not None]),
+                            'flows_stable': len([sw for sw in switches if sw.stable_at is not None]),
+                            'flow_count': sum([sw.flow_count or 0 for sw in switches])})
+
+    def summary(self):
+        records = [sw.record() for sw in sorted(self.switches.values(), key=lambda sw: sw.name)]
+        result = {'switches': len(records),
+                  # converged without a single flow, worth a look when the controller should program them
+                  'zero_flow_switches': len([rec for rec in records
+                                             if rec['time_to_flows'] is not None and rec['flow_count'] == 0])}
+        for key in ('time_to_connect', 'time_to_flows'):
+            values = [rec[key] for rec in records if rec[key] is not None]
+            result[key] = {'count': len(values),
+                           'p50': percentile(values, 50),
+                           'p95': percentile(values, 95),
+                           'p99': percentile(values, 99),
+                           'max': max(values) if values else None}
+        return result
+
+    def write_json(self, f):
+        json.dump({'summary': self.summary(),
+                   'switches': [sw.record() for sw in sorted(self.switches.values(), key=lambda sw: sw.name)],
+                   'series': self.series}, f, indent=2)
+        f.write('\n')
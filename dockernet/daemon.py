@@ -0,0 +1,241 @@
+"""
+Local UNIX socket protocol between the dockernet daemon and its thin client.
+
+The client sends one JSON line with the command arguments and working
+directory. The daemon runs one command at a time. What the command thread,
+and the worker threads it hands output to, write to sys.stdout and
+sys.stderr is streamed back in frames of a one byte stream type and a four
+byte length, ending with an exit status frame. Background threads of the
+daemon keep writing to the daemon's own streams.
+"""
+
+import errno
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import traceback
+
+
+DEFAULT_DAEMON_SOCKET = '/tmp/dockernet.sock'
+STREAM_OUTPUT = 1
+STREAM_EXIT = 3
+FRAME_HEADER = struct.Struct('>BxxxI')
+READ_SIZE = 65536
+
+
+def write_frame(sock, stream, data):
+    sock.sendall(FRAME_HEADER.pack(stream, len(data)) + data)
+
+
+def recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_frames(sock):
+    while True:
+        header = recv_exact(sock, FRAME_HEADER.size)
+        if header is None:
+            return
+        stream, length = FRAME_HEADER.unpack(header)
+        data = recv_exact(sock, length)
+        if data is None:
+            return
+        yield stream, data
+
+
+def connect(socket_path):
+    # connected socket, None when no daemon listens on socket_path
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error as e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return sock
+
+
+def forward(socket_path, args, cwd, out):
+    # run args in the daemon writing its output to out, exit status or None without a daemon
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+    out = getattr(out, 'buffer', out)
+    try:
+        request = json.dumps({'args': list(args), 'cwd': cwd}) + '\n'
+        sock.sendall(request.encode('utf-8'))
+        for stream, data in read_frames(sock):
+            if stream == STREAM_EXIT:
+                return int(data.decode('ascii'))
+            out.write(data)
+            out.flush()
+    finally:
+        sock.close()
+    out.write(b'ERROR: dockernet daemon closed the connection before the command finished.\n')
+    return -1
+
+
+_output = threading.local()
+
+
+def bind_output(stream):
+    # sys.stdout and sys.stderr of the calling thread write to stream, None unbinds
+    _output.stream = stream
+
+
+def bound_output():
+    return getattr(_output, 'stream', None)
+
+
+def inherit_output(func):
+    # func run by another thread writes where the calling thread writes
+    stream = bound_output()
+
+    def run(*args, **kwargs):
+        bind_output(stream)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            bind_output(None)
+    return run
+
+
+class ThreadOutput(object):
+    # stands in for sys.stdout or sys.stderr, writes go to the stream bound to
+    # the writing thread and to default for threads without one
+    def __init__(self, default):
+        self.default = default
+
+    def _stream(self):
+        stream = bound_output()
+        return self.default if stream is None else stream
+
+    def write(self, data):
+        self._stream().write(data)
+
+    def flush(self):
+        self._stream().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream(), name)
+
+
+class FrameWriter(object):
+    # file like object sending what is written as output frames, a line at a time
+    def __init__(self, sock):
+        self.sock = sock
+        self.connected = True
+        self._buf = []
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8', 'replace')
+        with self._lock:
+            self._buf.append(data)
+            self._size += len(data)
+            if b'\n' in data or self._size >= READ_SIZE:
+                self._send()
+
+    def flush(self):
+        with self._lock:
+            self._send()
+
+    def _send(self):
+        data = b''.join(self._buf)
+        self._buf = []
+        self._size = 0
+        if not data or not self.connected:
+            # client went away, the command runs on without output
+            return
+        try:
+            write_frame(self.sock, STREAM_OUTPUT, data)
+        except socket.error as e:
+            self.connected = False
+
+    def isatty(self):
+        return False
+
+
+class DaemonServer(object):
+    def __init__(self, socket_path, run_command):
+        # run_command(args) runs one command and returns its exit status
+        self.socket_path = socket_path
+        self.run_command = run_command
+        self.sock = None
+
+    def bind(self):
+        if os.path.exists(self.socket_path):
+            sock = connect(self.socket_path)
+            if sock is not None:
+                sock.close()
+                raise RuntimeError('a dockernet daemon is already listening on %s' % self.socket_path)
+            # left behind by a daemon that did not exit cleanly
+            os.unlink(self.socket_path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.sock.listen(16)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def serve_forever(self):
+        # commands share process state, so connections are served one at a time
+        saved = (sys.stdout, sys.stderr)
+        sys.stdout = ThreadOutput(sys.stdout)
+        sys.stderr = ThreadOutput(sys.stderr)
+        try:
+            while True:
+                conn, address = self.sock.accept()
+                try:
+                    self.handle(conn)
+                except socket.error as e:
+                    pass
+                finally:
+                    conn.close()
+        finally:
+            sys.stdout, sys.stderr = saved
+            self.close()
+
+    def handle(self, conn):
+        request = b''
+        while not request.endswith(b'\n'):
+            chunk = conn.recv(READ_SIZE)
+            if not chunk:
+                return
+            request += chunk
+        request = json.loads(request.decode('utf-8'))
+
+        out = FrameWriter(conn)
+        bind_output(out)
+        cwd = os.getcwd()
+        try:
+            os.chdir(request.get('cwd') or cwd)
+            rc = self.run_command(request['args'])
+        except SystemExit as e:
+            rc = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            traceback.print_exc()
+            rc = 1
+        finally:
+            os.chdir(cwd)
+            bind_output(None)
+            out.flush()
+
+        write_frame(conn, STREAM_EXIT, str(rc or 0).encode('ascii'))
@@ -0,0 +1,451 @@
+"""
+Minimal Docker Engine API client speaking HTTP over the docker UNIX socket
+(or a plain tcp:// endpoint).
+
+Connections are kept alive and pooled so that repeated exec/inspect calls
+do not pay for a docker CLI process per operation. ShardedDockerClient
+spreads switch containers over several docker daemons behind the same
+interface.
+"""
+
+import io
+import json
+import posixpath
+import socket
+import struct
+import tarfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from dockernet import trace
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from urllib import quote, urlencode
+except ImportError:
+    from urllib.parse import quote, urlencode
+
+
+DEFAULT_DOCKER_SOCKET = '/var/run/docker.sock'
+DEFAULT_DOCKER_TCP_PORT = 2375
+# newest engine API version this client speaks, older daemons are spoken to in their own
+MAX_API_VERSION = '1.44'
+PLACEMENT_POLICIES = ('round-robin', 'least-loaded')
+
+# frame header docker prepends to multiplexed exec output when no tty is attached
+STREAM_HEADER_SIZE = 8
+
+
+class DockerError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, 'docker API error %s: %s' % (status, message))
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        httplib.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def parse_endpoint(endpoint):
+    # DOCKER_HOST style endpoint to ('unix', path) or ('tcp', (host, port))
+    if endpoint.startswith('tcp://'):
+        host, sep, port = endpoint[len('tcp://'):].rstrip('/').partition(':')
+        return 'tcp', (host, int(port) if port else DEFAULT_DOCKER_TCP_PORT)
+    if endpoint.startswith('unix://'):
+        endpoint = endpoint[len('unix://'):]
+    return 'unix', endpoint
+
+
+def to_text(data):
+    if not isinstance(data, str):
+        data = data.decode('utf-8', 'replace')
+    return data
+
+
+def version_tuple(version):
+    return tuple([int(part) for part in version.split('.')])
+
+
+def demux_stream(data):
+    # split docker's multiplexed stdout/stderr frames, keeping their order
+    chunks = []
+    pos = 0
+    while pos + STREAM_HEADER_SIZE <= len(data):
+        size = struct.unpack('>I', data[pos + 4:pos + STREAM_HEADER_SIZE])[0]
+        pos += STREAM_HEADER_SIZE
+        chunks.append(data[pos:pos + size])
+        pos += size
+
+    return to_text(b''.join(chunks))
+
+
+class ExecStream(object):
+    # output chunks of a running exec as they arrive, close() ends the stream from any thread
+    def __init__(self, conn, resp):
+        self.conn = conn
+        self.resp = resp
+
+    def __iter__(self):
+        try:
+            while True:
+                header = self.resp.read(STREAM_HEADER_SIZE)
+                if len(header) < STREAM_HEADER_SIZE:
+                    return
+                size = struct.unpack('>I', header[4:STREAM_HEADER_SIZE])[0]
+                yield to_text(self.resp.read(size))
+        finally:
+            self.conn.close()
+
+    def close(self):
+        sock = self.conn.sock
+        if sock is not None:
+            try:
+                # unblocks a reader in another thread, close() alone does not
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error as e:
+                pass
+        self.conn.close()
+
+
+class DockerClient(object):
+    def __init__(self, endpoint=DEFAULT_DOCKER_SOCKET, pool_size=10, timeout=None):
+        self.endpoint = endpoint
+        self.scheme, self.address = parse_endpoint(endpoint)
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._api_version = None
+        self._version_lock = threading.Lock()
+
+    def _new_conn(self):
+        if self.scheme == 'tcp':
+            return httplib.HTTPConnection(self.address[0], self.address[1], timeout=self.timeout)
+        return UnixHTTPConnection(self.address, self.timeout)
+
+    def _get_conn(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._new_conn(), False
+
+    def _put_conn(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def api_version(self):
+        # negotiated once: the daemon's version, capped at the newest one this client speaks
+        with self._version_lock:
+            if self._api_version is None:
+                version = self._json('GET', '/version', versioned=False)['ApiVersion']
+                self._api_version = min([version, MAX_API_VERSION], key=version_tuple)
+            return self._api_version
+
+    def _request(self, method, path, params=None, body=None, versioned=True, content_type='application/json'):
+        url = '/v%s%s' % (self.api_version(), path) if versioned else path
+        if params:
+            url += '?' + urlencode(params)
+        headers = {}
+        if body is not None:
+            if content_type == 'application/json':
+                body = json.dumps(body)
+            headers['Content-Type'] = content_type
+
+        conn, reused = self._get_conn()
+        sent = False
+        try:
+            conn.request(method, url, body, headers)
+            sent = True
+            resp = conn.getresponse()
+            data = resp.read()
+        except (socket.error, httplib.HTTPException):
+            conn.close()
+            # a pooled connection may have gone stale, only resend when the daemon
+            # can not have acted on the request already
+            if not reused or (sent and method != 'GET'):
+                raise
+            conn = self._new_conn()
+            try:
+                conn.request(method, url, body, headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except Exception:
+                conn.close()
+                raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._put_conn(conn)
+
+        if resp.status >= 400:
+            message = to_text(data)
+            try:
+                message = json.loads(message)['message']
+            except (ValueError, KeyError, TypeError):
+                pass
+            raise DockerError(resp.status, message)
+
+        return data
+
+    def _json(self, method, path, params=None, body=None, versioned=True):
+        data = self._request(method, path, params, body, versioned)
+        if not data:
+            return None
+        return json.loads(to_text(data))
+
+    def endpoint_of(self, container):
+        return self.endpoint
+
+    def images(self, reference=None):
+        params = {}
+        if reference:
+            params['filters'] = json.dumps({'reference': [reference]})
+        with trace.span('docker.images'):
+            return self._json('GET', '/images/json', params)
+
+    def ps(self, name=None, all=True):
+        params = {'all': int(all)}
+        if name:
+            params['filters'] = json.dumps({'name': [name]})
+        with trace.span('docker.ps'):
+            return self._json('GET', '/containers/json', params)
+
+    def inspect(self, container):
+        with trace.span('docker.inspect', container):
+            return self._json('GET', '/containers/%s/json' % quote(container))
+
+    def run(self, name, image, env=None, cap_add=None):
+        # equivalent of "docker run -itd --name <name>"
+        body = {'Image': image,
+                'Env': env or [],
+                'Tty': True,
+                'OpenStdin': True,
+                'HostConfig': {'CapAdd': cap_add or []}}
+        with trace.span('docker.run', name):
+            container = self._json('POST', '/containers/create', {'name': name}, body)
+            try:
+                self._request('POST', '/containers/%s/start' % container['Id'])
+            except Exception as e:
+                # like docker run, do not leave the container behind to clash with the next run
+                try:
+                    self.rm(container['Id'], force=True)
+                except (DockerError, socket.error, httplib.HTTPException):
+                    pass
+                raise e
+        return container['Id']
+
+    def exec_run(self, container, cmd):
+        body = {'Cmd': cmd,
+                'AttachStdout': True,
+                'AttachStderr': True,
+                'Tty': False}
+        with trace.span('exec.' + trace.describe_cmd(cmd), container) as span:
+            exec_id = self._json('POST', '/containers/%s/exec' % quote(container), body=body)['Id']
+            output = self._request('POST', '/exec/%s/start' % exec_id, body={'Detach': False, 'Tty': False})
+            exit_code = self._json('GET', '/exec/%s/json' % exec_id)['ExitCode']
+            span.status = exit_code
+
+        return exit_code, demux_stream(output)
+
+    def exec_stream(self, container, cmd):
+        # start cmd in container on a connection of its own and stream its output,
+        # the command gets SIGPIPE on its next write once the stream is closed
+        body = {'Cmd': cmd,
+                'AttachStdout': True,
+                'AttachStderr': True,
+                'Tty': False}
+        with trace.span('exec.' + trace.describe_cmd(cmd), container):
+            exec_id = self._json('POST', '/containers/%s/exec' % quote(container), body=body)['Id']
+            conn = self._new_conn()
+            try:
+                conn.request('POST', '/v%s/exec/%s/start' % (self.api_version(), exec_id),
+                             json.dumps({'Detach': False, 'Tty': False}), {'Content-Type': 'application/json'})
+                resp = conn.getresponse()
+            except Exception:
+                conn.close()
+                raise
+        if resp.status >= 400:
+            message = to_text(resp.read())
+            conn.close()
+            raise DockerError(resp.status, message)
+        return ExecStream(conn, resp)
+
+    def put_file(self, container, path, data):
+        # write data to path in the container as a one file archive, like docker cp,
+        # so its size is not bound by the exec argument limit
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        archive = io.BytesIO()
+        tar = tarfile.open(fileobj=archive, mode='w')
+        info = tarfile.TarInfo(posixpath.basename(path))
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+        tar.close()
+        with trace.span('docker.put_file', container):
+            self._request('PUT', '/containers/%s/archive' % quote(container), {'path': posixpath.dirname(path)},
+                          archive.getvalue(), content_type='application/x-tar')
+
+    def stop(self, container, timeout=10):
+        with trace.span('docker.stop', container):
+            self._request('POST', '/containers/%s/stop' % quote(container), {'t': timeout})
+
+    def rm(self, container, force=False):
+        with trace.span('docker.rm', container):
+            self._request('DELETE', '/containers/%s' % quote(container), {'force': int(force)})
+
+    def rename(self, container, name):
+        with trace.span('docker.rename', container):
+            self._request('POST', '/containers/%s/rename' % quote(container), {'name': name})
+
+
+class ShardedDockerClient(object):
+    """DockerClient interface over several docker daemons.
+
+    Containers are placed on a daemon when they are created and every
+    container addressed call is routed to the daemon holding it; listing
+    calls fan out to all daemons in parallel and merge their results.
+    """
+
+    def __init__(self, clients, placement='round-robin'):
+        if placement not in PLACEMENT_POLICIES:
+            raise ValueError('unknown placement policy %s' % placement)
+        self.clients = list(clients)
+        self.placement = placement
+        self._shard_of = {}
+        # repo tags of the image ids listed, the same image built on each daemon has another id there
+        self._tags_of = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+    def _fan_out(self, func):
+        pool = ThreadPool(len(self.clients))
+        try:
+            return pool.map(func, self.clients)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _place(self):
+        with self._lock:
+            if self.placement == 'least-loaded':
+                load = [0] * len(self.clients)
+                for shard in self._shard_of.values():
+                    load[shard] += 1
+                shard = load.index(min(load))
+            else:
+                shard = self._next % len(self.clients)
+                self._next += 1
+            return shard
+
+    def _client(self, container):
+        with self._lock:
+            shard = self._shard_of.get(container)
+        if shard is None:
+            self.ps(name=container)
+            with self._lock:
+                shard = self._shard_of.get(container)
+        if shard is None:
+            raise DockerError(404, 'No such container: %s' % container)
+        return self.clients[shard]
+
+    def endpoint_of(self, container):
+        return self._client(container).endpoint
+
+    def images(self, reference=None):
+        images = []
+        seen = set()
+        for shard_images in self._fan_out(lambda client: client.images(reference)):
+            for image in shard_images or []:
+                tags = [tag for tag in image.get('RepoTags') or [] if tag != '<none>:<none>']
+                if tags:
+                    with self._lock:
+                        self._tags_of[image['Id']] = tags
+                if image['Id'] not in seen:
+                    seen.add(image['Id'])
+                    images.append(image)
+        return images
+
+    def ps(self, name=None, all=True):
+        containers = []
+        results = self._fan_out(lambda client: client.ps(name, all))
+        with self._lock:
+            for shard, shard_containers in enumerate(results):
+                for cont in shard_containers or []:
+                    self._shard_of[cont['Names'][0].lstrip('/')] = shard
+                    containers.append(cont)
+        return containers
+
+    def inspect(self, container):
+        return self._client(container).inspect(container)
+
+    def run(self, name, image, env=None, cap_add=None):
+        shard = self._place()
+        # claim the slot before the container exists so concurrent placements see it
+        with self._lock:
+            self._shard_of[name] = shard
+            # an id listed on one daemon is created by its tag, which every daemon resolves to its own build
+            tags = self._tags_of.get(image)
+        if tags:
+            image = tags[0]
+        try:
+            return self.clients[shard].run(name, image, env, cap_add)
+        except Exception:
+            with self._lock:
+                self._shard_of.pop(name, None)
+            raise
+
+    def exec_run(self, container, cmd):
+        return self._client(container).exec_run(container, cmd)
+
+    def exec_stream(self, container, cmd):
+        return self._client(container).exec_stream(container, cmd)
+
+    def put_file(self, container, path, data):
+        self._client(container).put_file(container, path, data)
+
+    def stop(self, container, timeout=10):
+        self._client(container).stop(container, timeout)
+
+    def rm(self, container, force=False):
+        self._client(container).rm(container, force)
+        with self._lock:
+            self._shard_of.pop(container, None)
+
+    def rename(self, container, name):
+        client = self._client(container)
+        client.rename(container, name)
+        with self._lock:
+            self._shard_of[name] = self._shard_of.pop(container, self.clients.index(client))
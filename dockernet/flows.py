@@ -0,0 +1,84 @@
+"""
+Parsers for ovs-ofctl dump-flows / dump-groups output.
+"""
+
+# fields ovs-ofctl prints ahead of the match, separated by ", "
+FLOW_STAT_FIELDS = ('cookie', 'duration', 'table', 'n_packets', 'n_bytes',
+                    'idle_age', 'hard_age', 'idle_timeout', 'hard_timeout', 'importance')
+DEFAULT_PRIORITY = 32768
+
+
+def parse_flow(line):
+    line = line.strip()
+    if ' actions=' not in ' ' + line:
+        return None
+    head, sep, actions = (' ' + line).partition(' actions=')
+
+    flow = {'cookie': '0x0',
+            'table': 0,
+            'priority': DEFAULT_PRIORITY,
+            'match': '',
+            'actions': actions,
+            'n_packets': 0,
+            'n_bytes': 0}
+    match_chunks = []
+    for chunk in head.strip().rstrip(',').split(', '):
+        key, sep, value = chunk.partition('=')
+        if key in FLOW_STAT_FIELDS:
+            flow[key] = value
+        elif chunk:
+            match_chunks.append(chunk)
+
+    # flags such as reset_counts are separated from the match by a space
+    match_fields = []
+    for field in ','.join(match_chunks).replace(' ', ',').split(','):
+        if field.startswith('priority='):
+            flow['priority'] = int(field[len('priority='):])
+        elif field:
+            match_fields.append(field)
+    flow['match'] = ','.join(match_fields)
+
+    for key in ('table', 'n_packets', 'n_bytes'):
+        flow[key] = int(flow[key])
+
+    return flow
+
+
+def parse_flows(output):
+    flows = []
+    for line in output.split('\n'):
+        flow = parse_flow(line)
+        if flow is not None:
+            flows.append(flow)
+    return flows
+
+
+def parse_groups(output):
+    groups = []
+    for line in output.split('\n'):
+        line = line.strip()
+        if not line.startswith('group_id='):
+            continue
+        parts = line.split(',bucket=')
+        group = {'group_id': None, 'type': None, 'buckets': parts[1:]}
+        for field in parts[0].split(','):
+            key, sep, value = field.partition('=')
+            if key == 'group_id':
+                group['group_id'] = int(value)
+            elif key == 'type':
+                group['type'] = value
+        groups.append(group)
+    return groups
+
+
+def table_histogram(flows):
+    histogram = {}
+    for flow in flows:
+        histogram[flow['table']] = histogram.get(flow['table'], 0) + 1
+    return histogram
+
+
+def normalize_flow(flow):
+    # flow identity without counters/ages, stable across dumps
+    return 'table=%d, cookie=%s, priority=%d,%s actions=%s' % (
+        flow['table'], flow['cookie'], flow['priority'], flow['match'], flow['actions'])
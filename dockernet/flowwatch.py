@@ -0,0 +1,229 @@
+"""
+Switch flow tables kept current from OpenFlow flow monitor events.
+
+One "ovs-ofctl monitor <bridge> watch:" stream per switch reports the
+switch's initial flow table followed by every flow added, modified or
+deleted. The tables are kept in memory, so flow counts and flow changes
+are answered without dumping flows, and the cost of watching follows
+flow churn instead of table size.
+"""
+
+import re
+import threading
+import time
+
+
+MONITOR_CMD = 'ovs-ofctl -O OpenFlow13 monitor %s watch:'
+# fields a flow update carries ahead of its match
+UPDATE_FIELDS = ('event', 'reason', 'table', 'cookie', 'idle_timeout', 'hard_timeout')
+EVENTS = ('ADDED', 'MODIFIED', 'DELETED')
+# replies to the monitor request carry its xid, later updates are sent with xid 0
+XID_RE = re.compile(r'\(xid=(0x[0-9a-fA-F]+)\)')
+# a switch counts as synced once its initial table stopped arriving for this long
+SETTLE_TIME = 0.2
+
+
+def parse_update(line):
+    # (event, (table, match), (cookie, actions)) of a flow update line, None for other lines
+    words = line.strip().split(' ')
+    if not words[0].startswith('event='):
+        return None
+    fields = {}
+    while words and words[0].partition('=')[0] in UPDATE_FIELDS:
+        key, sep, value = words.pop(0).partition('=')
+        fields[key] = value
+    if fields['event'] not in EVENTS:
+        return None
+    match, sep, actions = (' ' + ' '.join(words)).partition(' actions=')
+    return fields['event'], (int(fields.get('table', 0)), match.strip()), (fields.get('cookie', '0x0'), actions)
+
+
+def format_flow(key, value):
+    # dump-flows style line, readable by flows.parse_flow
+    table, match = key
+    cookie, actions = value
+    head = ['cookie=%s' % cookie, 'table=%d' % table]
+    if match:
+        head.append(match)
+    return ' %s actions=%s' % (', '.join(head), actions)
+
+
+class SwitchFlows(object):
+    def __init__(self, name, container, bridge):
+        self.name = name
+        self.container = container
+        self.bridge = bridge
+        self.flows = {}
+        self.events = dict((event, 0) for event in EVENTS)
+        self.pauses = 0
+        self.error = None
+        self.last_data = None
+        self.stream = None
+        # flows as they were at the last diff, for flows changed since
+        self._before = {}
+        self._initial = True
+        self._reported = dict(self.events)
+
+    def apply(self, event, key, value):
+        if not self._initial:
+            self.events[event] += 1
+            if key not in self._before:
+                self._before[key] = self.flows.get(key)
+        if event == 'DELETED':
+            self.flows.pop(key, None)
+        else:
+            self.flows[key] = value
+
+    def line(self, line):
+        if line.startswith(' '):
+            update = parse_update(line)
+            if update is not None:
+                self.apply(*update)
+            return
+        if 'FLOW_MONITOR_PAUSED' in line:
+            # the switch drops updates until it resumes and resends the changes
+            self.pauses += 1
+        match = XID_RE.search(line)
+        if match is not None and 'FLOW_MONITOR' in line:
+            self._initial = int(match.group(1), 16) != 0
+
+    def diff(self):
+        # (added, modified, deleted) flow lines since the previous diff
+        added = []
+        modified = []
+        deleted = []
+        for key, before in self._before.items():
+            after = self.flows.get(key)
+            if after == before:
+                continue
+            if before is None:
+                added.append(format_flow(key, after))
+            elif after is None:
+                deleted.append(format_flow(key, before))
+            else:
+                modified.append(format_flow(key, after))
+        self._before = {}
+        return [sorted([line.strip() for line in lines]) for lines in (added, modified, deleted)]
+
+    def take_events(self):
+        # events since the previous call
+        counts = dict((event, self.events[event] - self._reported[event]) for event in EVENTS)
+        self._reported = dict(self.events)
+        return counts
+
+
+class FlowWatch(object):
+    def __init__(self, switches, exec_stream):
+        # switches is a list of (switch name, container, bridge), exec_stream(container, cmd)
+        # returns an iterable of output chunks with a close() method
+        self.switches = dict((name, SwitchFlows(name, container, bridge)) for name, container, bridge in switches)
+        self.exec_stream = exec_stream
+        self.started = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._last_report = None
+
+    def start(self):
+        self.started = self._last_report = time.time()
+        for switch in self.switches.values():
+            thread = threading.Thread(target=self._watch, args=(switch,))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        for switch in self.switches.values():
+            if switch.stream is not None:
+                switch.stream.close()
+
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def wait_stopped(self, seconds):
+        # sleep up to seconds, True when the watch got stopped meanwhile
+        self._stopped.wait(seconds)
+        return self._stopped.is_set()
+
+    def _watch(self, switch):
+        pending = ''
+        try:
+            switch.stream = self.exec_stream(switch.container, ['sh', '-c', MONITOR_CMD % switch.bridge])
+            if self._stopped.is_set():
+                switch.stream.close()
+            for chunk in switch.stream:
+                lines = (pending + chunk).split('\n')
+                pending = lines.pop()
+                with self._lock:
+                    switch.last_data = time.time()
+                    for line in lines:
+                        switch.line(line)
+        except Exception as e:
+            if not self._stopped.is_set():
+                switch.error = str(e) or e.__class__.__name__
+            return
+        if not self._stopped.is_set():
+            switch.error = 'flow monitor ended'
+
+    def wait_synced(self, timeout):
+        # until every switch has its initial table or failed, False on timeout
+        deadline = time.time() + timeout
+        while True:
+            now = time.time()
+            with self._lock:
+                waiting = [switch for switch in self.switches.values() if switch.error is None and
+                           (switch.last_data is None or now - switch.last_data < SETTLE_TIME)]
+            if not waiting:
+                break
+            if now >= deadline:
+                return False
+            time.sleep(SETTLE_TIME / 2)
+        with self._lock:
+            for switch in self.switches.values():
+                # the initial table is in, later updates count as events
+                switch._initial = False
+        return True
+
+    def flow_count(self, name):
+        switch = self.switches.get(name)
+        if switch is None or switch.error is not None:
+            return None
+        with self._lock:
+            return len(switch.flows)
+
+    def flow_lines(self, name):
+        switch = self.switches.get(name)
+        if switch is None or switch.error is not None:
+            return None
+        with self._lock:
+            return ''.join([format_flow(key, value) + '\n' for key, value in sorted(switch.flows.items())])
+
+    def diff(self, names):
+        # (name, added, modified, deleted) of watched switches, in names order
+        result = []
+        with self._lock:
+            for name in names:
+                switch = self.switches.get(name)
+                if switch is not None and switch.error is None:
+                    result.append(tuple([name] + switch.diff()))
+        return result
+
+    def report(self):
+        # per switch flow count and event rates since the previous report
+        now = time.time()
+        elapsed = max(now - self._last_report, 1e-6)
+        self._last_report = now
+        records = []
+        with self._lock:
+            for name in sorted(self.switches, key=lambda name: (len(name), name)):
+                switch = self.switches[name]
+                counts = switch.take_events()
+                records.append({'t': round(now - self.started, 3),
+                                'switch': name,
+                                'flows': len(switch.flows),
+                                'added': counts['ADDED'],
+                                'modified': counts['MODIFIED'],
+                                'deleted': counts['DELETED'],
+                                'events_per_sec': round(sum(counts.values()) / elapsed, 2),
+                                'pauses': switch.pauses,
+                                'error': switch.error})
+        return records
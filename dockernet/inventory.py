@@ -0,0 +1,131 @@
+"""
+Local inventory of the switches and ports dockernet has created.
+
+Switch containers, their VM/tap ports, MACs, IPs and neutron ids are
+recorded as they are created so that later commands can read them back
+instead of rediscovering them with execs in every container. The store
+is reconciled against a single docker container list call.
+
+In density mode a switch is a bridge inside a shared host container; its
+entry then names that container and carries the container's id.
+"""
+
+import json
+import os
+import threading
+
+
+DEFAULT_INVENTORY_FILE = '/tmp/dockernet-inventory.json'
+
+
+class Inventory(object):
+    def __init__(self, path=DEFAULT_INVENTORY_FILE):
+        self.path = path
+        self.switches = {}
+        self.dirty = False
+        self._lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.switches = json.load(f).get('switches', {})
+
+    def reconcile(self, containers, host_prefix=None):
+        # containers: map of container name to id from one docker list call.
+        # Containers named host_prefix* hold density mode switches, the ones
+        # no known switch lives in are returned so they can be rediscovered.
+        with self._lock:
+            for name in list(self.switches):
+                switch = self.switches[name]
+                container = switch.get('container')
+                if container is None:
+                    if name not in containers:
+                        del self.switches[name]
+                        self.dirty = True
+                elif containers.get(container) != switch.get('id'):
+                    del self.switches[name]
+                    self.dirty = True
+            hosts = set([switch.get('container') for switch in self.switches.values()])
+            unknown_hosts = []
+            for name, cont_id in containers.items():
+                if host_prefix and name.startswith(host_prefix):
+                    if name not in hosts:
+                        unknown_hosts.append(name)
+                    continue
+                switch = self.switches.get(name)
+                if switch is None or switch.get('id') != cont_id:
+                    # unknown or recreated container, its ports must be rediscovered
+                    self.switches[name] = {'id': cont_id, 'ports': None}
+                    self.dirty = True
+
+            return sorted(unknown_hosts)
+
+    def switch_names(self):
+        with self._lock:
+            return sorted(self.switches)
+
+    def switch_ids(self):
+        # (switch name, container id) pairs
+        with self._lock:
+            return sorted([(name, switch.get('id')) for name, switch in self.switches.items()])
+
+    def add_switch(self, name, cont_id, container=None, ports_known=True):
+        with self._lock:
+            self.switches[name] = {'id': cont_id, 'ports': {} if ports_known else None}
+            if container is not None:
+                self.switches[name]['container'] = container
+            self.dirty = True
+
+    def remove_switch(self, name):
+        with self._lock:
+            if self.switches.pop(name, None) is not None:
+                self.dirty = True
+
+    def container_of(self, name):
+        # host container of a density mode switch, None for its own container
+        with self._lock:
+            switch = self.switches.get(name)
+            if switch is None:
+                return None
+            return switch.get('container')
+
+    def switches_in(self, container):
+        with self._lock:
+            return sorted([name for name, switch in self.switches.items()
+                           if switch.get('container') == container])
+
+    def host_names(self):
+        with self._lock:
+            return sorted(set([switch['container'] for switch in self.switches.values()
+                               if switch.get('container') is not None]))
+
+    def ports(self, name):
+        # map of port number to port attributes, None when unknown
+        with self._lock:
+            switch = self.switches.get(name)
+            if switch is None or switch['ports'] is None:
+                return None
+            return dict((int(num), dict(port)) for num, port in switch['ports'].items())
+
+    def set_port(self, name, port_num, **attrs):
+        with self._lock:
+            switch = self.switches.setdefault(name, {'id': None, 'ports': {}})
+            if switch['ports'] is None:
+                switch['ports'] = {}
+            switch['ports'].setdefault(str(port_num), {}).update(attrs)
+            self.dirty = True
+
+    def remove_port(self, name, port_num):
+        with self._lock:
+            switch = self.switches.get(name)
+            if switch is not None and switch['ports'] is not None:
+                if switch['ports'].pop(str(port_num), None) is not None:
+                    self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': 1, 'switches': self.switches}, f, indent=1, sort_keys=True)
+            os.rename(tmp_path, self.path)
+            self.dirty = False
@@ -0,0 +1,288 @@
+"""
+Minimal OVSDB management protocol (RFC 7047) client.
+
+Speaks JSON-RPC to a switch's ovsdb-server over a tcp:HOST:PORT or
+unix:PATH remote, keeps a monitor fed copy of the few columns dockernet
+needs and builds the bridge and port transactions that used to run as
+ovs-vsctl execs. Like ovs-vsctl, a commit bumps Open_vSwitch next_cfg in
+the same transaction and then waits for ovs-vswitchd to report it as
+cur_cfg, which arrives as a monitor update instead of being polled.
+"""
+
+import codecs
+import itertools
+import json
+import re
+import socket
+import time
+
+from dockernet import trace
+
+
+DEFAULT_OVSDB_PORT = 6640
+DEFAULT_TIMEOUT = 30
+DB_NAME = 'Open_vSwitch'
+MONITOR_ID = 'dockernet'
+MONITOR_COLUMNS = {'Open_vSwitch': ['bridges', 'cur_cfg', 'next_cfg'],
+                   'Bridge': ['name', 'ports'],
+                   'Port': ['name', 'interfaces'],
+                   'Interface': ['name', 'ofport']}
+READ_SIZE = 65536
+
+# characters that change nesting or string state while splitting JSON texts
+JSON_TOKEN_RE = re.compile(r'[{}\[\]"\\]')
+
+
+class OvsdbError(Exception):
+    pass
+
+
+def parse_remote(remote):
+    # ovs remote syntax, tcp:HOST:PORT or unix:PATH, as (address family, address)
+    scheme, sep, address = remote.partition(':')
+    if scheme == 'unix' and address:
+        return socket.AF_UNIX, address
+    if scheme == 'tcp':
+        host, sep, port = address.rpartition(':')
+        if host and port.isdigit():
+            return socket.AF_INET, (host, int(port))
+    raise OvsdbError('unsupported ovsdb remote %s' % remote)
+
+
+def ovs_set(values):
+    return ['set', list(values)]
+
+
+def ovs_map(mapping):
+    return ['map', [[key, value] for key, value in sorted(mapping.items())]]
+
+
+class JsonStream(object):
+    # splits concatenated JSON texts as JSON-RPC over a stream socket sends them
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, data):
+        buf = self._buf + self._decoder.decode(data)
+        pos = self._pos
+        start = 0
+        texts = []
+        while True:
+            match = JSON_TOKEN_RE.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+            i = match.start()
+            char = buf[i]
+            if self._in_string:
+                if char == '\\':
+                    if i + 1 >= len(buf):
+                        # escaped character not received yet
+                        pos = i
+                        break
+                    pos = i + 2
+                    continue
+                if char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    texts.append(json.loads(buf[start:i + 1]))
+                    start = i + 1
+            pos = i + 1
+        self._buf = buf[start:]
+        self._pos = pos - start
+        return texts
+
+
+class OvsdbClient(object):
+    def __init__(self, remote, timeout=DEFAULT_TIMEOUT):
+        self.remote = remote
+        self.timeout = timeout
+        # monitored rows, table name -> uuid -> row
+        self.tables = {}
+        self._sock = None
+        self._stream = JsonStream()
+        self._received = []
+        self._ids = itertools.count(1)
+
+    def connect(self):
+        family, address = parse_remote(self.remote)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        with trace.span('ovsdb.connect', self.remote):
+            try:
+                sock.connect(address)
+            except socket.error as e:
+                sock.close()
+                raise OvsdbError('could not connect to %s: %s' % (self.remote, e))
+        self._sock = sock
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send(self, msg):
+        try:
+            self._sock.sendall(json.dumps(msg).encode('utf-8'))
+        except socket.error as e:
+            raise OvsdbError('could not send to %s: %s' % (self.remote, e))
+
+    def _recv(self):
+        while not self._received:
+            try:
+                data = self._sock.recv(READ_SIZE)
+            except socket.timeout:
+                raise OvsdbError('timed out waiting for %s' % self.remote)
+            except socket.error as e:
+                raise OvsdbError('could not receive from %s: %s' % (self.remote, e))
+            if not data:
+                raise OvsdbError('connection closed by %s' % self.remote)
+            self._received.extend(self._stream.feed(data))
+        return self._received.pop(0)
+
+    def _handle(self, msg):
+        # requests and notifications from the server
+        method = msg.get('method')
+        if method == 'echo':
+            self._send({'id': msg['id'], 'result': msg['params'], 'error': None})
+        elif method == 'update' and msg['params'][0] == MONITOR_ID:
+            self._apply(msg['params'][1])
+
+    def _apply(self, updates):
+        for table, rows in updates.items():
+            cached = self.tables.setdefault(table, {})
+            for uuid, row in rows.items():
+                if row.get('new') is None:
+                    cached.pop(uuid, None)
+                else:
+                    cached[uuid] = row['new']
+
+    def call(self, method, params):
+        msg_id = next(self._ids)
+        self._send({'method': method, 'params': params, 'id': msg_id})
+        while True:
+            msg = self._recv()
+            if msg.get('method') is not None:
+                self._handle(msg)
+            elif msg.get('id') == msg_id:
+                if msg.get('error') is not None:
+                    raise OvsdbError('%s on %s failed: %s' % (method, self.remote, msg['error']))
+                return msg['result']
+
+    def monitor(self, columns=MONITOR_COLUMNS):
+        requests = dict((table, {'columns': table_columns}) for table, table_columns in columns.items())
+        with trace.span('ovsdb.monitor', self.remote):
+            self._apply(self.call('monitor', [DB_NAME, MONITOR_ID, requests]))
+
+    def transact(self, ops):
+        with trace.span('ovsdb.transact', self.remote) as span:
+            results = self.call('transact', [DB_NAME] + ops)
+            # a failed operation, or the commit itself, reports an error entry
+            for result in results:
+                if result and result.get('error'):
+                    span.status = result['error']
+                    raise OvsdbError('transaction on %s failed: %s %s' %
+                                     (self.remote, result['error'], result.get('details', '')))
+        return results
+
+    def wait(self, predicate, timeout=None):
+        # read monitor updates until predicate() holds
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        try:
+            while not predicate():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise OvsdbError('timed out waiting for %s' % self.remote)
+                self._sock.settimeout(remaining)
+                msg = self._recv()
+                if msg.get('method') is not None:
+                    self._handle(msg)
+        finally:
+            if self._sock is not None:
+                self._sock.settimeout(self.timeout)
+
+    def cur_cfg(self):
+        return max([row.get('cur_cfg', 0) for row in self.tables.get('Open_vSwitch', {}).values()] or [0])
+
+    def commit(self, ops, wait=True):
+        # with wait, returns once ovs-vswitchd has applied the transaction
+        if not wait:
+            return self.transact(ops)
+        ops = ops + [{'op': 'mutate', 'table': 'Open_vSwitch', 'where': [],
+                      'mutations': [['next_cfg', '+=', 1]]},
+                     {'op': 'select', 'table': 'Open_vSwitch', 'where': [], 'columns': ['next_cfg']}]
+        results = self.transact(ops)
+        next_cfg = results[len(ops) - 1]['rows'][0]['next_cfg']
+        with trace.span('ovsdb.wait', self.remote):
+            self.wait(lambda: self.cur_cfg() >= next_cfg)
+        return results
+
+    def find(self, table, name):
+        # uuid of the monitored row called name, None when there is none
+        for uuid, row in self.tables.get(table, {}).items():
+            if row.get('name') == name:
+                return uuid
+        return None
+
+
+def add_ports_ops(client, bridge, ports):
+    # ports is a list of (port name, interface external_ids), the equivalent of
+    # "--may-exist add-port" plus "set Interface external_ids" for each
+    bridge_uuid = client.find('Bridge', bridge)
+    if bridge_uuid is None:
+        raise OvsdbError('no bridge named %s on %s' % (bridge, client.remote))
+    ops = []
+    new_ports = []
+    for i, (name, external_ids) in enumerate(ports):
+        if client.find('Port', name) is not None:
+            ops.append({'op': 'update', 'table': 'Interface', 'where': [['name', '==', name]],
+                        'row': {'external_ids': ovs_map(external_ids)}})
+            continue
+        ops.append({'op': 'insert', 'table': 'Interface', 'uuid-name': 'iface%d' % i,
+                    'row': {'name': name, 'external_ids': ovs_map(external_ids)}})
+        ops.append({'op': 'insert', 'table': 'Port', 'uuid-name': 'port%d' % i,
+                    'row': {'name': name, 'interfaces': ['named-uuid', 'iface%d' % i]}})
+        new_ports.append(['named-uuid', 'port%d' % i])
+    if new_ports:
+        ops.append({'op': 'mutate', 'table': 'Bridge', 'where': [['_uuid', '==', ['uuid', bridge_uuid]]],
+                    'mutations': [['ports', 'insert', ovs_set(new_ports)]]})
+    return ops
+
+
+def del_ports_ops(client, bridge, names):
+    # "--if-exists del-port", unreferenced Port and Interface rows are garbage collected
+    bridge_uuid = client.find('Bridge', bridge)
+    port_uuids = [['uuid', uuid] for uuid in [client.find('Port', name) for name in names] if uuid]
+    if bridge_uuid is None or not port_uuids:
+        return []
+    return [{'op': 'mutate', 'table': 'Bridge', 'where': [['_uuid', '==', ['uuid', bridge_uuid]]],
+             'mutations': [['ports', 'delete', ovs_set(port_uuids)]]}]
+
+
+def del_bridge_ops(client, bridge):
+    # "--if-exists del-br"
+    bridge_uuid = client.find('Bridge', bridge)
+    if bridge_uuid is None:
+        return []
+    return [{'op': 'mutate', 'table': 'Open_vSwitch', 'where': [],
+             'mutations': [['bridges', 'delete', ovs_set([['uuid', bridge_uuid]])]]}]
+
+
+def disconnect_ops(bridge):
+    # remove local_ip so the controller drops tunnels, then the openflow and ovsdb channels
+    return [{'op': 'mutate', 'table': 'Open_vSwitch', 'where': [],
+             'mutations': [['other_config', 'delete', ovs_set(['local_ip'])]]},
+            {'op': 'update', 'table': 'Bridge', 'where': [['name', '==', bridge]],
+             'row': {'controller': ovs_set([])}},
+            {'op': 'update', 'table': 'Open_vSwitch', 'where': [],
+             'row': {'manager_options': ovs_set([])}}]
@@ -0,0 +1,149 @@
+"""
+Full-mesh datapath reachability probing.
+
+All (src, dst) probes of a switch are fanned out by one shell script run
+inside the switch container: fping when the image has it, otherwise a
+bounded number of background workers each pinging its share of the
+destinations in turn. The destinations are written to a file in the
+container first, inlined in the exec they overflow the kernel's argument
+size limit at tens of thousands of ports.
+"""
+
+import csv
+import json
+import re
+
+
+# one destination per line, removed by the probe script
+DSTS_FILE = '/tmp/dockernet-ping-%s.dsts'
+
+PROBE_SCRIPT = """d=$(mktemp -d)
+srcs='%(srcs)s'
+dsts='%(dsts_file)s'
+if command -v fping >/dev/null 2>&1; then
+    for s in $srcs; do
+        (echo "@@ FPING $s"; fping -q -i 1 -C %(count)d -S $s -f "$dsts" 2>&1) > "$d/out.$s" &
+    done
+else
+    w=0
+    while [ $w -lt %(parallelism)d ]; do
+        awk -v w=$w 'NR %% %(parallelism)d == w' "$dsts" > "$d/dsts.$w"
+        (for s in $srcs; do
+            while read t; do
+                echo "@@ PING $s $t"
+                ping -q -c %(count)d -W 1 -I $s $t 2>&1 </dev/null
+            done < "$d/dsts.$w"
+        done) > "$d/out.$w" &
+        w=$((w+1))
+    done
+fi
+wait
+cat "$d"/out.* 2>/dev/null
+rm -rf "$d" "$dsts"
+"""
+
+PING_RECEIVED_RE = re.compile(r'(\d+) packets transmitted, (\d+) (?:packets )?received')
+PING_RTT_RE = re.compile(r'= [\d.]+/([\d.]+)/')
+
+
+def dsts_file_data(dsts):
+    return ''.join(['%s\n' % dst for dst in dsts])
+
+
+def build_probe_cmd(srcs, dsts_file, count=2, parallelism=64):
+    # probes srcs against the destinations written to dsts_file in the container
+    script = PROBE_SCRIPT % {'srcs': ' '.join(srcs),
+                             'dsts_file': dsts_file,
+                             'count': count,
+                             'parallelism': parallelism}
+    return ['sh', '-c', script]
+
+
+def parse_probe_output(output, count=2):
+    # map of (src, dst) to (sent, received, avg rtt in ms or None)
+    results = {}
+    src = None
+    pair = None
+    for line in output.split('\n'):
+        if line.startswith('@@ FPING '):
+            src = line.split()[2]
+            pair = None
+        elif line.startswith('@@ PING '):
+            fields = line.split()
+            src = None
+            pair = (fields[2], fields[3])
+            results[pair] = (count, 0, None)
+        elif src is not None and ' : ' in line:
+            # fping -C output: "<dst> : <rtt|-> <rtt|-> ..."
+            dst, samples = line.split(' : ', 1)
+            rtts = [float(sample) for sample in samples.split() if sample != '-']
+            avg = sum(rtts) / len(rtts) if rtts else None
+            results[(src, dst.strip())] = (count, len(rtts), avg)
+        elif pair is not None:
+            match = PING_RECEIVED_RE.search(line)
+            if match:
+                sent, received, avg = results[pair]
+                results[pair] = (int(match.group(1)), int(match.group(2)), avg)
+            match = PING_RTT_RE.search(line)
+            if match:
+                sent, received, avg = results[pair]
+                results[pair] = (sent, received, float(match.group(1)))
+
+    return results
+
+
+def loss_pct(sent, received):
+    if not sent:
+        return 100.0
+    return 100.0 * (sent - received) / sent
+
+
+def is_passed(result):
+    sent, received, avg = result
+    return sent > 0 and received == sent
+
+
+class PingMatrix(object):
+    def __init__(self, destinations, count=2):
+        self.destinations = list(destinations)
+        self.count = count
+        self.sources = []
+        self.results = {}
+
+    def add(self, srcs, results):
+        self.sources.extend(srcs)
+        for src in srcs:
+            for dst in self.destinations:
+                self.results[(src, dst)] = results.get((src, dst), (self.count, 0, None))
+
+    def summary(self):
+        passed = len([r for r in self.results.values() if is_passed(r)])
+        return {'sources': len(self.sources),
+                'destinations': len(self.destinations),
+                'pairs': len(self.results),
+                'passed': passed,
+                'failed': len(self.results) - passed}
+
+    def write_json(self, f):
+        loss = []
+        rtt = []
+        for src in self.sources:
+            row = [self.results[(src, dst)] for dst in self.destinations]
+            loss.append([round(loss_pct(sent, received), 1) for sent, received, avg in row])
+            rtt.append([None if avg is None else round(avg, 3) for sent, received, avg in row])
+        json.dump({'sources': self.sources,
+                   'destinations': self.destinations,
+                   'count': self.count,
+                   'loss_pct': loss,
+                   'rtt_avg_ms': rtt,
+                   'summary': self.summary()}, f)
+        f.write('\n')
+
+    def write_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(['src', 'dst', 'sent', 'received', 'loss_pct', 'rtt_avg_ms'])
+        for src in self.sources:
+            for dst in self.destinations:
+                sent, received, avg = self.results[(src, dst)]
+                writer.writerow([src, dst, sent, received, '%.1f' % loss_pct(sent, received),
+                                 '' if avg is None else '%.3f' % avg])
@@ -0,0 +1,78 @@
+"""
+Warm pool of booted switch containers not connected to any controller.
+
+Creating a switch container and waiting for its OVS daemons takes most
+of a switch start, while connecting it to the controller is a single
+set-manager. Pool containers (dnpool<n>) are created and booted ahead of
+time without a manager; --start-switches renames them to their switch
+names and only sets the manager target, and the pool is refilled
+afterwards. Pool container names never match the ovs switch name filter,
+so they are invisible to every other command until claimed.
+"""
+
+import threading
+
+
+POOL_PREFIX = 'dnpool'
+
+
+def is_pool_name(name):
+    return name.startswith(POOL_PREFIX) and name[len(POOL_PREFIX):].isdigit()
+
+
+def pool_number(name):
+    return int(name[len(POOL_PREFIX):])
+
+
+def new_names(existing, count):
+    # count pool container names not in existing, lowest numbers first
+    taken = set([pool_number(name) for name in existing if is_pool_name(name)])
+    names = []
+    num = 1
+    while len(names) < count:
+        if num not in taken:
+            names.append(POOL_PREFIX + str(num))
+        num += 1
+    return names
+
+
+class Refiller(object):
+    # runs fill() in a background thread, requests made while it runs
+    # coalesce into one more pass with the latest fill
+    def __init__(self):
+        self.error = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._thread = None
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def request(self, fill):
+        with self._lock:
+            self._pending = fill
+            if self._thread is None:
+                self._idle.clear()
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                fill = self._pending
+                self._pending = None
+                if fill is None:
+                    self._thread = None
+                    self._idle.set()
+                    return
+            try:
+                fill()
+                self.error = None
+            except Exception as e:
+                self.error = str(e) or e.__class__.__name__
+
+    def cancel(self, timeout=None):
+        # drop the pending pass and wait for the running one, False on timeout
+        with self._lock:
+            self._pending = None
+        return self._idle.wait(timeout)
@@ -0,0 +1,177 @@
+"""
+Switch container CPU and memory sampling from cgroup accounting files.
+
+Every interval the cgroup v1 or v2 cpu and memory usage files of each
+switch container are read directly, which costs two small file reads per
+container instead of a docker stats call. Usage is kept as a testbed-wide
+time series plus one series per switch; switches sharing a density mode
+container are each charged an equal share of it.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+DEFAULT_CGROUP_ROOT = '/sys/fs/cgroup'
+# container cgroup directories for the systemd and cgroupfs docker drivers
+CGROUP_DIRS = ('system.slice/docker-%s.scope', 'docker/%s')
+CGROUP_V1_CPU_CONTROLLERS = ('cpuacct', 'cpu,cpuacct')
+
+
+def read_int(path):
+    with open(path) as f:
+        return int(f.read().strip())
+
+
+def read_cpu_stat_usec(path):
+    with open(path) as f:
+        for line in f:
+            key, sep, value = line.partition(' ')
+            if key == 'usage_usec':
+                return int(value)
+    return None
+
+
+class ContainerCgroup(object):
+    def __init__(self, cont_id, root=DEFAULT_CGROUP_ROOT):
+        # cgroup files of the container, None when not found on this host
+        self.cpu_path = None
+        self.mem_path = None
+        self.v2 = os.path.exists(os.path.join(root, 'cgroup.controllers'))
+        for cgroup_dir in CGROUP_DIRS:
+            cgroup_dir = cgroup_dir % cont_id
+            if self.v2:
+                path = os.path.join(root, cgroup_dir)
+                if os.path.isdir(path):
+                    self.cpu_path = os.path.join(path, 'cpu.stat')
+                    self.mem_path = os.path.join(path, 'memory.current')
+                    return
+                continue
+            mem_path = os.path.join(root, 'memory', cgroup_dir, 'memory.usage_in_bytes')
+            if not os.path.exists(mem_path):
+                continue
+            self.mem_path = mem_path
+            for controller in CGROUP_V1_CPU_CONTROLLERS:
+                cpu_path = os.path.join(root, controller, cgroup_dir, 'cpuacct.usage')
+                if os.path.exists(cpu_path):
+                    self.cpu_path = cpu_path
+                    break
+            return
+
+    def found(self):
+        return self.mem_path is not None
+
+    def read(self):
+        # (cpu seconds used so far, memory bytes in use)
+        cpu = None
+        if self.cpu_path is not None:
+            if self.v2:
+                cpu = read_cpu_stat_usec(self.cpu_path)
+                cpu = None if cpu is None else cpu / 1e6
+            else:
+                cpu = read_int(self.cpu_path) / 1e9
+        return cpu, read_int(self.mem_path)
+
+
+class ResourceSampler(object):
+    def __init__(self, get_switches, interval=1.0, root=DEFAULT_CGROUP_ROOT):
+        # get_switches() returns a list of (switch name, container id)
+        self.get_switches = get_switches
+        self.interval = interval
+        self.root = root
+        self.series = []
+        self.switches = {}
+        self.missing = set()
+        self._cgroups = {}
+        self._last_cpu = {}
+        self._done = threading.Event()
+        self._thread = None
+        self._watch_start = None
+
+    def start(self):
+        self._watch_start = time.time()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def finish(self):
+        self._done.set()
+        self._thread.join()
+        self.sample(time.time())
+
+    def _run(self):
+        while not self._done.is_set():
+            sample_start = time.time()
+            self.sample(sample_start)
+            self._done.wait(max(0, self.interval - (time.time() - sample_start)))
+
+    def _cgroup(self, cont_id):
+        # lookups are cached once found, a starting container may not have one yet
+        cgroup = self._cgroups.get(cont_id)
+        if cgroup is None:
+            cgroup = ContainerCgroup(cont_id, self.root)
+            if cgroup.found():
+                self._cgroups[cont_id] = cgroup
+        return cgroup
+
+    def sample(self, now):
+        containers = {}
+        for name, cont_id in self.get_switches():
+            if cont_id:
+                containers.setdefault(cont_id, []).append(name)
+
+        t = round(now - self._watch_start, 3)
+        total_cpu = 0.0
+        total_mem = 0
+        sampled = 0
+        for cont_id, names in containers.items():
+            cgroup = self._cgroup(cont_id)
+            if not cgroup.found():
+                self.missing.update(names)
+                continue
+            self.missing.difference_update(names)
+            try:
+                cpu, mem = cgroup.read()
+            except (IOError, OSError, ValueError) as e:
+                # container went away between listing and reading
+                continue
+            cpu_pct = None
+            last = self._last_cpu.get(cont_id)
+            if cpu is not None:
+                if last is not None and now > last[0]:
+                    cpu_pct = 100.0 * (cpu - last[1]) / (now - last[0])
+                self._last_cpu[cont_id] = (now, cpu)
+            sampled += len(names)
+            total_cpu += cpu_pct or 0.0
+            total_mem += mem
+            for name in names:
+                self.switches.setdefault(name, []).append(
+                    [t, None if cpu_pct is None else round(cpu_pct / len(names), 2), mem // len(names)])
+
+        self.series.append({'t': t,
+                            'switches': sampled,
+                            'cpu_pct': round(total_cpu, 2),
+                            'mem_bytes': total_mem})
+
+    def summary(self):
+        peak = max(self.series, key=lambda sample: sample['mem_bytes']) if self.series else None
+        cpu = [sample['cpu_pct'] for sample in self.series[1:]]
+        result = {'samples': len(self.series),
+                  'switches': len(self.switches),
+                  'missing_switches': len(self.missing),
+                  'cpu_pct_avg': round(sum(cpu) / len(cpu), 2) if cpu else None,
+                  'cpu_pct_max': max(cpu) if cpu else None,
+                  'mem_bytes_peak': peak['mem_bytes'] if peak else None,
+                  'mem_bytes_per_switch_at_peak': None}
+        if peak and peak['switches']:
+            result['mem_bytes_per_switch_at_peak'] = peak['mem_bytes'] // peak['switches']
+        return result
+
+    def write_json(self, f):
+        # per switch samples are [t, cpu_pct, mem_bytes]
+        json.dump({'summary': self.summary(),
+                   'series': self.series,
+                   'switches': self.switches}, f)
+        f.write('\n')
@@ -0,0 +1,91 @@
+"""
+Keep-alive HTTP client for the controller northbound REST API.
+"""
+
+import base64
+import json
+import socket
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+from dockernet import trace
+
+
+DEFAULT_REST_PORT = 8181
+
+
+class RestClient(object):
+    def __init__(self, host, port=DEFAULT_REST_PORT, username='admin', password='admin', timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        credentials = ('%s:%s' % (username, password)).encode('utf-8')
+        self.auth_header = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _send(self, method, path, body, span):
+        headers = {'Authorization': self.auth_header,
+                   'Accept': 'application/json'}
+        if body is not None:
+            if not isinstance(body, str):
+                body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        reused = self._conn is not None
+        conn = self._connect()
+        try:
+            conn.request(method, path, body, headers)
+            resp = conn.getresponse()
+        except (socket.error, httplib.HTTPException):
+            self.close()
+            if not reused:
+                raise
+            # server dropped the idle connection, retry once on a fresh one
+            conn = self._connect()
+            conn.request(method, path, body, headers)
+            resp = conn.getresponse()
+        span.status = resp.status
+        return resp
+
+    def request(self, method, path, body=None):
+        with trace.span('rest.' + method, path) as span:
+            resp = self._send(method, path, body, span)
+            data = resp.read()
+            if resp.will_close:
+                self.close()
+
+        return resp.status, data
+
+    def request_stream(self, method, path, consume, body=None):
+        # consume(read) parses a successful response body as it arrives and its
+        # result is returned in place of the body
+        with trace.span('rest.' + method, path) as span:
+            resp = self._send(method, path, body, span)
+            if resp.status >= 300:
+                result = resp.read()
+            else:
+                try:
+                    result = consume(resp.read)
+                except Exception:
+                    # the rest of the body is not worth reading
+                    self.close()
+                    raise
+                if resp.read(1):
+                    self.close()
+            if resp.will_close:
+                self.close()
+
+        return resp.status, result
@@ -0,0 +1,309 @@
+"""
+Controller flow inventory over RESTCONF, parsed as it streams in.
+
+The config and operational opendaylight-inventory trees of a large
+testbed run into hundreds of MB, so they are never held in memory: a pull
+parser reads the response body a chunk at a time, keeps only the node,
+table and flow ids, decodes one flow at a time and skips everything else
+(node connectors, statistics) by scanning for brackets. Config flow ids are kept per
+switch node; every operational node is compared against them and the
+flows its switch reports as soon as it has been read.
+"""
+
+import codecs
+import json
+import re
+
+
+CONFIG_NODES_PATH = '/restconf/config/opendaylight-inventory:nodes'
+OPERATIONAL_NODES_PATH = '/restconf/operational/opendaylight-inventory:nodes'
+READ_SIZE = 65536
+# flows found on a switch that the controller did not configure
+UNMANAGED_FLOW_PREFIX = '#UF$'
+# ids listed per switch for flows not installed
+MAX_LISTED_IDS = 5
+
+# next token after optional whitespace: punctuation, string contents or other scalar
+TOKEN_RE = re.compile(r'[ \t\r\n]*(?:([{}\[\]:,])|"([^"\\]*(?:\\.[^"\\]*)*)"|(-?[0-9][0-9.eE+-]*|true|false|null))')
+# everything up to the next bracket, complete strings included
+SKIP_RE = re.compile(r'[^{}\[\]"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}\[\]"]*)*')
+DECODER = json.JSONDecoder()
+
+
+class JsonError(ValueError):
+    pass
+
+
+class JsonReader(object):
+    # pull parser, memory is bounded by the read size and the longest string
+    def __init__(self, read, read_size=READ_SIZE):
+        self._read = read
+        self._read_size = read_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._pushed = None
+        # start of a value kept in the buffer while it is read
+        self._mark = None
+
+    def _fill(self):
+        keep = self._pos if self._mark is None else self._mark
+        data = self._read(self._read_size)
+        self._buf = self._buf[keep:] + self._decoder.decode(data, final=not data)
+        self._pos -= keep
+        if self._mark is not None:
+            self._mark = 0
+        if not data:
+            self._eof = True
+
+    def next_token(self):
+        # (kind, value), kind is a punctuation character, 'string', 'scalar' or None at the end
+        if self._pushed is not None:
+            token = self._pushed
+            self._pushed = None
+            return token
+        while True:
+            match = TOKEN_RE.match(self._buf, self._pos)
+            # a number or literal ending the buffer may continue in the next chunk
+            if match is not None and (self._eof or match.group(3) is None or match.end() < len(self._buf)):
+                self._pos = match.end()
+                if match.group(1) is not None:
+                    return match.group(1), None
+                if match.group(2) is not None:
+                    value = match.group(2)
+                    return 'string', json.loads('"%s"' % value) if '\\' in value else value
+                try:
+                    return 'scalar', json.loads(match.group(3))
+                except ValueError:
+                    raise JsonError('invalid JSON value %s' % match.group(3))
+            if self._eof:
+                rest = self._buf[self._pos:].strip()
+                if rest:
+                    raise JsonError('invalid JSON near %s' % rest[:40])
+                return None, None
+            self._fill()
+
+    def push_back(self, token):
+        self._pushed = token
+
+    def expect(self, kind):
+        token = self.next_token()
+        if token[0] != kind:
+            raise JsonError('expected %s, got %s' % (kind, token[0] or 'end of data'))
+
+    def iter_object(self):
+        # keys of the next object, the caller reads or skips each value
+        self.expect('{')
+        kind, value = self.next_token()
+        if kind == '}':
+            return
+        while True:
+            if kind != 'string':
+                raise JsonError('expected an object key, got %s' % (kind or 'end of data'))
+            self.expect(':')
+            yield value
+            kind, value = self.next_token()
+            if kind == '}':
+                return
+            if kind != ',':
+                raise JsonError('expected , or }, got %s' % (kind or 'end of data'))
+            kind, value = self.next_token()
+
+    def iter_array(self):
+        # once per element of the next array, the caller reads or skips it
+        self.expect('[')
+        token = self.next_token()
+        if token[0] == ']':
+            return
+        self.push_back(token)
+        while True:
+            yield
+            kind, value = self.next_token()
+            if kind == ']':
+                return
+            if kind != ',':
+                raise JsonError('expected , or ], got %s' % (kind or 'end of data'))
+
+    def read_value(self):
+        token = self.next_token()
+        kind, value = token
+        if kind in ('string', 'scalar'):
+            return value
+        self.push_back(token)
+        if kind == '{':
+            return dict((key, self.read_value()) for key in self.iter_object())
+        if kind == '[':
+            return [self.read_value() for i in self.iter_array()]
+        raise JsonError('expected a value, got %s' % (kind or 'end of data'))
+
+    def _skip_container(self):
+        # from just past an opening bracket to just past its closing one
+        depth = 1
+        while depth:
+            pos = SKIP_RE.match(self._buf, self._pos).end()
+            if pos < len(self._buf) and self._buf[pos] != '"':
+                depth += 1 if self._buf[pos] in '{[' else -1
+                self._pos = pos + 1
+                continue
+            # end of the buffer, or a string that continues in the next chunk
+            self._pos = pos
+            if self._eof:
+                raise JsonError('unexpected end of data')
+            self._fill()
+
+    def skip_value(self):
+        kind, value = self.next_token()
+        if kind in ('{', '['):
+            self._skip_container()
+        elif kind not in ('string', 'scalar'):
+            raise JsonError('expected a value, got %s' % (kind or 'end of data'))
+
+    def read_container(self):
+        # next object or array decoded in one go, much faster than read_value
+        # for values small enough to hold. Decoded straight from the buffer,
+        # values cut off by its end are first scanned to their closing bracket
+        kind, value = self.next_token()
+        if kind not in ('{', '['):
+            raise JsonError('expected an object or array, got %s' % (kind or 'end of data'))
+        start = self._pos - 1
+        try:
+            value, end = DECODER.raw_decode(self._buf, start)
+            self._pos = end
+            return value
+        except ValueError:
+            # cut off at the end of the buffer, or invalid
+            pass
+        self._mark = start
+        try:
+            self._skip_container()
+            text = self._buf[self._mark:self._pos]
+        finally:
+            self._mark = None
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise JsonError('invalid JSON: %s' % e)
+
+
+def local_name(key):
+    # yang member name without its module prefix
+    return key.rpartition(':')[2]
+
+
+def read_table(reader):
+    # (table id, flow ids) of an inventory table
+    table_id = None
+    flow_ids = []
+    for key in reader.iter_object():
+        name = local_name(key)
+        if name == 'id':
+            table_id = reader.read_value()
+        elif name == 'flow':
+            # flows are small, decoded one at a time
+            for i in reader.iter_array():
+                flow_ids.append(reader.read_container().get('id'))
+        else:
+            reader.skip_value()
+    return table_id, flow_ids
+
+
+def read_node(reader):
+    # (node id, {table id: flow ids}) of an inventory node
+    node_id = None
+    tables = {}
+    for key in reader.iter_object():
+        name = local_name(key)
+        if name == 'id':
+            node_id = reader.read_value()
+        elif name == 'table':
+            for i in reader.iter_array():
+                table_id, flow_ids = read_table(reader)
+                tables.setdefault(table_id, []).extend(flow_ids)
+        else:
+            reader.skip_value()
+    return node_id, tables
+
+
+def iter_nodes(reader):
+    # (node id, {table id: flow ids}) of every node of an inventory nodes document
+    for key in reader.iter_object():
+        if local_name(key) != 'nodes':
+            reader.skip_value()
+            continue
+        for key in reader.iter_object():
+            if local_name(key) != 'node':
+                reader.skip_value()
+                continue
+            for i in reader.iter_array():
+                yield read_node(reader)
+
+
+def get_node_id(dpid):
+    # inventory node id of a switch with the hex datapath id
+    return 'openflow:%d' % int(dpid, 16)
+
+
+class InventoryCheck(object):
+    def __init__(self, switches):
+        # switches is a list of (switch name, hex datapath id or None when it
+        # could not be read, {table id: flow count} the switch reports)
+        self.switches = switches
+        self.nodes = {}
+        for name, dpid, tables in switches:
+            if dpid is not None:
+                self.nodes[get_node_id(dpid)] = (name, tables)
+        self.config = {}
+        self.results = {}
+
+    def add_config(self, node_id, tables):
+        if node_id in self.nodes:
+            self.config[node_id] = set([flow_id for flow_ids in tables.values() for flow_id in flow_ids])
+
+    def add_operational(self, node_id, tables):
+        if node_id not in self.nodes:
+            return
+        name, switch_tables = self.nodes[node_id]
+        config_ids = self.config.pop(node_id, set())
+        operational_ids = set()
+        mismatches = {}
+        for table_id in set(tables) | set(switch_tables):
+            flow_ids = tables.get(table_id, [])
+            operational_ids.update(flow_ids)
+            if len(flow_ids) != switch_tables.get(table_id, 0):
+                mismatches[str(table_id)] = {'operational': len(flow_ids), 'switch': switch_tables.get(table_id, 0)}
+        not_installed = sorted(config_ids - operational_ids)
+        self.results[name] = {'switch': name,
+                              'node': node_id,
+                              'connected': True,
+                              'config_flows': len(config_ids),
+                              'operational_flows': sum([len(flow_ids) for flow_ids in tables.values()]),
+                              'switch_flows': sum(switch_tables.values()),
+                              'not_installed': len(not_installed),
+                              'not_installed_ids': not_installed[:MAX_LISTED_IDS],
+                              'unmanaged': len([flow_id for flow_id in operational_ids
+                                                if str(flow_id).startswith(UNMANAGED_FLOW_PREFIX)]),
+                              'table_mismatches': mismatches,
+                              'ok': not not_installed and not mismatches}
+
+    def records(self):
+        # one record per switch, in switch order
+        records = []
+        for name, dpid, tables in self.switches:
+            record = self.results.get(name)
+            if record is None:
+                node_id = get_node_id(dpid) if dpid is not None else None
+                config_ids = self.config.get(node_id, set())
+                record = {'switch': name,
+                          'node': node_id,
+                          'connected': False,
+                          'config_flows': len(config_ids),
+                          'operational_flows': None,
+                          'switch_flows': sum(tables.values()) if dpid is not None else None,
+                          'not_installed': len(config_ids),
+                          'not_installed_ids': sorted(config_ids)[:MAX_LISTED_IDS],
+                          'unmanaged': 0,
+                          'table_mismatches': {},
+                          'ok': False}
+            records.append(record)
+        return records
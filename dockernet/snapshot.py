@@ -0,0 +1,82 @@
+"""
+Flow-state snapshots used to report per-switch flow changes between runs.
+
+Each switch is stored as a fingerprint of its counter-free flow table,
+computed inside the container, plus the count of every normalized flow
+hash, so the index stays small however long the flows are. A switch
+whose fingerprint is unchanged is not re-fetched. The flows of a changed
+switch are fetched and added flows are reported with their text, while
+removed flows, gone from the switch and never stored as text, are
+reported by hash.
+"""
+
+import hashlib
+import json
+import os
+
+from dockernet import flows
+
+
+DEFAULT_SNAPSHOT_FILE = '/tmp/dockernet-flow-snapshot.json'
+
+# strip counters/ages, sort and hash the flow table in the container. The dump
+# is captured first so a failed or empty one exits non-zero instead of hashing
+# nothing, a pipeline's status is its last command's
+FINGERPRINT_SCRIPT = ("dump=$(ovs-ofctl dump-flows -O Openflow13 %s) && [ -n \"$dump\" ] || exit 1; "
+                      "printf '%%s\\n' \"$dump\" | grep ' actions=' | "
+                      "sed -E 's/ *(duration|n_packets|n_bytes|idle_age|hard_age)=[^,]*,//g' | "
+                      "LC_ALL=C sort | md5sum | cut -d' ' -f1")
+
+
+def fingerprint_cmd(bridge='br-int'):
+    return ['sh', '-c', FINGERPRINT_SCRIPT % bridge]
+
+
+def flow_hash(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def hash_flows(output):
+    # {hash: (count, normalized flow)} of a dump-flows output
+    hashed = {}
+    for flow in flows.parse_flows(output):
+        normalized = flows.normalize_flow(flow)
+        key = flow_hash(normalized)
+        hashed[key] = (hashed.get(key, (0, None))[0] + 1, normalized)
+    return hashed
+
+
+class FlowSnapshot(object):
+    def __init__(self, path=DEFAULT_SNAPSHOT_FILE):
+        self.path = path
+        self.switches = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                index = json.load(f)
+            self.switches = index.get('switches', {})
+            if index.get('version') == 1:
+                # version 1 kept the text of each flow hash
+                for switch in self.switches.values():
+                    switch['flows'] = dict((key, 1) for key in switch.get('flows', {}))
+
+    def fingerprint(self, cont_name):
+        return self.switches.get(cont_name, {}).get('fingerprint')
+
+    def update(self, cont_name, fingerprint, hashed):
+        # returns (added normalized flows, removed flow hashes) since the stored snapshot
+        old = self.switches.get(cont_name, {}).get('flows', {})
+        added = []
+        for key, (count, normalized) in hashed.items():
+            added.extend([normalized] * max(0, count - old.get(key, 0)))
+        removed = []
+        for key, count in old.items():
+            removed.extend([key] * max(0, count - hashed.get(key, (0, None))[0]))
+        self.switches[cont_name] = {'fingerprint': fingerprint,
+                                    'flows': dict((key, count) for key, (count, normalized) in hashed.items())}
+        return sorted(added), sorted(removed)
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': 2, 'switches': self.switches}, f)
+        os.rename(tmp_path, self.path)
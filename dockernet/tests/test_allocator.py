@@ -0,0 +1,67 @@
+import pytest
+
+from dockernet import allocator
+
+
+def test_first_address_skips_network_and_gateway():
+    ports = allocator.PortAllocator('20.0.0.0/16', 64)
+    assert ports.ip(1, 1) == '20.0.0.2'
+    assert ports.ip(1, 64) == '20.0.0.65'
+    assert ports.ip(2, 1) == '20.0.0.66'
+    assert ports.locate('20.0.0.0') is None
+    assert ports.locate('20.0.0.1') is None
+
+
+def test_ip_locate_round_trip():
+    ports = allocator.PortAllocator('10.1.0.0/20', 16)
+    seen = set()
+    for sw_num in range(1, ports.max_switches + 1):
+        for port_num in range(1, ports.ports_per_switch + 1):
+            ip = ports.ip(sw_num, port_num)
+            assert ports.locate(ip) == (sw_num, port_num)
+            seen.add(ip)
+    assert len(seen) == ports.max_switches * ports.ports_per_switch
+
+
+def test_limits():
+    ports = allocator.PortAllocator('20.0.0.0/16', 64)
+    # 65536 addresses less network, gateway and broadcast
+    assert ports.max_switches == 1023
+    last = ports.ip(1023, 64)
+    assert last == '20.0.255.193'
+    assert ports.locate(last) == (1023, 64)
+    assert ports.locate('20.0.255.194') is None
+    assert ports.locate('20.0.255.255') is None
+    assert ports.locate('20.1.0.2') is None
+    assert ports.locate('not an ip') is None
+    for sw_num, port_num in ((0, 1), (1, 0), (1024, 1), (1, 65)):
+        with pytest.raises(allocator.AllocationError):
+            ports.ip(sw_num, port_num)
+    ports.check(1023, 64)
+    with pytest.raises(allocator.AllocationError):
+        ports.check(1024, 1)
+    with pytest.raises(allocator.AllocationError):
+        ports.check(1, 65)
+
+
+def test_small_pool_never_hands_out_broadcast():
+    ports = allocator.PortAllocator('192.168.0.0/29', 2)
+    assert ports.max_switches == 2
+    assert [ports.ip(sw, port) for sw in (1, 2) for port in (1, 2)] == \
+        ['192.168.0.2', '192.168.0.3', '192.168.0.4', '192.168.0.5']
+
+
+@pytest.mark.parametrize('cidr', ['20.0.0.0', '20.0.0.0/31', '20.0.0.0/x', '300.0.0.0/16', '20.0.0.0/-1'])
+def test_invalid_cidr(cidr):
+    with pytest.raises(allocator.AllocationError):
+        allocator.PortAllocator(cidr)
+
+
+def test_host_bits_are_masked():
+    assert allocator.parse_cidr('20.0.5.7/16') == (allocator.parse_cidr('20.0.0.0/16')[0], 16)
+
+
+def test_names_fit_interface_limit():
+    assert allocator.tap_name(allocator.MAX_SWITCHES, allocator.MAX_PORTS) == 'tap999999-9999'
+    assert len(allocator.tap_name(allocator.MAX_SWITCHES, allocator.MAX_PORTS)) <= 15
+    assert allocator.mac_addr(0x010203, 0x0405) == '02:01:02:03:04:05'
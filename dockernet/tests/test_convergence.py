@@ -0,0 +1,89 @@
+from dockernet import convergence
+
+
+def poll(switch, polls, stable_polls=3):
+    # polls: (time, connected, flow_count)
+    for now, connected, flow_count in polls:
+        switch.update(now, connected, flow_count, stable_polls)
+    return switch
+
+
+def test_stable_after_count_stops_changing():
+    switch = poll(convergence.SwitchConvergence('ovs1', 0.0),
+                  [(1, False, 0), (2, True, 0), (3, True, 4), (4, True, 9), (5, True, 9), (6, True, 9)])
+    assert switch.connected_at == 2
+    assert not switch.converged()
+    switch.update(7, True, 9, 3)
+    assert switch.converged()
+    assert switch.stable_at == 4
+    assert switch.record() == {'switch': 'ovs1', 'time_to_connect': 2.0, 'time_to_flows': 4.0, 'flow_count': 9}
+
+
+def test_switch_without_flows_converges():
+    switch = poll(convergence.SwitchConvergence('ovs1', 0.0),
+                  [(1, True, 0), (2, True, 0), (3, True, 0), (4, True, 0)])
+    assert switch.converged()
+    assert switch.stable_at == 1
+    assert switch.flow_count == 0
+
+
+def test_count_before_connecting_is_not_stability():
+    switch = poll(convergence.SwitchConvergence('ovs1', 0.0),
+                  [(1, False, 5), (2, False, 5), (3, False, 5), (4, False, 5), (5, True, 5)])
+    assert not switch.converged()
+    poll(switch, [(6, True, 5), (7, True, 5)])
+    assert switch.converged()
+    # the count stood since 1, the controller only counts from the connection
+    assert switch.stable_at == 5
+
+
+def test_failed_polls_are_unknown():
+    switch = poll(convergence.SwitchConvergence('ovs1', 0.0),
+                  [(1, True, 7), (2, True, None), (3, True, None), (4, True, None), (5, True, None)])
+    assert switch.flow_count is None
+    assert not switch.converged()
+    assert switch.record()['flow_count'] is None
+
+
+def test_failed_poll_restarts_stability():
+    switch = poll(convergence.SwitchConvergence('ovs1', 0.0),
+                  [(1, True, 7), (2, True, 7), (3, True, None), (4, True, 7), (5, True, 7)])
+    switch.update(6, True, 7, 3)
+    assert not switch.converged()
+    switch.update(7, True, 7, 3)
+    assert switch.converged()
+    # the count is only known again from 4
+    assert switch.stable_at == 4
+
+
+def test_stable_at_is_kept():
+    switch = poll(convergence.SwitchConvergence('ovs1', 0.0),
+                  [(1, True, 3), (2, True, 3), (3, True, 3), (4, True, 3), (5, True, 8), (6, True, None)])
+    assert switch.stable_at == 1
+    assert switch.converged()
+
+
+def test_parse_ovs_show_connected():
+    show = '''abc
+    Manager "tcp:10.0.0.1:6640"
+        is_connected: true
+    Bridge br-int
+        Controller "tcp:10.0.0.1:6653"
+            is_connected: true
+        Port br-int
+    Bridge ovs2
+        Controller "tcp:10.0.0.1:6653"
+        Port ovs2
+'''
+    assert convergence.parse_ovs_show_connected(show, 'br-int')
+    assert not convergence.parse_ovs_show_connected(show, 'ovs2')
+    assert not convergence.parse_ovs_show_connected(show)
+    assert not convergence.parse_ovs_show_connected(show.replace('is_connected: true', 'is_connected: false', 1),
+                                                    'br-int')
+
+
+def test_percentile():
+    assert convergence.percentile([], 50) is None
+    assert convergence.percentile([3, 1, 2, 4], 50) == 2
+    assert convergence.percentile([3, 1, 2, 4], 100) == 4
+    assert convergence.percentile([3, 1, 2, 4], 0) == 1
@@ -0,0 +1,70 @@
+from dockernet import flows
+
+
+DUMP = '''NXST_FLOW reply (xid=0x4):
+ cookie=0x8000001, duration=12.345s, table=0, n_packets=10, n_bytes=840, idle_age=3, priority=5,in_port=1 actions=write_metadata:0x1/0xff,goto_table:17
+ cookie=0x0, duration=1.2s, table=17, n_packets=0, n_bytes=0, reset_counts priority=10,tcp,nw_dst=10.0.0.1,tp_dst=80 actions=drop
+ table=48, n_packets=0, n_bytes=0, actions=resubmit(,49),resubmit(,50)
+'''
+
+
+def test_parse_flow_fields():
+    flow = flows.parse_flow(DUMP.split('\n')[1])
+    assert flow == {'cookie': '0x8000001',
+                    'duration': '12.345s',
+                    'idle_age': '3',
+                    'table': 0,
+                    'priority': 5,
+                    'match': 'in_port=1',
+                    'actions': 'write_metadata:0x1/0xff,goto_table:17',
+                    'n_packets': 10,
+                    'n_bytes': 840}
+
+
+def test_parse_flow_flags_and_defaults():
+    flow = flows.parse_flow(DUMP.split('\n')[2])
+    assert flow['match'] == 'reset_counts,tcp,nw_dst=10.0.0.1,tp_dst=80'
+    assert flow['priority'] == 10
+    assert flow['actions'] == 'drop'
+
+    flow = flows.parse_flow(DUMP.split('\n')[3])
+    assert flow['table'] == 48
+    assert flow['cookie'] == '0x0'
+    assert flow['priority'] == flows.DEFAULT_PRIORITY
+    assert flow['match'] == ''
+    assert flow['actions'] == 'resubmit(,49),resubmit(,50)'
+
+
+def test_parse_flow_ignores_other_lines():
+    assert flows.parse_flow('NXST_FLOW reply (xid=0x4):') is None
+    assert flows.parse_flow('') is None
+    assert flows.parse_flow('ovs-ofctl: br-int is not a bridge or a socket') is None
+
+
+def test_parse_flows():
+    parsed = flows.parse_flows(DUMP)
+    assert [flow['table'] for flow in parsed] == [0, 17, 48]
+    assert flows.table_histogram(parsed) == {0: 1, 17: 1, 48: 1}
+
+
+def test_normalize_flow_ignores_counters():
+    line = DUMP.split('\n')[1]
+    later = line.replace('duration=12.345s', 'duration=99.1s').replace('n_packets=10', 'n_packets=12') \
+        .replace('n_bytes=840', 'n_bytes=1008').replace('idle_age=3', 'idle_age=0')
+    normalized = flows.normalize_flow(flows.parse_flow(line))
+    assert normalized == 'table=0, cookie=0x8000001, priority=5,in_port=1 actions=write_metadata:0x1/0xff,goto_table:17'
+    assert flows.normalize_flow(flows.parse_flow(later)) == normalized
+
+
+def test_normalize_flow_tells_flows_apart():
+    line = DUMP.split('\n')[1]
+    normalized = flows.normalize_flow(flows.parse_flow(line))
+    for changed in (line.replace('table=0', 'table=1'), line.replace('cookie=0x8000001', 'cookie=0x8000002'),
+                    line.replace('priority=5', 'priority=6'), line.replace('in_port=1', 'in_port=2'),
+                    line.replace('goto_table:17', 'goto_table:18')):
+        assert flows.normalize_flow(flows.parse_flow(changed)) != normalized
+
+
+def test_normalize_flow_default_priority():
+    flow = flows.parse_flow(DUMP.split('\n')[3])
+    assert flows.normalize_flow(flow) == 'table=48, cookie=0x0, priority=32768, actions=resubmit(,49),resubmit(,50)'
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import json
+import socket
+
+import pytest
+
+from dockernet import ovsdb
+
+
+MESSAGES = [{'id': 1, 'method': 'echo', 'params': []},
+            {'id': 2, 'result': [{'rows': [{'name': 'br "int"\\', 'ext': ['map', [['k', u'é☃\U0001f600']]]}]}],
+             'error': None},
+            {'id': None, 'method': 'update', 'params': ['{not json}', {'Port': {}}]}]
+
+
+def feed_chunks(data, size):
+    stream = ovsdb.JsonStream()
+    texts = []
+    for i in range(0, len(data), size):
+        texts.extend(stream.feed(data[i:i + size]))
+    return texts
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 4096])
+def test_feed_across_chunks(size):
+    data = ''.join([json.dumps(message, ensure_ascii=False) for message in MESSAGES]).encode('utf-8')
+    assert feed_chunks(data, size) == MESSAGES
+
+
+def test_escaped_backslash_and_quote_split():
+    data = b'{"a": "x\\\\"}{"b": "\\"}"}'
+    for size in range(1, len(data)):
+        assert feed_chunks(data, size) == [{'a': 'x\\'}, {'b': '"}'}]
+
+
+def test_incomplete_text_waits_for_more():
+    stream = ovsdb.JsonStream()
+    assert stream.feed(b'{"id": 1, "result": [') == []
+    assert stream.feed(b'1]}\n{"id"') == [{'id': 1, 'result': [1]}]
+    assert stream.feed(b': 2}') == [{'id': 2}]
+
+
+def test_parse_remote():
+    assert ovsdb.parse_remote('unix:/var/run/openvswitch/db.sock') == (socket.AF_UNIX, '/var/run/openvswitch/db.sock')
+    assert ovsdb.parse_remote('tcp:172.17.0.2:6640') == (socket.AF_INET, ('172.17.0.2', 6640))
+    for remote in ('ssl:1.2.3.4:6640', 'tcp:1.2.3.4', 'unix:', 'tcp::6640'):
+        with pytest.raises(ovsdb.OvsdbError):
+            ovsdb.parse_remote(remote)
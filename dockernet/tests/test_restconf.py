@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+import pytest
+
+from dockernet import restconf
+
+
+DOC = {'nodes': {'node': [{'id': 'openflow:1',
+                           'flow-node-inventory:table': [{'id': 0, 'flow': [{'id': 'a\\"b'}]}],
+                           'note': u'café ☃ \U0001f600',
+                           'quoted': 'say "hi"\\',
+                           'n': [-1.5e3, 0, 12345678901234, True, False, None]}]}}
+
+
+def reader(data, read_size):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return restconf.JsonReader(io.BytesIO(data).read, read_size)
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 7, 65536])
+def test_read_value_across_chunks(read_size):
+    r = reader(json.dumps(DOC, ensure_ascii=False), read_size)
+    assert r.read_value() == DOC
+    assert r.next_token() == (None, None)
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 5, 65536])
+def test_read_container_across_chunks(read_size):
+    r = reader(json.dumps([DOC, DOC]), read_size)
+    assert r.read_container() == [DOC, DOC]
+
+
+@pytest.mark.parametrize('read_size', [1, 4, 65536])
+def test_skip_value_keeps_position(read_size):
+    text = '{"skip": [{"x": "]}\\"["}, [1, [2]]], "keep": "%s"}' % u'é'
+    r = reader(text, read_size)
+    keys = []
+    for key in r.iter_object():
+        keys.append(key)
+        if key == 'skip':
+            r.skip_value()
+        else:
+            assert r.read_value() == u'é'
+    assert keys == ['skip', 'keep']
+
+
+def test_multibyte_character_split_between_reads():
+    data = u'["é☃\U0001f600"]'.encode('utf-8')
+    chunks = [data[:3], data[3:4], data[4:7], data[7:]]
+
+    def read(size):
+        return chunks.pop(0) if chunks else b''
+    assert restconf.JsonReader(read).read_value() == [u'é☃\U0001f600']
+
+
+def test_number_at_chunk_end_is_not_cut():
+    r = reader('[12345, true]', 3)
+    assert r.read_value() == [12345, True]
+
+
+def test_escaped_quote_at_chunk_end():
+    for size in range(1, 8):
+        r = reader('["a\\\\", "b\\"c"]', size)
+        assert r.read_value() == ['a\\', 'b"c']
+
+
+@pytest.mark.parametrize('text', ['{"a": 1', '[1, 2', '{"a" 1}', '[1 2]', '"open', '{"a": tru}'])
+def test_invalid_json(text):
+    with pytest.raises(restconf.JsonError):
+        reader(text, 2).read_value()
+
+
+def test_truncated_skip():
+    r = reader('[{"a": [1, 2]', 3)
+    with pytest.raises(restconf.JsonError):
+        r.skip_value()
@@ -0,0 +1,89 @@
+import json
+import threading
+
+import pytest
+
+from dockernet import topology
+
+
+def test_runs_after_deps():
+    graph = topology.TaskGraph()
+    lock = threading.Lock()
+    ran = []
+
+    def step(name):
+        def run():
+            with lock:
+                ran.append(name)
+        return run
+
+    graph.add('network', step('network'))
+    graph.add('subnet', step('subnet'), ['network'])
+    for sw in range(1, 6):
+        graph.add('start%d' % sw, step('start%d' % sw))
+        graph.add('bind%d' % sw, step('bind%d' % sw), ['start%d' % sw, 'subnet'])
+    graph.add('verify', step('verify'), ['bind%d' % sw for sw in range(1, 6)])
+    settled = []
+    graph.run(workers=4, on_done=lambda task: settled.append(task.name))
+
+    assert sorted(ran) == sorted(graph.order)
+    assert sorted(settled) == sorted(graph.order)
+    for name in graph.order:
+        for dep in graph.tasks[name].deps:
+            assert ran.index(dep) < ran.index(name)
+    assert ran[-1] == 'verify'
+    assert graph.summary() == {topology.DONE: 13, topology.FAILED: 0, topology.SKIPPED: 0}
+
+
+def test_failure_skips_dependents_only():
+    graph = topology.TaskGraph()
+    ran = []
+
+    def fail():
+        raise topology.TaskError('no network')
+
+    graph.add('network', fail)
+    graph.add('subnet', lambda: ran.append('subnet'), ['network'])
+    graph.add('bind', lambda: ran.append('bind'), ['subnet'])
+    graph.add('start', lambda: ran.append('start'))
+    graph.add('verify', lambda: ran.append('verify'), ['start', 'bind'])
+    settled = []
+    graph.run(workers=2, on_done=lambda task: settled.append(task.name))
+
+    assert ran == ['start']
+    assert graph.tasks['network'].state == topology.FAILED
+    assert str(graph.tasks['network'].error) == 'no network'
+    for name in ('subnet', 'bind', 'verify'):
+        assert graph.tasks[name].state == topology.SKIPPED
+    assert graph.tasks['start'].state == topology.DONE
+    # every task settles exactly once
+    assert sorted(settled) == sorted(graph.order)
+    assert graph.summary() == {topology.DONE: 1, topology.FAILED: 1, topology.SKIPPED: 3}
+
+
+def test_add_rejects_unknown_and_duplicate_steps():
+    graph = topology.TaskGraph()
+    graph.add('a', lambda: None)
+    with pytest.raises(ValueError):
+        graph.add('a', lambda: None)
+    with pytest.raises(ValueError):
+        graph.add('b', lambda: None, ['c'])
+
+
+def test_empty_graph():
+    graph = topology.TaskGraph()
+    graph.run(workers=4)
+    assert graph.summary() == {topology.DONE: 0, topology.FAILED: 0, topology.SKIPPED: 0}
+
+
+def test_load_topology(tmpdir):
+    path = tmpdir.join('topology.json')
+    path.write(json.dumps({'switches': 4, 'ports_per_switch': 2, 'network': True, 'subnet': True,
+                           'bind_ports': True, 'verify': ['ping-all']}))
+    loaded = topology.load_topology(str(path))
+    assert loaded['switches'] == 4
+    assert loaded['controller_ip'] is None
+    for bad in ({'switches': -1}, {'subnet': True}, {'bind_ports': True}, {'verify': ['nope']}, {'unknown': 1}, []):
+        path.write(json.dumps(bad))
+        with pytest.raises(ValueError):
+            topology.load_topology(str(path))
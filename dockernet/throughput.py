@@ -0,0 +1,357 @@
+"""
+Datapath throughput between VM ports of different switches.
+
+Every pair is a source VM port and a destination VM port on another
+switch container; the VM ports of a switch share its container's network
+namespace, so traffic between them is delivered locally and never enters
+OVS. Receivers for all destinations of a container are started in the
+background by one exec, then one exec per source container starts all
+its transfers at once and prints their results, and a last exec per
+destination container collects what the receivers saw and stops them.
+iperf3 or iperf run the transfers when the image has them, otherwise a
+small bundled python sender/receiver does.
+"""
+
+import json
+
+
+TOOLS = ('iperf3', 'iperf', 'builtin')
+DEFAULT_BASE_PORT = 5201
+WORK_DIR = '/tmp/dockernet-throughput'
+# first of the interpreters and tools present in a container
+DETECT_CMD = ['sh', '-c', 'for t in iperf3 iperf python3 python; do command -v $t >/dev/null 2>&1 && echo $t; done']
+# a receiver waits this long past the transfer time for its senders
+SERVER_GRACE = 15
+# UDP rate of iperf, which has no unlimited setting, when no bandwidth is given
+IPERF_MAX_MBPS = 100000
+UDP_PAYLOAD = 1470
+
+BUILTIN_SCRIPT = r'''
+import json, socket, sys, threading, time
+mode, proto, ip, port = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+duration, streams, mbps = float(sys.argv[5]), int(sys.argv[6]), float(sys.argv[7])
+dst = sys.argv[8] if len(sys.argv) > 8 else None
+totals = {'bytes': 0, 'packets': 0}
+lock = threading.Lock()
+def add(nbytes, npackets):
+    with lock:
+        totals['bytes'] += nbytes
+        totals['packets'] += npackets
+def tcp_recv(conn):
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        add(len(data), 0)
+    conn.close()
+def tcp_send():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((ip, 0))
+    sock.connect((dst, port))
+    buf = b'\0' * 131072
+    end = time.time() + duration
+    while time.time() < end:
+        add(sock.send(buf), 0)
+    sock.close()
+def udp_send():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((ip, 0))
+    buf = b'\0' * %(payload)d
+    start = time.time()
+    end = start + duration
+    gap = len(buf) * 8 / (mbps * 1e6 / streams) if mbps else 0
+    sent = 0
+    while True:
+        now = time.time()
+        if now >= end:
+            break
+        if gap and now < start + sent * gap:
+            time.sleep(min(start + sent * gap - now, 0.01))
+            continue
+        try:
+            add(sock.sendto(buf, (dst, port)), 1)
+            sent += 1
+        except socket.error:
+            pass
+    sock.close()
+start = time.time()
+if mode == 'server':
+    deadline = start + duration + %(grace)d
+    if proto == 'tcp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((ip, port))
+        sock.listen(streams)
+        threads = []
+        while len(threads) < streams and time.time() < deadline:
+            sock.settimeout(max(deadline - time.time(), 0.1))
+            try:
+                conn, addr = sock.accept()
+            except socket.timeout:
+                break
+            conn.settimeout(None)
+            thread = threading.Thread(target=tcp_recv, args=(conn,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join(max(deadline - time.time(), 0))
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4194304)
+        sock.bind((ip, port))
+        first = None
+        while time.time() < deadline:
+            sock.settimeout(2.0 if first else max(deadline - time.time(), 0.1))
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                if first:
+                    break
+                continue
+            if first is None:
+                first = time.time()
+            add(len(data), 1)
+else:
+    threads = [threading.Thread(target=tcp_send if proto == 'tcp' else udp_send) for i in range(streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+totals['seconds'] = time.time() - start
+sys.stdout.write(json.dumps(totals) + '\n')
+''' % {'payload': UDP_PAYLOAD, 'grace': SERVER_GRACE}
+
+
+def choose_tool(available, wanted='auto'):
+    # (tool, python interpreter for the builtin tool) from DETECT_CMD output
+    available = available.split()
+    python = ([name for name in available if name.startswith('python')] or [None])[0]
+    if wanted == 'auto':
+        for tool in ('iperf3', 'iperf'):
+            if tool in available:
+                return tool, None
+        wanted = 'builtin'
+    if wanted == 'builtin':
+        if python is None:
+            raise ValueError('no iperf3, iperf or python in the switch image')
+        return wanted, python
+    if wanted not in available:
+        raise ValueError('no %s in the switch image' % wanted)
+    return wanted, None
+
+
+def pick_pairs(ports, count):
+    # ports is a list of (switch, container, ip) in switch order; count
+    # (src, dst) pairs, sources spread over switches, each destination on the
+    # next switch that runs in another container
+    by_switch = []
+    for switch, container, ip in ports:
+        if not by_switch or by_switch[-1][0] != switch:
+            by_switch.append((switch, []))
+        by_switch[-1][1].append((switch, container, ip))
+    # first ports of every switch, then second ports, and so on
+    order = []
+    for i in range(max([len(switch_ports) for switch, switch_ports in by_switch] or [0])):
+        order.extend([switch_ports[i] for switch, switch_ports in by_switch if i < len(switch_ports)])
+    pairs = []
+    for k, src in enumerate(order):
+        if len(pairs) >= count:
+            break
+        for step in range(1, len(order)):
+            dst = order[(k + step) % len(order)]
+            if dst[1] != src[1]:
+                pairs.append((src, dst))
+                break
+    return pairs
+
+
+def builtin_setup():
+    # writes the bundled tool into the work dir
+    return "mkdir -p %s\ncat > %s/dntp.py <<'DNTP_EOF'\n%s\nDNTP_EOF\n" % (WORK_DIR, WORK_DIR, BUILTIN_SCRIPT.strip())
+
+
+def server_cmd(tool, proto, ip, port, duration, streams, python=None):
+    if tool == 'iperf3':
+        return 'iperf3 -s -1 -B %s -p %d' % (ip, port)
+    if tool == 'iperf':
+        return 'iperf -s -B %s -p %d%s' % (ip, port, ' -u' if proto == 'udp' else '')
+    return '%s %s/dntp.py server %s %s %d %d %d 0' % (python, WORK_DIR, proto, ip, port, duration, streams)
+
+
+def client_cmd(tool, proto, src, dst, port, duration, streams, mbps, python=None):
+    if tool == 'iperf3':
+        cmd = 'iperf3 -J -c %s -B %s -p %d -t %d -P %d' % (dst, src, port, duration, streams)
+        if proto == 'udp':
+            # -b is per stream, 0 is unlimited
+            cmd += ' -u -l %d -b %dK' % (UDP_PAYLOAD, int(mbps * 1000 / streams))
+        return cmd
+    if tool == 'iperf':
+        cmd = 'iperf -y C -c %s -B %s -p %d -t %d -P %d' % (dst, src, port, duration, streams)
+        if proto == 'udp':
+            cmd += ' -u -l %d -b %dK' % (UDP_PAYLOAD, int((mbps or IPERF_MAX_MBPS) * 1000 / streams))
+        return cmd
+    return '%s %s/dntp.py client %s %s %d %d %d %s %s' % (python, WORK_DIR, proto, src, port, duration,
+                                                         streams, mbps, dst)
+
+
+def build_server_script(tool, proto, servers, duration, streams, python=None):
+    # servers is a list of (ip, port), each receiver runs in the background
+    lines = [builtin_setup() if tool == 'builtin' else 'mkdir -p %s\n' % WORK_DIR]
+    for ip, port in servers:
+        lines.append('nohup %s > %s/%d.out 2>&1 < /dev/null &\necho $! > %s/%d.pid\n' %
+                     (server_cmd(tool, proto, ip, port, duration, streams, python), WORK_DIR, port, WORK_DIR, port))
+    # receivers listen before the senders start
+    lines.append('sleep 1\n')
+    return ['sh', '-c', ''.join(lines)]
+
+
+def build_client_script(tool, proto, clients, duration, streams, mbps, python=None):
+    # clients is a list of (src, dst, port), all transfers run at once
+    lines = [builtin_setup() if tool == 'builtin' else '', 'd=$(mktemp -d)\n']
+    for n, (src, dst, port) in enumerate(clients):
+        lines.append('(echo "@@ PAIR %s %s %d"; %s 2>&1) > "$d/%d" &\n' %
+                     (src, dst, port, client_cmd(tool, proto, src, dst, port, duration, streams, mbps, python), n))
+    lines.append('wait\nfind "$d" -type f -exec cat {} +\nrm -rf "$d"\n')
+    return ['sh', '-c', ''.join(lines)]
+
+
+def build_collect_script(ports, wait=False):
+    # receiver output of every port, then the receivers are stopped. With wait,
+    # receivers get up to SERVER_GRACE seconds in all to finish and report
+    lines = ['i=0\n']
+    for port in ports:
+        path = '%s/%d' % (WORK_DIR, port)
+        lines.append('p=$(cat %s.pid 2>/dev/null)\n' % path)
+        if wait:
+            lines.append('while [ -n "$p" ] && kill -0 $p 2>/dev/null && [ $i -lt %d ]; do sleep 0.1; i=$((i+1)); done\n' %
+                         (SERVER_GRACE * 10))
+        lines.append('echo "@@ PORT %d"; cat %s.out 2>/dev/null; [ -n "$p" ] && kill $p 2>/dev/null\n'
+                     'rm -f %s.out %s.pid\n' % (port, path, path, path))
+    lines.append('true\n')
+    return ['sh', '-c', ''.join(lines)]
+
+
+def split_sections(output, marker):
+    # map of marker line fields to the text following the marker line
+    sections = {}
+    key = None
+    for line in output.split('\n'):
+        if line.startswith(marker):
+            key = tuple(line[len(marker):].split())
+            sections[key] = []
+        elif key is not None:
+            sections[key].append(line)
+    return dict((key, '\n'.join(lines)) for key, lines in sections.items())
+
+
+def parse_iperf3(proto, text):
+    report = json.loads(text[text.index('{'):])
+    if report.get('error'):
+        raise ValueError(report['error'])
+    end = report['end']
+    if proto == 'tcp':
+        return {'bytes': end['sum_received']['bytes'],
+                'seconds': end['sum_received']['seconds'],
+                'retransmits': end.get('sum_sent', {}).get('retransmits')}
+    total = end['sum']
+    received = total['packets'] - total['lost_packets']
+    return {'bytes': total['bytes'] * received // max(total['packets'], 1),
+            'seconds': total['seconds'],
+            'sent_packets': total['packets'],
+            'packets': received}
+
+
+def parse_iperf(proto, text):
+    # -y C lines, the sum line of -P has stream id -1, UDP server reports have 14 fields
+    rows = [line.split(',') for line in text.split('\n') if line.count(',') >= 8]
+    if proto == 'udp':
+        rows = [row for row in rows if len(row) >= 14]
+    elif len(rows) > 1:
+        rows = [row for row in rows if row[5] == '-1'] or rows
+    if not rows:
+        raise ValueError(text.strip().split('\n')[-1] if text.strip() else 'no iperf report')
+    seconds = max([float(row[6].split('-')[1]) for row in rows])
+    result = {'bytes': sum([int(row[7]) for row in rows]), 'seconds': seconds}
+    if proto == 'udp':
+        result['sent_packets'] = sum([int(row[11]) for row in rows])
+        result['packets'] = result['sent_packets'] - sum([int(row[10]) for row in rows])
+    return result
+
+
+def parse_builtin(proto, text, server_text):
+    client = json.loads(text.strip().split('\n')[-1])
+    server = json.loads(server_text.strip().split('\n')[-1])
+    if proto == 'tcp':
+        return {'bytes': server['bytes'], 'seconds': client['seconds']}
+    return {'bytes': server['bytes'],
+            'seconds': client['seconds'],
+            'sent_packets': client['packets'],
+            'packets': server['packets']}
+
+
+def parse_result(tool, proto, text, server_text=''):
+    # raw numbers of a transfer, ValueError when the tool reported none
+    try:
+        if tool == 'iperf3':
+            return parse_iperf3(proto, text)
+        if tool == 'iperf':
+            return parse_iperf(proto, text)
+        return parse_builtin(proto, text, server_text)
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        lines = [line for line in text.strip().split('\n') if line.strip()]
+        raise ValueError(str(e) or (lines[-1] if lines else 'no result'))
+
+
+def loss_pct(sent, received):
+    if not sent:
+        return 100.0
+    return round(100.0 * (sent - received) / sent, 3)
+
+
+def pair_record(src, dst, result=None, error=None):
+    # per pair record, rates over the transfer time
+    record = {'src_switch': src[0],
+              'src': src[2],
+              'dst_switch': dst[0],
+              'dst': dst[2],
+              'bytes': None,
+              'seconds': None,
+              'gbps': None,
+              'pps': None,
+              'loss_pct': None,
+              'packets': None,
+              'sent_packets': None,
+              'error': error}
+    if result is None:
+        return record
+    seconds = max(result['seconds'], 1e-6)
+    record['bytes'] = result['bytes']
+    record['seconds'] = round(result['seconds'], 3)
+    record['gbps'] = round(result['bytes'] * 8 / seconds / 1e9, 4)
+    if 'packets' in result:
+        record['packets'] = result['packets']
+        record['sent_packets'] = result['sent_packets']
+        record['pps'] = round(result['packets'] / seconds, 1)
+        record['loss_pct'] = loss_pct(result['sent_packets'], result['packets'])
+    if result.get('retransmits') is not None:
+        record['retransmits'] = result['retransmits']
+    return record
+
+
+def summary(records):
+    # aggregate of the pairs that reported, their transfers ran at the same time
+    done = [record for record in records if record['error'] is None]
+    result = {'pairs': len(records),
+              'failed': len(records) - len(done),
+              'gbps': round(sum([record['gbps'] for record in done]), 4),
+              'pair_gbps_min': min([record['gbps'] for record in done]) if done else None,
+              'pair_gbps_max': max([record['gbps'] for record in done]) if done else None,
+              'pps': None,
+              'loss_pct': None}
+    udp = [record for record in done if record['packets'] is not None]
+    if udp:
+        result['pps'] = round(sum([record['pps'] for record in udp]), 1)
+        result['loss_pct'] = loss_pct(sum([record['sent_packets'] for record in udp]),
+                                      sum([record['packets'] for record in udp]))
+    return result
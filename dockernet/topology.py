@@ -0,0 +1,159 @@
+"""
+Declarative testbed topology and a dependency graph scheduler.
+
+A topology file describes the desired testbed (switch count, ports per
+switch, neutron network/subnet, verification steps). It is turned into
+a graph of steps where each switch is pipelined on its own, so one
+switch can be binding ports while another is still starting; barriers
+exist only where a step really needs every switch (or the network).
+"""
+
+import json
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from multiprocessing.pool import ThreadPool
+
+
+VERIFY_STEPS = ('ping-all', 'flow-count', 'ovs-show')
+TOPOLOGY_DEFAULTS = {'controller_ip': None,
+                     'switches': 0,
+                     'ports_per_switch': 0,
+                     'network': False,
+                     'subnet': False,
+                     'bind_ports': False,
+                     'verify': []}
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class TaskError(Exception):
+    pass
+
+
+def load_topology(path):
+    with open(path) as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError('topology must be a JSON object')
+
+    unknown = [key for key in spec if key not in TOPOLOGY_DEFAULTS]
+    if unknown:
+        raise ValueError('unknown topology keys: %s' % ', '.join(sorted(unknown)))
+    topology = dict(TOPOLOGY_DEFAULTS)
+    topology.update(spec)
+
+    for key in ('switches', 'ports_per_switch'):
+        if not isinstance(topology[key], int) or topology[key] < 0:
+            raise ValueError('%s must be a non-negative integer' % key)
+    if topology['subnet'] and not topology['network']:
+        raise ValueError('subnet requires network')
+    if topology['bind_ports'] and not (topology['subnet'] and topology['ports_per_switch']):
+        raise ValueError('bind_ports requires subnet and ports_per_switch')
+    for step in topology['verify']:
+        if step not in VERIFY_STEPS:
+            raise ValueError('unknown verify step %s, expected one of %s' % (step, ', '.join(VERIFY_STEPS)))
+
+    return topology
+
+
+class Task(object):
+    def __init__(self, name, func, deps):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.dependents = []
+        self.state = None
+        self.error = None
+        self.duration = None
+
+
+class TaskGraph(object):
+    def __init__(self):
+        self.tasks = {}
+        self.order = []
+
+    def add(self, name, func, deps=()):
+        # deps must already be in the graph, so it can never contain a cycle
+        if name in self.tasks:
+            raise ValueError('duplicate step %s' % name)
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError('step %s depends on unknown step %s' % (name, dep))
+        task = Task(name, func, deps)
+        self.tasks[name] = task
+        self.order.append(name)
+        for dep in deps:
+            self.tasks[dep].dependents.append(name)
+        return name
+
+    def run(self, workers=1, on_done=None):
+        # run every task as soon as all of its deps are done, on up to workers
+        # threads; dependents of a failed task are skipped, never run.
+        # on_done(task) is called from this thread as each task settles.
+        if not self.tasks:
+            return
+        finished = queue.Queue()
+        waiting = dict((name, len(self.tasks[name].deps)) for name in self.order)
+        pool = ThreadPool(max(1, min(workers, len(self.tasks))))
+        running = [0]
+
+        def call(task):
+            start_time = time.time()
+            try:
+                task.func()
+                task.state = DONE
+            except Exception as e:
+                task.state = FAILED
+                task.error = e
+            task.duration = time.time() - start_time
+            finished.put(task)
+
+        def submit(task):
+            running[0] += 1
+            pool.apply_async(call, (task,))
+
+        def skip(task):
+            task.state = SKIPPED
+            if on_done is not None:
+                on_done(task)
+            for name in task.dependents:
+                dependent = self.tasks[name]
+                if dependent.state is None:
+                    skip(dependent)
+
+        try:
+            for name in self.order:
+                if not waiting[name]:
+                    submit(self.tasks[name])
+            while running[0]:
+                task = finished.get()
+                running[0] -= 1
+                if on_done is not None:
+                    on_done(task)
+                for name in task.dependents:
+                    dependent = self.tasks[name]
+                    if dependent.state is not None:
+                        continue
+                    if task.state != DONE:
+                        skip(dependent)
+                        continue
+                    waiting[name] -= 1
+                    if not waiting[name]:
+                        submit(dependent)
+        finally:
+            pool.close()
+            pool.join()
+
+    def summary(self):
+        result = {DONE: 0, FAILED: 0, SKIPPED: 0}
+        for task in self.tasks.values():
+            if task.state in result:
+                result[task.state] += 1
+        return result
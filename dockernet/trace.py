@@ -0,0 +1,195 @@
+"""
+Latency instrumentation for external operations.
+
+Every docker API call, exec, REST request, shell command and sleep runs
+inside a span recording its operation, target switch, duration and exit
+status. Spans feed per-operation histograms and can be exported as a
+Chrome trace (chrome://tracing, Perfetto) to see the critical path of a
+command. Tracing is off unless enabled; spans are then a shared no-op.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+
+# histogram buckets per power of two of the duration in microseconds
+BUCKETS_PER_OCTAVE = 4
+# programs exec spans of sh -c scripts are named after
+SCRIPT_PROGRAMS = ('ovs-vsctl', 'ovs-ofctl', 'ovs-appctl', 'ip', 'fping', 'ping')
+
+
+class Histogram(object):
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, duration, failed=False):
+        usec = max(duration * 1e6, 1.0)
+        bucket = int(math.log(usec, 2) * BUCKETS_PER_OCTAVE)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += duration
+        if failed:
+            self.errors += 1
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th duration, in seconds
+        if not self.count:
+            return None
+        rank = int(math.ceil(q * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                upper = 2 ** (float(bucket + 1) / BUCKETS_PER_OCTAVE) / 1e6
+                return min(upper, self.max)
+        return self.max
+
+
+class NullSpan(object):
+    status = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    def __init__(self, tracer, op, target):
+        self.tracer = tracer
+        self.op = op
+        self.target = target
+        self.status = None
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.time() - self.start
+        if exc_type is not None and self.status is None:
+            self.status = getattr(exc, 'status', None) or exc_type.__name__
+        self.tracer.record(self.op, self.target, self.start, duration, self.status)
+        return False
+
+
+class Tracer(object):
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.histograms = {}
+        self.origin = time.time()
+        self._lock = threading.Lock()
+
+    def span(self, op, target=None):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, op, target)
+
+    def record(self, op, target, start, duration, status=None):
+        # status is an exit code, HTTP status or error name, None or 0 is success
+        failed = status not in (None, 0) and not (isinstance(status, int) and 200 <= status < 400)
+        with self._lock:
+            histogram = self.histograms.get(op)
+            if histogram is None:
+                histogram = self.histograms[op] = Histogram()
+            histogram.add(duration, failed)
+            self.spans.append((op, target, start, duration, status, threading.current_thread().ident))
+
+    def summary(self):
+        rows = []
+        with self._lock:
+            for op, histogram in self.histograms.items():
+                rows.append({'op': op,
+                             'count': histogram.count,
+                             'errors': histogram.errors,
+                             'total': histogram.total,
+                             'avg': histogram.total / histogram.count,
+                             'p50': histogram.quantile(0.50),
+                             'p95': histogram.quantile(0.95),
+                             'p99': histogram.quantile(0.99),
+                             'max': histogram.max})
+        return sorted(rows, key=lambda row: -row['total'])
+
+    def write_summary(self, f):
+        f.write('%-28s %8s %7s %10s %9s %9s %9s %9s %9s\n' %
+                ('operation', 'count', 'errors', 'total s', 'avg ms', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+        for row in self.summary():
+            f.write('%-28s %8d %7d %10.3f %9.2f %9.2f %9.2f %9.2f %9.2f\n' %
+                    (row['op'], row['count'], row['errors'], row['total'], row['avg'] * 1e3,
+                     row['p50'] * 1e3, row['p95'] * 1e3, row['p99'] * 1e3, row['max'] * 1e3))
+
+    def write_chrome_trace(self, f):
+        pid = os.getpid()
+        events = []
+        with self._lock:
+            spans = list(self.spans)
+        for op, target, start, duration, status, tid in spans:
+            events.append({'name': op if target is None else '%s %s' % (op, target),
+                           'cat': op.split('.')[0],
+                           'ph': 'X',
+                           'ts': int((start - self.origin) * 1e6),
+                           'dur': int(duration * 1e6),
+                           'pid': pid,
+                           'tid': tid,
+                           'args': {'op': op, 'target': target, 'status': status}})
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        f.write('\n')
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    return _tracer
+
+
+def enable():
+    _tracer.enabled = True
+    _tracer.origin = time.time()
+
+
+def disable():
+    # drop recorded spans, so a long running process starts the next command afresh
+    _tracer.enabled = False
+    with _tracer._lock:
+        _tracer.spans = []
+        _tracer.histograms = {}
+
+
+def span(op, target=None):
+    return _tracer.span(op, target)
+
+
+def sleep(seconds, target=None):
+    with _tracer.span('sleep', target):
+        time.sleep(seconds)
+
+
+def describe_cmd(cmd):
+    # program name of an exec command, for sh -c the first known program of the script
+    if not cmd:
+        return ''
+    if cmd[0] == 'sh' and len(cmd) > 2 and cmd[1] == '-c':
+        for word in cmd[2].split():
+            if word in SCRIPT_PROGRAMS:
+                return word
+        return 'sh'
+    return os.path.basename(cmd[0])